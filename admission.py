@@ -0,0 +1,340 @@
+"""
+Допуск запросов генерации до разбора Markdown.
+
+Дешёвые проверки идут раньше parse_markdown и рендера: размер тела
+(по Content-Length, а без него — по мере чтения), число слайдов
+и факт-карточек на слайд (построчный просмотр текста), лимит частоты
+на клиента (token bucket) и общий предел одновременных рендеров.
+Превышение размеров — 413, частоты и параллелизма — 429 с Retry-After.
+Клиент — адрес соединения, а за доверенным прокси — X-Forwarded-For.
+"""
+
+import ipaddress
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from starlette.exceptions import HTTPException
+from starlette.responses import PlainTextResponse
+
+from content_parser import FACTOID_PATTERN
+
+# Причины отказа → HTTP-статус
+REJECT_STATUS = {
+    "body_size": 413,
+    "slides": 413,
+    "factoids": 413,
+    "rate_limit": 429,
+    "concurrency": 429,
+}
+
+
+class AdmissionRejected(Exception):
+    """Запрос не допущен; reason — ключ REJECT_STATUS."""
+
+    def __init__(self, reason: str, message: str, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.reason = reason
+        self.status_code = REJECT_STATUS[reason]
+        self.retry_after = retry_after
+
+    def response(self) -> PlainTextResponse:
+        headers = {"Retry-After": str(self.retry_after)} if self.retry_after else None
+        return PlainTextResponse(str(self), status_code=self.status_code, headers=headers)
+
+
+class TokenBucket:
+    """Ведро на burst запросов, пополняется со скоростью rate в секунду."""
+
+    def __init__(self, rate: float, burst: int, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """0 — запрос допущен; иначе сколько секунд ждать следующего токена."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class Admission:
+    """
+    Лимиты допуска; 0 в любом лимите — проверка выключена.
+
+    max_body_bytes — размер тела запроса; max_slides — слайдов в деке;
+    max_factoids — факт-карточек на слайд; rate_per_minute и burst —
+    token bucket на клиента; max_concurrent — рендеров одновременно
+    на весь сервис. Держит не больше max_clients вёдер: при переполнении
+    выбрасываются полные (давно неактивные) клиенты.
+    """
+
+    def __init__(
+        self,
+        max_body_bytes: int = 0,
+        max_slides: int = 0,
+        max_factoids: int = 0,
+        rate_per_minute: float = 0,
+        burst: int = 1,
+        max_concurrent: int = 0,
+        max_clients: int = 10000,
+    ):
+        self.max_body_bytes = max(0, max_body_bytes)
+        self.max_slides = max(0, max_slides)
+        self.max_factoids = max(0, max_factoids)
+        self.rate = max(0.0, rate_per_minute) / 60
+        self.burst = max(1, burst)
+        self.max_concurrent = max(0, max_concurrent)
+        self.max_clients = max(1, max_clients)
+
+        self._buckets: dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = {reason: 0 for reason in REJECT_STATUS}
+
+    def reject(self, reason: str, message: str, retry_after: Optional[int] = None) -> AdmissionRejected:
+        with self._lock:
+            self.rejected[reason] += 1
+        return AdmissionRejected(reason, message, retry_after)
+
+    def check_body(self, size: int, limit: Optional[int] = None):
+        limit = self.max_body_bytes if limit is None else limit
+        if limit and size > limit:
+            raise self.reject("body_size", f"Тело запроса больше {limit // 1024} КБ")
+
+    def check_markdown(self, markdown: str):
+        """Слайды и факт-карточки по строкам — без parse_markdown."""
+        slides = 0
+        factoids = 0
+        for line in markdown.splitlines():
+            stripped = line.strip()
+            if not stripped or stripped.startswith("---"):
+                continue
+            if stripped.startswith("# ") or slides == 0:
+                # Текст до первого # тоже становится слайдом
+                slides += 1
+                factoids = 0
+                self.check_slides(slides)
+            if stripped.startswith("**") and FACTOID_PATTERN.match(stripped):
+                factoids += 1
+                self.check_factoids(factoids)
+
+    def check_slides(self, count: int):
+        if self.max_slides and count > self.max_slides:
+            raise self.reject("slides", f"Больше {self.max_slides} слайдов в деке")
+
+    def check_factoids(self, count: int):
+        if self.max_factoids and count > self.max_factoids:
+            raise self.reject("factoids", f"Больше {self.max_factoids} факт-карточек на слайде")
+
+    def check_rate(self, client: str, now: Optional[float] = None):
+        if not self.rate:
+            return
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                if len(self._buckets) >= self.max_clients:
+                    self._prune(now)
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst, now)
+            wait = bucket.take(now)
+        if wait:
+            raise self.reject(
+                "rate_limit", "Слишком много запросов, повторите позже", retry_after=math.ceil(wait)
+            )
+
+    def _prune(self, now: float):
+        for client in [client for client, bucket in self._buckets.items() if bucket.full(now)]:
+            del self._buckets[client]
+        # Все клиенты активны — освобождаем место под нового за счёт самого старого
+        while len(self._buckets) >= self.max_clients:
+            del self._buckets[next(iter(self._buckets))]
+
+    def try_acquire(self) -> bool:
+        """Занимает место среди одновременных рендеров, если оно есть."""
+        with self._lock:
+            if self.max_concurrent and self.in_flight >= self.max_concurrent:
+                return False
+            self.in_flight += 1
+            self.admitted += 1
+        return True
+
+    def acquire(self, retry_after: int = 1):
+        """Как try_acquire, но без места — отказ 429."""
+        if not self.try_acquire():
+            raise self.reject(
+                "concurrency", "Сервер занят другими рендерами, повторите позже", retry_after
+            )
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    @contextmanager
+    def slot(self, retry_after: int = 1):
+        """Место среди одновременных рендеров на время запроса."""
+        self.acquire(retry_after)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "in_flight": self.in_flight,
+            "clients": len(self._buckets),
+        }
+
+
+class TrustedProxies:
+    """
+    Прокси, чьему X-Forwarded-For можно верить. Спецификация — адреса
+    и подсети через запятую; "*" — любой непосредственный сосед (один
+    прокси перед сервисом, как у Railway), клиент — последний адрес цепочки.
+    С явным списком цепочка просматривается справа налево до первого
+    адреса не из списка: левее него адреса подставляет сам клиент.
+    """
+
+    def __init__(self, spec: str = ""):
+        items = [item.strip() for item in spec.split(",") if item.strip()]
+        self.any = "*" in items
+        self.networks = [ipaddress.ip_network(item, strict=False) for item in items if item != "*"]
+
+    def __bool__(self) -> bool:
+        return self.any or bool(self.networks)
+
+    def __contains__(self, address: str) -> bool:
+        if self.any:
+            return True
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        return any(ip in network for network in self.networks)
+
+    def client(self, peer: str, forwarded: Optional[str]) -> str:
+        """Адрес клиента по адресу соединения и заголовку X-Forwarded-For."""
+        if not forwarded or peer not in self:
+            return peer
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        if not hops:
+            return peer
+        if self.any:
+            return hops[-1]
+        for hop in reversed(hops):
+            if hop not in self:
+                return hop
+        return hops[0]
+
+
+class AdmissionMiddleware:
+    """
+    ASGI-обёртка для эндпоинтов генерации: частота, размер тела и место
+    среди одновременных рендеров проверяются до того, как FastAPI читает форму.
+    paths — путь → лимит тела в байтах (None — общий max_body_bytes, 0 — без лимита).
+    own_slots — пути из paths, где места занимает сам обработчик (фоновые
+    задачи, батчи): middleware проверяет только частоту и размер тела.
+    rate_only — служебные POST-эндпоинты без рендера: только лимит частоты.
+    trusted_proxies — TrustedProxies для ключа клиента.
+    """
+
+    def __init__(
+        self,
+        app,
+        admission: Admission,
+        paths: dict,
+        retry_after: int = 1,
+        rate_only=(),
+        own_slots=(),
+        trusted_proxies: Optional[TrustedProxies] = None,
+    ):
+        self.app = app
+        self.admission = admission
+        self.paths = paths
+        self.retry_after = retry_after
+        self.rate_only = frozenset(rate_only)
+        self.own_slots = frozenset(own_slots)
+        self.trusted_proxies = trusted_proxies or TrustedProxies()
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path")
+        if scope["type"] != "http" or scope["method"] != "POST" or (
+            path not in self.paths and path not in self.rate_only
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        client = self._client(scope)
+        if path in self.rate_only:
+            try:
+                self.admission.check_rate(client)
+            except AdmissionRejected as exc:
+                await exc.response()(scope, receive, send)
+                return
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.paths[path]
+        limit = self.admission.max_body_bytes if limit is None else limit
+        try:
+            self.admission.check_rate(client)
+            length = _content_length(scope)
+            if length is not None:
+                self.admission.check_body(length, limit)
+            if length is None and limit:
+                receive = self._limited(receive, limit)
+            if path in self.own_slots:
+                await self.app(scope, receive, send)
+            else:
+                with self.admission.slot(self.retry_after):
+                    await self.app(scope, receive, send)
+        except AdmissionRejected as exc:
+            await exc.response()(scope, receive, send)
+
+    def _client(self, scope) -> str:
+        peer = scope["client"][0] if scope.get("client") else "unknown"
+        if not self.trusted_proxies:
+            return peer
+        forwarded = [
+            value.decode("latin-1") for name, value in scope.get("headers", ()) if name == b"x-forwarded-for"
+        ]
+        return self.trusted_proxies.client(peer, ",".join(forwarded) or None)
+
+    def _limited(self, receive, limit: int):
+        """receive без Content-Length: обрывает чтение тела сверх лимита."""
+        received = 0
+
+        async def wrapped():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exc = self.admission.reject("body_size", f"Тело запроса больше {limit // 1024} КБ")
+                    # FastAPI пропускает HTTPException при чтении формы как есть
+                    raise HTTPException(exc.status_code, str(exc))
+            return message
+
+        return wrapped
+
+
+def _content_length(scope) -> Optional[int]:
+    for name, value in scope.get("headers", ()):
+        if name == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
@@ -3,19 +3,48 @@ RemiDe PDF Generator — веб-приложение.
 Команда вставляет Markdown → получает PDF по дизайн-системе из Figma.
 """
 
+import asyncio
+import base64
+import codecs
+import copy
+import hmac
+import logging
 import os
+import time
 import traceback
-from io import BytesIO
+from contextlib import asynccontextmanager
 from pathlib import Path
-from fastapi import FastAPI, Form, Request
+from typing import Optional
+from fastapi import FastAPI, File, Form, Request, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.background import BackgroundTask
 
-from figma_tokens import fetch_design_tokens
-from content_parser import parse_markdown
-from pdf_generator import generate_pdf
-
-app = FastAPI(title="RemiDe PDF Generator")
+from admission import Admission, AdmissionMiddleware, AdmissionRejected, TrustedProxies
+from batch import ZipStream, manifest_bytes, pdf_name
+from fonts import web_font_css
+from figma_tokens import TokenProvider, close_clients
+from content_parser import MarkdownStream, parse_markdown
+from metrics import Registry, StageTimer
+from jobs import DONE, FAILED, PARSING, QUEUED, RENDERING, Job, JobLimitReached, JobStore
+from pdf_generator import (
+    DEFAULT_TOKENS,
+    SpooledPdf,
+    chunk_count,
+    generate_pdf,
+    generate_pdf_spooled,
+    merge_pdfs_spooled,
+    split_chunks,
+    template_version,
+    warm_up,
+)
+from preview import PreviewLimitExceeded, PreviewSession
+from profiling import profile_render
+from render_pool import RenderPool, RenderQueueFull, RenderWorkerCrashed, available_cpus
+from result_cache import ResultCache, cache_key, stable_hash
+from shared_cache import SharedCache
+from text_fit import fit_slides
 
 
 def _env_int(name: str, default: int) -> int:
@@ -31,9 +60,212 @@ def _env_int(name: str, default: int) -> int:
 FIGMA_TOKEN = os.getenv("FIGMA_TOKEN", "")
 FIGMA_FILE_KEY = os.getenv("FIGMA_FILE_KEY", "evlu7PLuBtbw5unD8NmU9d")
 FIGMA_CACHE_TTL = max(0, _env_int("FIGMA_CACHE_TTL", 0))
+FIGMA_MAX_STALE = max(0, _env_int("FIGMA_MAX_STALE", 86400))
+FIGMA_EXTRACTION = os.getenv("FIGMA_EXTRACTION", "full").strip().lower()
 
-# Статические файлы
 BASE_DIR = Path(__file__).resolve().parent
+FIGMA_SNAPSHOT_PATH = os.getenv("FIGMA_SNAPSHOT_PATH", str(BASE_DIR / "tokens_snapshot.json"))
+# Секрет для POST /tokens/refresh (Authorization: Bearer ...); пусто — без проверки
+TOKENS_REFRESH_SECRET = os.getenv("TOKENS_REFRESH_SECRET", "")
+RENDER_WORKERS = max(1, _env_int("RENDER_WORKERS", available_cpus()))
+RENDER_QUEUE_SIZE = max(0, _env_int("RENDER_QUEUE_SIZE", RENDER_WORKERS * 2))
+RENDER_RETRY_AFTER = max(1, _env_int("RENDER_RETRY_AFTER", 5))
+# document — весь дек одним HTML; per_slide — слайды по отдельности с кешем страниц;
+# chunked — большой дек делится на части, которые раскладываются на разных ядрах
+RENDER_MODE = os.getenv("RENDER_MODE", "document").strip().lower()
+RENDER_CHUNK_SLIDES = max(1, _env_int("RENDER_CHUNK_SLIDES", 20))
+RESULT_CACHE_MEMORY_MB = max(0, _env_int("RESULT_CACHE_MEMORY_MB", 64))
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "")
+RESULT_CACHE_DISK_MB = max(0, _env_int("RESULT_CACHE_DISK_MB", 512))
+# Общий кеш воркеров хоста (SQLite): токены, готовые PDF и single-flight рендера
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "")
+SHARED_CACHE_MB = max(0, _env_int("SHARED_CACHE_MB", 512))
+RENDER_LEASE_SECONDS = max(1, _env_int("RENDER_LEASE_SECONDS", 120))
+JOB_RESULT_TTL = max(1, _env_int("JOB_RESULT_TTL", 600))
+JOBS_MAX = max(1, _env_int("JOBS_MAX", 100))
+BATCH_MAX_DECKS = max(1, _env_int("BATCH_MAX_DECKS", 100))
+PREVIEW_MAX_SESSIONS = max(1, _env_int("PREVIEW_MAX_SESSIONS", 20))
+PREVIEW_SESSION_RENDERS = max(1, _env_int("PREVIEW_SESSION_RENDERS", 2))
+PREVIEW_MAX_MARKDOWN_KB = max(1, _env_int("PREVIEW_MAX_MARKDOWN_KB", 256))
+PREVIEW_MAX_SLIDES = max(1, _env_int("PREVIEW_MAX_SLIDES", 200))
+# Профилирование: только при PROFILING_ENABLED и явном запросе (X-Profile: 1 или ?profile=1)
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "").strip().lower() in ("1", "true", "yes")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "") or None
+# PDF крупнее порога воркер пишет во временный файл, а не отдаёт байтами
+PDF_SPOOL_MEMORY_MB = max(0, _env_int("PDF_SPOOL_MEMORY_MB", 8))
+PDF_SPOOL_DIR = os.getenv("PDF_SPOOL_DIR", "") or None
+# Допуск до разбора: размеры входа, частота на клиента и одновременные рендеры (0 — без лимита)
+ADMISSION_MAX_BODY_KB = max(0, _env_int("ADMISSION_MAX_BODY_KB", 1024))
+ADMISSION_MAX_SLIDES = max(0, _env_int("ADMISSION_MAX_SLIDES", 1000))
+ADMISSION_MAX_FACTOIDS = max(0, _env_int("ADMISSION_MAX_FACTOIDS", 10))
+RATE_LIMIT_PER_MINUTE = max(0, _env_int("RATE_LIMIT_PER_MINUTE", 60))
+RATE_LIMIT_BURST = max(1, _env_int("RATE_LIMIT_BURST", 10))
+MAX_CONCURRENT_RENDERS = max(0, _env_int("MAX_CONCURRENT_RENDERS", RENDER_WORKERS + RENDER_QUEUE_SIZE))
+# Прокси, которым верим X-Forwarded-For для ключа лимита частоты: "*" или адреса/подсети через запятую
+RATE_LIMIT_TRUSTED_PROXIES = os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "")
+
+logger = logging.getLogger(__name__)
+
+# Пул рендера: WeasyPrint работает в отдельных процессах, event loop свободен
+render_pool = RenderPool(RENDER_WORKERS, RENDER_QUEUE_SIZE, initializer=warm_up)
+
+# Общий для всех воркеров uvicorn/gunicorn на хосте; None — у каждого процесса свой кеш
+shared_cache = (
+    SharedCache(SHARED_CACHE_PATH, max_result_bytes=SHARED_CACHE_MB * 1024 * 1024)
+    if SHARED_CACHE_PATH
+    else None
+)
+
+# Токены: устаревшие отдаются сразу, обновление одно и в фоне
+token_provider = TokenProvider(
+    FIGMA_TOKEN,
+    ttl_seconds=FIGMA_CACHE_TTL,
+    max_stale_seconds=FIGMA_MAX_STALE,
+    snapshot_path=FIGMA_SNAPSHOT_PATH or None,
+    extraction=FIGMA_EXTRACTION,
+    shared=shared_cache,
+)
+
+# Кеш готовых PDF: повторный запрос с тем же Markdown не рендерится заново
+result_cache = ResultCache(
+    memory_max_bytes=RESULT_CACHE_MEMORY_MB * 1024 * 1024,
+    disk_dir=RESULT_CACHE_DIR or None,
+    disk_max_bytes=RESULT_CACHE_DISK_MB * 1024 * 1024,
+    shared=shared_cache,
+)
+
+# Фоновые задачи рендера для больших деков
+job_store = JobStore(result_ttl=JOB_RESULT_TTL, max_jobs=JOBS_MAX)
+
+# Отказы до разбора Markdown: 413 за размер, 429 за частоту и параллелизм
+admission = Admission(
+    max_body_bytes=ADMISSION_MAX_BODY_KB * 1024,
+    max_slides=ADMISSION_MAX_SLIDES,
+    max_factoids=ADMISSION_MAX_FACTOIDS,
+    rate_per_minute=RATE_LIMIT_PER_MINUTE,
+    burst=RATE_LIMIT_BURST,
+    max_concurrent=MAX_CONCURRENT_RENDERS,
+)
+
+
+# Метрики Prometheus (/metrics)
+metrics = Registry()
+STAGE_SECONDS = metrics.histogram(
+    "pdfgen_stage_seconds",
+    "Длительность стадий /generate, с",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+    labelnames=("stage",),
+)
+REQUESTS = metrics.counter("pdfgen_requests_total", "Запросы генерации по исходу", ("endpoint", "status"))
+FAILURES = metrics.counter("pdfgen_failures_total", "Ошибки генерации по стадиям", ("stage",))
+ASSET_FETCHES = metrics.counter(
+    "pdfgen_asset_fetches_total", "Обращения рендера к ресурсам по исходу", ("result",)
+)
+DECK_SLIDES = metrics.histogram(
+    "pdfgen_deck_slides", "Слайдов в деке", buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+DECK_PAGES = metrics.histogram(
+    "pdfgen_deck_pages", "Страниц в готовом PDF", buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+PDF_BYTES = metrics.histogram(
+    "pdfgen_pdf_bytes",
+    "Размер готового PDF, байт",
+    buckets=(10e3, 50e3, 100e3, 500e3, 1e6, 5e6, 10e6, 50e6, 100e6),
+)
+
+
+@metrics.collector
+def _state_metrics():
+    """Счётчики кешей и очереди снимаются в момент запроса /metrics."""
+    tokens = token_provider.stats()
+    results = result_cache.stats()
+    admitted = admission.stats()
+    token_lookups = tokens["hits"] + tokens["stale_hits"] + tokens["misses"]
+    result_lookups = results["hits"] + results["misses"]
+    return [
+        ("pdfgen_token_cache_lookups_total", "counter", "Обращения к кешу токенов по исходу", [
+            ({"result": "hit"}, tokens["hits"]),
+            ({"result": "stale"}, tokens["stale_hits"]),
+            ({"result": "miss"}, tokens["misses"]),
+        ]),
+        ("pdfgen_token_cache_hit_ratio", "gauge", "Доля обращений к токенам без ожидания Figma", [
+            ({}, (tokens["hits"] + tokens["stale_hits"]) / token_lookups if token_lookups else 0.0),
+        ]),
+        ("pdfgen_token_refresh_errors_total", "counter", "Неудачные обновления токенов", [
+            ({}, tokens["refresh_errors"]),
+        ]),
+        ("pdfgen_result_cache_lookups_total", "counter", "Обращения к кешу PDF по исходу", [
+            ({"result": "memory_hit"}, results["memory_hits"]),
+            ({"result": "disk_hit"}, results["disk_hits"]),
+            ({"result": "shared_hit"}, results["shared_hits"]),
+            ({"result": "miss"}, results["misses"]),
+        ]),
+        ("pdfgen_result_cache_hit_ratio", "gauge", "Доля попаданий в кеш PDF", [
+            ({}, results["hits"] / result_lookups if result_lookups else 0.0),
+        ]),
+        ("pdfgen_result_cache_bytes", "gauge", "Объём кеша PDF, байт", [
+            ({"tier": "memory"}, results["memory_bytes"]),
+            ({"tier": "disk"}, results["disk_bytes"]),
+            ({"tier": "shared"}, results["shared_bytes"]),
+        ]),
+        ("pdfgen_shared_lease_waits_total", "counter", "Ожидания аренды, занятой другим воркером", [
+            ({}, shared_cache.lease_waits if shared_cache is not None else 0),
+        ]),
+        ("pdfgen_render_pending", "gauge", "Рендеры в работе и в очереди", [({}, render_pool.pending)]),
+        ("pdfgen_render_queued", "gauge", "Рендеры, ожидающие воркера", [({}, render_pool.queued)]),
+        ("pdfgen_render_workers", "gauge", "Воркеров в пуле рендера", [({}, render_pool.workers)]),
+        ("pdfgen_render_pool_restarts_total", "counter", "Пересозданий пула после падения воркера", [
+            ({}, render_pool.restarts),
+        ]),
+        ("pdfgen_jobs", "gauge", "Фоновых задач в памяти", [({}, len(job_store))]),
+        ("pdfgen_preview_sessions", "gauge", "Открытых сессий предпросмотра", [({}, preview_sessions)]),
+        ("pdfgen_admission_total", "counter", "Решения допуска по исходу", [
+            ({"result": "admitted"}, admitted["admitted"]),
+            *(({"result": reason}, count) for reason, count in admitted["rejected"].items()),
+        ]),
+        ("pdfgen_admission_in_flight", "gauge", "Занятые места среди одновременных рендеров", [
+            ({}, admitted["in_flight"]),
+        ]),
+        ("pdfgen_rate_limit_clients", "gauge", "Клиентов с активным лимитом частоты", [
+            ({}, admitted["clients"]),
+        ]),
+    ]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    render_pool.start()
+    if FIGMA_TOKEN:
+        # Снапшот с диска — корректные токены без похода в сеть; свежие подтянутся в фоне
+        token_provider.load_snapshot(FIGMA_FILE_KEY)
+        token_provider.refresh_in_background(FIGMA_FILE_KEY)
+    cleanup_task = asyncio.create_task(job_store.cleanup_loop())
+    yield
+    cleanup_task.cancel()
+    render_pool.shutdown()
+    await close_clients()
+
+
+app = FastAPI(title="RemiDe PDF Generator", lifespan=lifespan)
+app.add_middleware(
+    AdmissionMiddleware,
+    admission=admission,
+    # /batch — до BATCH_MAX_DECKS файлов; /generate/stream читает тело сам и проверяет слайды
+    paths={
+        "/generate": None,
+        "/jobs": None,
+        "/batch": ADMISSION_MAX_BODY_KB * 1024 * BATCH_MAX_DECKS,
+        "/generate/stream": 0,
+    },
+    retry_after=RENDER_RETRY_AFTER,
+    # Фоновая задача и каждый дек батча занимают место на время своего рендера
+    own_slots=("/jobs", "/batch"),
+    # Обновление токенов идёт в Figma — тот же лимит частоты на клиента
+    rate_only=("/tokens/refresh",),
+    trusted_proxies=TrustedProxies(RATE_LIMIT_TRUSTED_PROXIES),
+)
+
+# Статические файлы
 STATIC_DIR = BASE_DIR / "static"
 STATIC_DIR.mkdir(parents=True, exist_ok=True)
 app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
@@ -46,12 +278,12 @@ FRONTEND_HTML = """<!DOCTYPE html>
 <meta name="viewport" content="width=device-width, initial-scale=1.0">
 <title>RemiDe PDF Generator</title>
 <style>
-  @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
+  /* fonts */
 
   * { margin: 0; padding: 0; box-sizing: border-box; }
 
   body {
-    font-family: 'Inter', sans-serif;
+    font-family: 'Inter', system-ui, sans-serif;
     background: #0f0f0f;
     color: #f5f5f5;
     min-height: 100vh;
@@ -129,6 +361,11 @@ FRONTEND_HTML = """<!DOCTYPE html>
     color: rgba(255,255,255,0.35);
   }
 
+  .status {
+    margin-top: 12px;
+    min-height: 18px;
+  }
+
   .example {
     margin-top: 32px;
     padding: 20px;
@@ -163,6 +400,29 @@ FRONTEND_HTML = """<!DOCTYPE html>
   }
 
   @keyframes spin { to { transform: rotate(360deg); } }
+
+  .preview-toggle {
+    display: flex;
+    align-items: center;
+    gap: 8px;
+    margin-top: 12px;
+    cursor: pointer;
+  }
+
+  .preview {
+    display: grid;
+    grid-template-columns: repeat(auto-fill, minmax(240px, 1fr));
+    gap: 12px;
+    margin-top: 16px;
+  }
+
+  .preview iframe {
+    width: 100%;
+    aspect-ratio: 16 / 9;
+    border: 1px solid #222;
+    border-radius: 8px;
+    background: #141414;
+  }
 </style>
 </head>
 <body>
@@ -184,8 +444,14 @@ FRONTEND_HTML = """<!DOCTYPE html>
           Сгенерировать PDF
         </button>
       </div>
+      <p class="hint status" id="status"></p>
+      <label class="hint preview-toggle">
+        <input type="checkbox" id="live"> Живой предпросмотр
+      </label>
     </form>
 
+    <div class="preview" id="preview"></div>
+
     <div class="example">
       <h3>ПРИМЕР MARKDOWN:</h3>
       <pre># Africa's {accent}$120 Billion{/accent} Dollar Crisis
@@ -217,12 +483,47 @@ Sub-Saharan Africa's growth.
         return;
       }
 
-      fetch('/generate', { method: 'POST', body: formData })
+      const statusEl = document.getElementById('status');
+      const setStatus = (text) => { statusEl.textContent = text; };
+      const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+      async function readError(r, fallback) {
+        const errorText = await r.text();
+        return new Error(errorText || fallback);
+      }
+
+      // Задача рендерится в фоне, страница опрашивает её статус
+      async function waitForJob(job) {
+        while (true) {
+          const r = await fetch(job.status_url);
+          if (!r.ok) throw await readError(r, 'Задача потеряна');
+          const state = await r.json();
+
+          if (state.status === 'done') return state;
+          if (state.status === 'failed') throw new Error(state.error || 'Не удалось сгенерировать PDF');
+
+          if (state.status === 'queued') setStatus('В очереди…');
+          else if (state.status === 'parsing') setStatus('Разбираем Markdown…');
+          else if (state.pages) setStatus(`Слайдов: ${state.slides} · страниц ${state.pages} из ${Math.max(state.pages, state.pages_total)}…`);
+          else setStatus(`Слайдов: ${state.slides} · рендерим PDF…`);
+          await sleep(700);
+        }
+      }
+
+      fetch('/jobs', { method: 'POST', body: formData })
         .then(async (r) => {
+          if (!r.ok) throw await readError(r, 'Не удалось поставить задачу');
+          return r.json();
+        })
+        .then(async (job) => {
+          setStatus('В очереди…');
+          const state = await waitForJob(job);
+          setStatus(`Готово: ${state.pages} стр.`);
+
+          const r = await fetch(job.result_url);
           const contentType = r.headers.get('content-type') || '';
           if (!r.ok || !contentType.includes('application/pdf')) {
-            const errorText = await r.text();
-            throw new Error(errorText || 'Не удалось сгенерировать PDF');
+            throw await readError(r, 'Не удалось сгенерировать PDF');
           }
           return r.blob();
         })
@@ -234,15 +535,98 @@ Sub-Saharan Africa's growth.
           a.click();
           URL.revokeObjectURL(url);
         })
-        .catch(err => alert('Ошибка: ' + err.message))
+        .catch(err => {
+          setStatus('');
+          alert('Ошибка: ' + err.message);
+        })
         .finally(() => {
           btn.disabled = false;
           spinner.style.display = 'none';
         });
     });
   </script>
+
+  <script>
+    // Живой предпросмотр: сервер присылает PDF только изменённых слайдов
+    (function() {
+      const textarea = document.querySelector('textarea[name="markdown"]');
+      const toggle = document.getElementById('live');
+      const previewEl = document.getElementById('preview');
+      const statusEl = document.getElementById('status');
+      const urls = new Map();  // ключ слайда → blob URL его PDF
+      let socket = null;
+      let seq = 0;
+      let timer = null;
+
+      function send() {
+        if (socket && socket.readyState === WebSocket.OPEN) {
+          socket.send(JSON.stringify({ seq: ++seq, markdown: textarea.value }));
+        }
+      }
+
+      function showSlide(frame, key) {
+        frame.dataset.key = key;
+        if (urls.has(key)) frame.src = urls.get(key) + '#toolbar=0&view=Fit';
+        else frame.removeAttribute('src');
+      }
+
+      function layout(keys) {
+        for (const [key, url] of urls) {
+          if (!keys.includes(key)) { URL.revokeObjectURL(url); urls.delete(key); }
+        }
+        // Рамки переиспользуются: перезагружаются только сменившиеся слайды
+        keys.forEach((key, index) => {
+          let frame = previewEl.children[index];
+          if (!frame) frame = previewEl.appendChild(document.createElement('iframe'));
+          if (frame.dataset.key !== key) showSlide(frame, key);
+        });
+        while (previewEl.children.length > keys.length) previewEl.lastChild.remove();
+      }
+
+      function onMessage(event) {
+        const message = JSON.parse(event.data);
+        if (message.type === 'deck' && message.seq === seq) {
+          layout(message.keys);
+        } else if (message.type === 'slide') {
+          const bytes = Uint8Array.from(atob(message.pdf), c => c.charCodeAt(0));
+          if (urls.has(message.key)) URL.revokeObjectURL(urls.get(message.key));
+          urls.set(message.key, URL.createObjectURL(new Blob([bytes], { type: 'application/pdf' })));
+          previewEl.querySelectorAll('iframe').forEach(frame => {
+            if (frame.dataset.key === message.key) showSlide(frame, message.key);
+          });
+        } else if (message.type === 'done' && message.seq === seq) {
+          statusEl.textContent = `Предпросмотр: обновлено ${message.rendered}, без изменений ${message.reused} · ${message.ms} мс`;
+        } else if (message.type === 'error') {
+          statusEl.textContent = 'Предпросмотр: ' + message.message;
+        }
+      }
+
+      toggle.addEventListener('change', () => {
+        if (!toggle.checked) {
+          if (socket) socket.close();
+          return;
+        }
+        const protocol = location.protocol === 'https:' ? 'wss:' : 'ws:';
+        socket = new WebSocket(`${protocol}//${location.host}/preview`);
+        socket.onopen = send;
+        socket.onmessage = onMessage;
+        socket.onclose = (event) => {
+          socket = null;
+          toggle.checked = false;
+          if (event.code === 1013) statusEl.textContent = 'Предпросмотр: сервер занят, попробуйте позже';
+        };
+      });
+
+      textarea.addEventListener('input', () => {
+        clearTimeout(timer);
+        timer = setTimeout(send, 250);
+      });
+    })();
+  </script>
 </body>
 </html>"""
+# Inter из static/fonts вместо Google Fonts: без внешних запросов
+FRONTEND_HTML = FRONTEND_HTML.replace("/* fonts */", web_font_css())
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -251,80 +635,835 @@ async def index():
 
 
 @app.post("/generate")
-async def generate(markdown: str = Form(...)):
+async def generate(request: Request, markdown: str = Form(...)):
     """Генерирует PDF из Markdown."""
+    try:
+        admission.check_markdown(markdown)
+    except AdmissionRejected as exc:
+        REQUESTS.inc(endpoint="generate", status="rejected")
+        return exc.response()
+
+    # Без PROFILING_ENABLED флаг игнорируется: запрос получает обычный PDF
+    if PROFILING_ENABLED and _profile_requested(request):
+        return await _profile(markdown)
+
+    timer = StageTimer()
+    with timer.stage("total"):
+        response, status = await _generate(markdown, timer)
+
+    for stage, seconds in timer.stages.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+    REQUESTS.inc(endpoint="generate", status=status)
+    response.headers["Server-Timing"] = timer.header()
+    return response
+
+
+async def _generate(markdown: str, timer: StageTimer):
+    """Тело /generate: (ответ, статус для метрик), стадии пишутся в timer."""
     markdown = markdown.strip()
     if not markdown:
-        return PlainTextResponse("Вставьте Markdown перед генерацией", status_code=400)
+        return PlainTextResponse("Вставьте Markdown перед генерацией", status_code=400), "bad_request"
 
     # 1. Читаем токены из Figma
-    try:
-        if FIGMA_TOKEN:
-            tokens = fetch_design_tokens(
-                FIGMA_FILE_KEY,
-                FIGMA_TOKEN,
-                cache_ttl_seconds=FIGMA_CACHE_TTL,
-            )
-        else:
-            # Фолбэк: дефолтные токены
-            tokens = _default_tokens()
-    except Exception:
-        # Если Figma недоступна или токен невалидный, используем дефолтные токены
-        tokens = _default_tokens()
+    with timer.stage("tokens"):
+        tokens = await _resolve_tokens()
 
     # 2. Парсим Markdown
-    slides = parse_markdown(markdown)
+    try:
+        with timer.stage("parse"):
+            slides = parse_markdown(markdown)
+    except Exception as exc:
+        return _stage_error("parse", exc), "error"
 
+    if not slides:
+        return PlainTextResponse("Нет слайдов для генерации", status_code=400), "bad_request"
+    DECK_SLIDES.observe(len(slides))
+
+    # 3. Ищем готовый PDF в кеше
+    key = cache_key(slides, tokens, template_version())
+    if result_cache.enabled:
+        with timer.stage("cache"):
+            cached = await run_in_threadpool(result_cache.get, key)
+        if cached is not None:
+            PDF_BYTES.observe(len(cached))
+            return _pdf_response(cached, cache_status="HIT"), "hit"
+
+    # Тот же дек уже рендерит другой воркер — ждём его результат, а не рендерим повторно
+    async with _render_lease(key) as cached:
+        if cached is not None:
+            PDF_BYTES.observe(len(cached))
+            return _pdf_response(cached, cache_status="HIT"), "hit"
+        return await _render_and_store(slides, tokens, key, timer)
+
+
+async def _render_and_store(slides, tokens: dict, key: str, timer: StageTimer):
+    """Рендер на промахе кеша и запись результата в кеш."""
+    # 4. Генерируем PDF в пуле процессов; большой PDF приходит файлом
+    try:
+        with timer.stage("render"):
+            result = await _render_pdf(slides, tokens)
+    except RenderQueueFull:
+        return _busy_response(), "rejected"
+    except RenderWorkerCrashed:
+        return _crashed_response("render"), "error"
+    except Exception as exc:
+        return _stage_error("render", exc), "error"
+
+    # Стадии внутри воркера; остаток круга через пул — ожидание и передача
+    for stage, seconds in result.timings.items():
+        timer.add(stage, seconds)
+    timer.add("queue", max(0.0, timer.stages["render"] - sum(result.timings.values())))
+    for outcome, count in result.assets.items():
+        if count:
+            ASSET_FETCHES.inc(count, result=outcome)
+
+    if not result.size or not result.head.startswith(b"%PDF"):
+        _discard_spool(result.path)
+        FAILURES.inc(stage="validate")
+        return PlainTextResponse("Сгенерирован некорректный PDF", status_code=500), "error"
+    DECK_PAGES.observe(result.pages)
+    PDF_BYTES.observe(result.size)
+
+    if result_cache.enabled:
+        with timer.stage("cache_put"):
+            if result.path is None:
+                await run_in_threadpool(result_cache.put, key, result.data)
+            else:
+                await run_in_threadpool(result_cache.put_file, key, result.path)
+
+    # 5. Отдаём файл
+    return _spooled_response(result, cache_status="MISS"), "ok"
+
+
+@asynccontextmanager
+async def _render_lease(key: str):
+    """
+    Single-flight рендера между воркерами через аренду в общем кеше.
+    Отдаёт None — рендерить самим (аренда наша или общий кеш не хранит PDF),
+    либо байты PDF, который за время ожидания отрендерил другой воркер.
+    """
+    # Без PDF в общем кеше ждать чужой рендер бесполезно: результат до нас не дойдёт
+    if shared_cache is None or not shared_cache.stores_results:
+        yield None
+        return
+
+    name = f"render:{key}"
+    deadline = time.monotonic() + RENDER_LEASE_SECONDS
+    owner = None
+    cached = None
+    retry = False
+    while True:
+        owner = await run_in_threadpool(shared_cache.acquire, name, RENDER_LEASE_SECONDS, retry)
+        retry = True
+        # Результат мог появиться между промахом и арендой
+        if await run_in_threadpool(result_cache.contains, key):
+            cached = await run_in_threadpool(result_cache.get, key)
+        if owner is not None or cached is not None or time.monotonic() >= deadline:
+            break
+        await asyncio.sleep(0.1)
+
+    try:
+        yield cached
+    finally:
+        if owner is not None:
+            await run_in_threadpool(shared_cache.release, name, owner)
+
+
+def _profile_requested(request: Request) -> bool:
+    flag = request.headers.get("x-profile") or request.query_params.get("profile") or ""
+    return flag.strip().lower() in ("1", "true", "yes")
+
+
+async def _profile(markdown: str):
+    """Профиль рендера вместо PDF: JSON с фазами WeasyPrint и слайдами."""
+    markdown = markdown.strip()
+    slides = parse_markdown(markdown) if markdown else []
     if not slides:
         return PlainTextResponse("Нет слайдов для генерации", status_code=400)
 
-    # 3. Генерируем PDF
+    tokens = await _resolve_tokens()
     try:
-        pdf_bytes = generate_pdf(slides, tokens)
+        return await render_pool.run(profile_render, slides, tokens, PROFILE_DIR)
+    except RenderQueueFull:
+        return _busy_response()
+    except RenderWorkerCrashed:
+        return _crashed_response("profile")
+    except Exception as exc:
+        return _stage_error("profile", exc)
+
+
+def _busy_response() -> PlainTextResponse:
+    return PlainTextResponse(
+        "Сервер перегружен, повторите попытку позже",
+        status_code=503,
+        headers={"Retry-After": str(RENDER_RETRY_AFTER)},
+    )
+
+
+def _crashed_response(stage: str) -> PlainTextResponse:
+    """Воркер упал (пул уже пересоздан): запрос можно повторить."""
+    FAILURES.inc(stage=stage)
+    logger.error("Воркер рендера упал на стадии %s, пул пересоздан", stage)
+    return PlainTextResponse(
+        "Воркер рендера перезапущен, повторите попытку",
+        status_code=503,
+        headers={"Retry-After": str(RENDER_RETRY_AFTER)},
+    )
+
+
+def _stage_error(stage: str, exc: Exception) -> PlainTextResponse:
+    """Ошибка стадии: в лог с именем стадии, в метрики и клиенту."""
+    FAILURES.inc(stage=stage)
+    logger.exception("Ошибка генерации PDF на стадии %s", stage)
+    return PlainTextResponse(
+        f"Ошибка генерации PDF ({stage}): {type(exc).__name__}: {exc}",
+        status_code=500,
+    )
+
+
+@app.post("/generate/stream")
+async def generate_stream(request: Request):
+    """
+    Потоковая генерация очень больших деков. Тело запроса — сырой Markdown
+    в UTF-8, читается кусками; готовые слайды уходят на рендер пачками
+    по RENDER_CHUNK_SLIDES, пока остальной текст ещё загружается.
+    Части пишутся во временные файлы и склеиваются в один PDF.
+    Кеш результатов не используется: ключ известен только в конце тела.
+    """
+    tokens = await _resolve_tokens()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    parser = MarkdownStream()
+    # Воркеров занято не больше, чем их есть: разбор ждёт, а не копит слайды
+    semaphore = asyncio.Semaphore(render_pool.workers)
+    parts: list[Optional[SpooledPdf]] = []
+    tasks: list[asyncio.Task] = []
+    batch = []
+    slide_count = 0
+    streamed_path = None
+
+    async def render_batch(index: int, slides):
+        try:
+            # Отменённая пачка, которую воркер уже рендерит, удалит свой файл сама
+            parts[index] = await render_pool.run(
+                generate_pdf_spooled, slides, tokens, 0, PDF_SPOOL_DIR, False,
+                on_orphan=_discard_result,
+            )
+        finally:
+            semaphore.release()
+
+    def raise_failed():
+        """Пачка упала (очередь полна, ошибка рендера) — остаток тела не читаем."""
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+
+    async def submit(slides):
+        await semaphore.acquire()
+        try:
+            raise_failed()
+        except BaseException:
+            semaphore.release()
+            raise
+        parts.append(None)
+        # Лимит очереди проверяется на каждой пачке: перегрузка видна сразу, а не в gather
+        tasks.append(asyncio.create_task(render_batch(len(parts) - 1, slides)))
+
+    async def feed(slides):
+        nonlocal batch, slide_count
+        for slide in slides:
+            slide_count += 1
+            admission.check_slides(slide_count)
+            admission.check_factoids(len(slide.factoids))
+            batch.append(slide)
+            if len(batch) >= RENDER_CHUNK_SLIDES:
+                await submit(batch)
+                batch = []
+
+    try:
+        async for chunk in request.stream():
+            raise_failed()
+            await feed(parser.feed(decoder.decode(chunk)))
+        await feed(parser.feed(decoder.decode(b"", final=True)))
+        await feed(parser.close())
+        if batch:
+            await submit(batch)
+        if not tasks:
+            return PlainTextResponse("Нет слайдов для генерации", status_code=400)
+
+        await asyncio.gather(*tasks)
+        if len(parts) == 1:
+            result = parts[0]
+        else:
+            result = await render_pool.run(
+                merge_pdfs_spooled,
+                [part.path for part in parts],
+                PDF_SPOOL_MEMORY_MB * 1024 * 1024,
+                PDF_SPOOL_DIR,
+                check_limit=False,
+                on_orphan=_discard_result,
+            )
+        if not result.size or not result.head.startswith(b"%PDF"):
+            _discard_spool(result.path)
+            return PlainTextResponse("Сгенерирован некорректный PDF", status_code=500)
+        streamed_path = result.path
+        return _spooled_response(result, cache_status="MISS")
+    except UnicodeDecodeError:
+        return PlainTextResponse("Тело запроса должно быть в UTF-8", status_code=400)
+    except AdmissionRejected as exc:
+        return exc.response()
+    except RenderQueueFull:
+        return _busy_response()
+    except RenderWorkerCrashed:
+        return _crashed_response("stream")
     except Exception as exc:
         traceback.print_exc()
         return PlainTextResponse(
             f"Ошибка генерации PDF: {type(exc).__name__}: {exc}",
             status_code=500,
         )
+    finally:
+        for task in tasks:
+            if task.done() and not task.cancelled():
+                # Ошибки остальных пачек уже не важны — помечаем их прочитанными
+                task.exception()
+            task.cancel()
+        # Файлы частей не нужны после склейки (или ошибки)
+        for part in parts:
+            if part is not None and part.path != streamed_path:
+                _discard_spool(part.path)
+
+
+async def _resolve_tokens() -> dict:
+    """Токены из Figma с фолбэками."""
+    try:
+        if FIGMA_TOKEN:
+            return await token_provider.get(FIGMA_FILE_KEY)
+        # Фолбэк: дефолтные токены
+        return _default_tokens()
+    except Exception:
+        # Если Figma недоступна или токен невалидный — последние рабочие токены,
+        # а если их нет — дефолтные
+        return token_provider.last_known(FIGMA_FILE_KEY) or _default_tokens()
+
+
+def _pdf_headers(size: int, cache_status: str) -> dict:
+    return {
+        "Content-Disposition": "attachment; filename=presentation.pdf",
+        "Content-Length": str(size),
+        "X-Cache": cache_status,
+    }
+
+
+def _pdf_response(pdf_bytes: bytes, cache_status: str) -> StreamingResponse:
+    return StreamingResponse(
+        _iter_chunks(pdf_bytes),
+        media_type="application/pdf",
+        headers=_pdf_headers(len(pdf_bytes), cache_status),
+    )
+
+
+def _spooled_response(result: SpooledPdf, cache_status: str) -> StreamingResponse:
+    """PDF из воркера: байты как есть, файл — кусками с диска с удалением после отправки."""
+    if result.path is None:
+        return _pdf_response(result.data, cache_status)
+    return StreamingResponse(
+        _iter_file(result.path),
+        media_type="application/pdf",
+        headers=_pdf_headers(result.size, cache_status),
+        # Фоновая задача выполняется и при обрыве соединения
+        background=BackgroundTask(_discard_spool, result.path),
+    )
+
+
+def _iter_chunks(data: bytes, chunk_size: int = 64 * 1024):
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size]
+
+
+def _iter_file(path: str, chunk_size: int = 64 * 1024):
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+def _discard_spool(path):
+    if path is not None:
+        Path(path).unlink(missing_ok=True)
+
+
+def _discard_result(result: SpooledPdf):
+    """PDF, который уже некому отдать (ожидание отменено): удаляем его файл."""
+    _discard_spool(result.path)
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(markdown: str = Form(...)):
+    """Ставит рендер в фон и сразу возвращает id задачи."""
+    markdown = markdown.strip()
+    if not markdown:
+        return PlainTextResponse("Вставьте Markdown перед генерацией", status_code=400)
+    try:
+        admission.check_markdown(markdown)
+    except AdmissionRejected as exc:
+        return exc.response()
+
+    try:
+        job = job_store.create()
+    except JobLimitReached:
+        return PlainTextResponse(
+            "Слишком много задач, повторите попытку позже",
+            status_code=503,
+            headers={"Retry-After": str(RENDER_RETRY_AFTER)},
+        )
+
+    job.task = asyncio.create_task(_run_job(job, markdown))
+    return {**job.to_dict(), "status_url": f"/jobs/{job.id}", "result_url": f"/jobs/{job.id}/result"}
+
+
+async def _render_pdf(slides, tokens, on_pages=None) -> SpooledPdf:
+    """
+    Рендер в пуле согласно RENDER_MODE. Бросает RenderQueueFull.
+    on_pages(n) — прогресс: в режиме chunked вызывается по готовности каждой части.
+    """
+    max_memory = PDF_SPOOL_MEMORY_MB * 1024 * 1024
+
+    if RENDER_MODE == "chunked":
+        parts = chunk_count(
+            len(slides),
+            RENDER_CHUNK_SLIDES,
+            min(render_pool.workers, render_pool.free_slots),
+        )
+        if parts > 1:
+            # Части идут файлами, как в /generate/stream: ни воркер, ни родитель
+            # не держат в памяти PDF части, а склейка читает их с диска
+            rendered = await _render_parts(split_chunks(slides, parts), tokens, on_pages)
+            try:
+                return await render_pool.run(
+                    merge_pdfs_spooled,
+                    [part.path for part in rendered],
+                    max_memory,
+                    PDF_SPOOL_DIR,
+                    check_limit=False,
+                    on_orphan=_discard_result,
+                )
+            finally:
+                for part in rendered:
+                    _discard_spool(part.path)
+
+    return await render_pool.run(
+        generate_pdf_spooled,
+        slides,
+        tokens,
+        max_memory,
+        PDF_SPOOL_DIR,
+        RENDER_MODE == "per_slide",
+        on_orphan=_discard_result,
+    )
+
+
+async def _render_parts(chunks, tokens, on_pages=None) -> list[SpooledPdf]:
+    """
+    Части дека параллельно в пуле, каждая — во временный файл.
+    Упала одна часть — остальные отменяются, а их файлы удаляются.
+    """
+    async def render(chunk) -> SpooledPdf:
+        part = await render_pool.run(
+            generate_pdf_spooled, chunk, tokens, 0, PDF_SPOOL_DIR, False,
+            on_orphan=_discard_result,
+        )
+        if on_pages is not None:
+            on_pages(part.pages)
+        return part
+
+    tasks = [asyncio.create_task(render(chunk)) for chunk in chunks]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for task in tasks:
+            if not task.cancelled() and task.exception() is None:
+                _discard_result(task.result())
+        raise
+    return [task.result() for task in tasks]
+
+
+async def _render_when_free(slides, tokens, on_wait=None, on_pages=None) -> tuple[bytes, int]:
+    """
+    Рендер в пуле для фоновых задач и батчей: при полной очереди
+    ждём RENDER_RETRY_AFTER и пробуем снова вместо отказа.
+    Результат целиком в памяти — задачи и так хранят PDF байтами.
+    """
+    while True:
+        try:
+            result = await _render_pdf(slides, tokens, on_pages)
+            break
+        except RenderQueueFull:
+            if on_wait is not None:
+                on_wait()
+            await asyncio.sleep(RENDER_RETRY_AFTER)
+
+    if result.path is None:
+        return result.data, result.pages
+    try:
+        return await run_in_threadpool(Path(result.path).read_bytes), result.pages
+    finally:
+        _discard_spool(result.path)
+
+
+@asynccontextmanager
+async def _render_slot(on_wait=None):
+    """
+    Место среди MAX_CONCURRENT_RENDERS на время рендера фоновой задачи
+    или дека батча: без свободного места ждём RENDER_RETRY_AFTER, а не отказываем.
+    """
+    while not admission.try_acquire():
+        if on_wait is not None:
+            on_wait()
+        await asyncio.sleep(RENDER_RETRY_AFTER)
+    try:
+        yield
+    finally:
+        admission.release()
+
+
+def _page_count(slides, tokens: dict) -> int:
+    """Страниц в PDF без рендера: длинные слайды делятся на продолжения."""
+    return len(fit_slides(slides, tokens.get("typography")))
+
+
+async def _run_job(job: Job, markdown: str):
+    try:
+        # 1. Токены и разбор Markdown
+        job.update(status=PARSING)
+        tokens = await _resolve_tokens()
+        slides = parse_markdown(markdown)
+        job.update(slides=len(slides))
+        if not slides:
+            job.update(status=FAILED, error="Нет слайдов для генерации")
+            return
+
+        # 2. Кеш готовых PDF
+        key = cache_key(slides, tokens, template_version())
+        if result_cache.enabled:
+            cached = await run_in_threadpool(result_cache.get, key)
+            if cached is not None:
+                # Слайд фиксированной высоты — страница на слайд и его продолжения
+                pages = _page_count(slides, tokens)
+                job.update(status=DONE, pages=pages, pages_total=pages, result=cached)
+                return
+
+        # 3. Рендер в пуле; место среди MAX_CONCURRENT_RENDERS задача держит до конца
+        # рендера, а без места или при полной очереди ждёт, а не падает.
+        # pages_total — оценка по text_fit; pages растёт по готовым частям (RENDER_MODE=chunked)
+        job.update(status=RENDERING, pages_total=_page_count(slides, tokens))
+        on_wait = lambda: job.update(status=QUEUED, pages=0)
+        async with _render_lease(key) as cached:
+            if cached is not None:
+                job.update(status=DONE, pages=job.pages_total, result=cached)
+                return
+            async with _render_slot(on_wait):
+                job.update(status=RENDERING)
+                pdf_bytes, pages = await _render_when_free(
+                    slides,
+                    tokens,
+                    on_wait=on_wait,
+                    on_pages=lambda count: job.update(status=RENDERING, pages=job.pages + count),
+                )
+                job.update(status=RENDERING)
 
-    if not pdf_bytes or not pdf_bytes.startswith(b"%PDF"):
-        return PlainTextResponse("Сгенерирован некорректный PDF", status_code=500)
+                if not pdf_bytes or not pdf_bytes.startswith(b"%PDF"):
+                    job.update(status=FAILED, error="Сгенерирован некорректный PDF")
+                    return
+
+                if result_cache.enabled:
+                    await run_in_threadpool(result_cache.put, key, pdf_bytes)
+        job.update(status=DONE, pages=pages, pages_total=pages, result=pdf_bytes)
+    except Exception as exc:
+        traceback.print_exc()
+        job.update(status=FAILED, error=f"{type(exc).__name__}: {exc}")
+    finally:
+        REQUESTS.inc(endpoint="jobs", status=job.status)
+        if job.status == DONE:
+            DECK_SLIDES.observe(job.slides)
+            DECK_PAGES.observe(job.pages)
+            PDF_BYTES.observe(len(job.result))
+
+
+@app.post("/batch")
+async def batch_generate(files: list[UploadFile] = File(...)):
+    """
+    Пакетная генерация: много Markdown-файлов → ZIP с PDF.
+    Токены читаются один раз, деки рендерятся параллельно на воркерах пула,
+    архив уходит клиенту по мере готовности. Ошибки отдельных деков
+    попадают в manifest.json и не срывают весь пакет.
+    """
+    if len(files) > BATCH_MAX_DECKS:
+        return PlainTextResponse(
+            f"Слишком много файлов: {len(files)}, максимум {BATCH_MAX_DECKS}",
+            status_code=413,
+        )
+
+    decks = []
+    for index, upload in enumerate(files):
+        raw = await upload.read()
+        try:
+            markdown = raw.decode("utf-8-sig").strip()
+        except UnicodeDecodeError:
+            markdown = None
+        decks.append((index, upload.filename or "", markdown))
+
+    tokens = await _resolve_tokens()
+    semaphore = asyncio.Semaphore(render_pool.workers)
+
+    async def render_deck(index: int, filename: str, markdown) -> tuple[dict, bytes]:
+        entry = {"index": index, "source": filename, "status": "ok", "file": "",
+                 "slides": 0, "pages": 0, "size": 0, "error": ""}
+        try:
+            if markdown is None:
+                raise ValueError("файл не в кодировке UTF-8")
+            admission.check_body(len(markdown.encode("utf-8")))
+            admission.check_markdown(markdown)
+            slides = parse_markdown(markdown)
+            entry["slides"] = len(slides)
+            if not slides:
+                raise ValueError("Нет слайдов для генерации")
+
+            key = cache_key(slides, tokens, template_version())
+            pdf_bytes = None
+            if result_cache.enabled:
+                pdf_bytes = await run_in_threadpool(result_cache.get, key)
+            if pdf_bytes is not None:
+                pages = _page_count(slides, tokens)
+            else:
+                async with _render_lease(key) as pdf_bytes:
+                    if pdf_bytes is not None:
+                        pages = _page_count(slides, tokens)
+                    else:
+                        async with semaphore, _render_slot():
+                            pdf_bytes, pages = await _render_when_free(slides, tokens)
+                        if not pdf_bytes or not pdf_bytes.startswith(b"%PDF"):
+                            raise ValueError("Сгенерирован некорректный PDF")
+                        if result_cache.enabled:
+                            await run_in_threadpool(result_cache.put, key, pdf_bytes)
+
+            entry.update(pages=pages, size=len(pdf_bytes))
+            return entry, pdf_bytes
+        except Exception as exc:
+            entry.update(status="error", error=f"{type(exc).__name__}: {exc}")
+            return entry, b""
+
+    async def stream():
+        archive = ZipStream()
+        used_names: set[str] = set()
+        entries = []
+        tasks = [asyncio.create_task(render_deck(*deck)) for deck in decks]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                entry, pdf_bytes = await next_done
+                if entry["status"] == "ok":
+                    entry["file"] = pdf_name(entry["source"], entry["index"], used_names)
+                    yield archive.add(entry["file"], pdf_bytes)
+                entries.append(entry)
+
+            entries.sort(key=lambda entry: entry["index"])
+            yield archive.add("manifest.json", manifest_bytes(entries))
+            yield archive.close()
+        finally:
+            # Клиент отключился — не рендерим оставшееся впустую
+            for task in tasks:
+                task.cancel()
 
-    # 4. Отдаём файл
     return StreamingResponse(
-        BytesIO(pdf_bytes),
+        stream(),
+        media_type="application/zip",
+        headers={"Content-Disposition": "attachment; filename=decks.zip"},
+    )
+
+
+preview_sessions = 0
+
+
+@app.websocket("/preview")
+async def preview(websocket: WebSocket):
+    """
+    Живой предпросмотр. Клиент шлёт {"seq", "markdown"} на каждую правку,
+    сервер отвечает списком ключей слайдов ("deck") и PDF только тех слайдов,
+    которых у клиента ещё нет ("slide"), затем "done".
+    """
+    global preview_sessions
+    if preview_sessions >= PREVIEW_MAX_SESSIONS:
+        # 1013 — Try Again Later
+        await websocket.close(code=1013)
+        return
+
+    await websocket.accept()
+    preview_sessions += 1
+    session = PreviewSession(PREVIEW_MAX_MARKDOWN_KB * 1024, PREVIEW_MAX_SLIDES)
+    renderer = asyncio.create_task(_preview_loop(websocket, session))
+    try:
+        while True:
+            message = await websocket.receive_json()
+            try:
+                session.submit(int(message.get("seq", 0)), str(message.get("markdown", "")))
+            except PreviewLimitExceeded as exc:
+                await websocket.send_json({"type": "error", "seq": message.get("seq"), "message": str(exc)})
+            except (TypeError, ValueError, AttributeError):
+                await websocket.send_json({"type": "error", "message": "Некорректное сообщение"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        renderer.cancel()
+        preview_sessions -= 1
+
+
+async def _preview_loop(websocket: WebSocket, session: PreviewSession):
+    """Обрабатывает последнюю правку сессии; устаревшие правки бросаются на полпути."""
+    while True:
+        seq, markdown = await session.next_edit()
+        started = time.perf_counter()
+        tokens = await _resolve_tokens()
+        slides = parse_markdown(markdown)
+        try:
+            keys, changed = session.diff(slides, stable_hash(tokens))
+        except PreviewLimitExceeded as exc:
+            await websocket.send_json({"type": "error", "seq": seq, "message": str(exc)})
+            continue
+        await websocket.send_json({"type": "deck", "seq": seq, "keys": keys})
+
+        # Ограничение на сессию: один пользователь не занимает весь пул
+        semaphore = asyncio.Semaphore(PREVIEW_SESSION_RENDERS)
+
+        async def render_slide(index: int):
+            async with semaphore:
+                if session.superseded(seq):
+                    return
+                pdf_bytes = await _render_preview_slide(slides[index], tokens, session, seq)
+            if pdf_bytes is None or session.superseded(seq):
+                return
+            await websocket.send_json({
+                "type": "slide",
+                "seq": seq,
+                "key": keys[index],
+                "pdf": base64.b64encode(pdf_bytes).decode("ascii"),
+            })
+            session.mark_sent(keys[index])
+
+        results = await asyncio.gather(
+            *(render_slide(index) for index in changed), return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            await websocket.send_json({
+                "type": "error",
+                "seq": seq,
+                "message": f"Ошибка рендера: {type(errors[0]).__name__}: {errors[0]}",
+            })
+        if not session.superseded(seq):
+            await websocket.send_json({
+                "type": "done",
+                "seq": seq,
+                "rendered": len(changed) - len(errors),
+                "reused": len(keys) - len(changed),
+                "ms": round((time.perf_counter() - started) * 1000),
+            })
+
+
+async def _render_preview_slide(slide, tokens, session: PreviewSession, seq: int):
+    """PDF одного слайда; при полной очереди ждёт, пока правка ещё актуальна."""
+    while not session.superseded(seq):
+        try:
+            return await render_pool.run(generate_pdf, [slide], tokens)
+        except RenderQueueFull:
+            await asyncio.sleep(0.1)
+    return None
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Статус и прогресс задачи."""
+    job = job_store.get(job_id)
+    if job is None:
+        return PlainTextResponse("Задача не найдена", status_code=404)
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    """PDF готовой задачи."""
+    job = job_store.get(job_id)
+    if job is None:
+        return PlainTextResponse("Задача не найдена", status_code=404)
+    if job.status == FAILED:
+        return PlainTextResponse(f"Ошибка генерации PDF: {job.error}", status_code=500)
+    if job.status != DONE or job.result is None:
+        return PlainTextResponse("PDF ещё не готов", status_code=409)
+
+    return StreamingResponse(
+        _iter_chunks(job.result),
         media_type="application/pdf",
-        headers={"Content-Disposition": "attachment; filename=presentation.pdf"},
+        headers={
+            "Content-Disposition": "attachment; filename=presentation.pdf",
+            "Content-Length": str(len(job.result)),
+        },
     )
 
 
-def _default_tokens() -> dict:
-    """Дефолтные токены если нет подключения к Figma."""
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Метрики в текстовом формате Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Счётчики кеша результатов."""
+    return result_cache.stats()
+
+
+@app.post("/tokens/refresh")
+async def refresh_tokens(request: Request):
+    """
+    Проверяет версию файла в Figma и загружает токены, если она изменилась.
+    Кеш не сбрасывается: генерация в это время идёт на текущих токенах.
+    """
+    if TOKENS_REFRESH_SECRET and not _refresh_authorized(request):
+        return PlainTextResponse(
+            "Нужен заголовок Authorization: Bearer <TOKENS_REFRESH_SECRET>",
+            status_code=401,
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if not FIGMA_TOKEN:
+        return PlainTextResponse("FIGMA_TOKEN не задан", status_code=400)
+
+    try:
+        tokens = await token_provider.refresh(FIGMA_FILE_KEY, revalidate=True)
+    except Exception as exc:
+        return PlainTextResponse(
+            f"Не удалось обновить токены: {type(exc).__name__}: {exc}",
+            status_code=502,
+        )
+
     return {
-        "colors": {
-            "background": "#2c2c2c",
-            "text_primary": "#f5f5f5",
-            "text_muted": "rgba(255,255,255,0.6)",
-            "border": "#383838",
-            "accent_primary": "#4F9EF8",
-            "factoid_red": "#E85D5D",
-            "factoid_yellow": "#F0A500",
-            "factoid_cyan": "#4DD0E1",
-            "factoid_green": "#14ae5c",
-            "factoid_purple": "#A78BFA",
-        },
-        "typography": {
-            "title_hero": {"family": "Inter", "weight": 800, "size": 88, "line_height": 1.1, "letter_spacing": -2.5},
-            "subtitle": {"family": "Inter", "weight": 400, "size": 26, "line_height": 1.55, "letter_spacing": 0},
-            "body": {"family": "Inter", "weight": 400, "size": 16, "line_height": 1.4, "letter_spacing": 0},
-            "factoid_number": {"family": "Inter", "weight": 800, "size": 72, "line_height": 1.0, "letter_spacing": -2},
-            "factoid_label": {"family": "Inter", "weight": 500, "size": 18, "line_height": 1.4, "letter_spacing": 0},
-        },
-        "layout": {"slide_width": 1920, "slide_height": 1080, "margin": 64},
+        "file_key": FIGMA_FILE_KEY,
+        "colors": len(tokens.get("colors", {})),
+        "typography": len(tokens.get("typography", {})),
     }
 
 
+def _refresh_authorized(request: Request) -> bool:
+    scheme, _, secret = request.headers.get("authorization", "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(
+        secret.strip().encode(), TOKENS_REFRESH_SECRET.encode()
+    )
+
+
+def _default_tokens() -> dict:
+    """Дефолтные токены если нет подключения к Figma."""
+    return copy.deepcopy(DEFAULT_TOKENS)
+
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
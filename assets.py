@@ -0,0 +1,116 @@
+"""
+url_fetcher для WeasyPrint: ресурсы из static/ лежат в памяти процесса.
+Логотип и шрифты читаются с диска один раз при старте рендерера, а не
+на каждый <img> каждого слайда. Внешние URL из пользовательского Markdown
+по умолчанию не загружаются: раскладка не ходит в сеть.
+"""
+
+import mimetypes
+import threading
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+
+EXTERNAL_DENY = "deny"
+EXTERNAL_ALLOW = "allow"
+
+
+class AssetRefused(ValueError):
+    """Ресурс запрещён политикой; WeasyPrint пропускает его с предупреждением."""
+
+
+class AssetFetcher:
+    """
+    Кеш ресурсов с ограничением по байтам.
+
+    roots — каталоги, из которых разрешено читать file:// (static/, templates/).
+    max_bytes — бюджет памяти; файлы сверх бюджета читаются с диска при каждом запросе.
+    external — политика для http(s): deny (по умолчанию) или allow с таймаутом
+    external_timeout секунд.
+    """
+
+    def __init__(
+        self,
+        roots: list[Path],
+        max_bytes: int,
+        external: str = EXTERNAL_DENY,
+        external_timeout: float = 3.0,
+    ):
+        self.roots = [Path(root).resolve() for root in roots]
+        self.max_bytes = max(0, max_bytes)
+        self.external = external
+        self.external_timeout = external_timeout
+        self._assets: dict[str, tuple[bytes, str]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.refused = 0
+        self.external_fetches = 0
+
+    def preload(self, root: Path):
+        """Читает в память все файлы каталога, пока хватает бюджета."""
+        for path in sorted(Path(root).rglob("*")):
+            if path.is_file() and not path.name.startswith("."):
+                self._store(path)
+
+    def _store(self, path: Path):
+        size = path.stat().st_size
+        with self._lock:
+            if self._bytes + size > self.max_bytes:
+                return
+            url = path.resolve().as_uri()
+            if url in self._assets:
+                return
+            self._assets[url] = (path.read_bytes(), _mime_type(path))
+            self._bytes += size
+
+    def _allowed(self, path: Path) -> bool:
+        return any(path == root or root in path.parents for root in self.roots)
+
+    def __call__(self, url: str, timeout: float = 10, ssl_context=None) -> dict:
+        asset = self._assets.get(url)
+        if asset is not None:
+            self.hits += 1
+            return {"string": asset[0], "mime_type": asset[1], "redirected_url": url}
+
+        # Модуль импортируется без WeasyPrint; сам fetcher вызывается только из рендера
+        from weasyprint import default_url_fetcher
+
+        scheme = urlparse(url).scheme
+        if scheme == "data":
+            return default_url_fetcher(url, timeout=timeout, ssl_context=ssl_context)
+
+        if scheme == "file":
+            path = Path(unquote(urlparse(url).path)).resolve()
+            if not self._allowed(path) or not path.is_file():
+                self.refused += 1
+                raise AssetRefused(f"Файл вне разрешённых каталогов: {url}")
+            self.misses += 1
+            self._store(path)
+            return {"string": path.read_bytes(), "mime_type": _mime_type(path), "redirected_url": url}
+
+        if scheme in ("http", "https") and self.external == EXTERNAL_ALLOW:
+            self.external_fetches += 1
+            return default_url_fetcher(
+                url, timeout=min(timeout, self.external_timeout), ssl_context=ssl_context
+            )
+
+        self.refused += 1
+        raise AssetRefused(f"Внешние ресурсы запрещены: {url}")
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "refused": self.refused,
+            "external_fetches": self.external_fetches,
+            "items": len(self._assets),
+            "bytes": self._bytes,
+        }
+
+
+def _mime_type(path: Path) -> str:
+    if path.suffix.lower() == ".svg":
+        return "image/svg+xml"
+    return mimetypes.guess_type(path.name)[0] or "application/octet-stream"
@@ -0,0 +1,71 @@
+"""
+Пакетная генерация: ZIP-архив, который отдаётся клиенту по мере готовности PDF.
+Архив пишется в неперематываемый поток, поэтому в памяти держится
+только текущий файл, а не весь ZIP.
+"""
+
+import json
+import re
+import zipfile
+from pathlib import PurePath
+
+
+class _Sink:
+    """Приёмник для ZipFile без seek: копит записанные байты до выгрузки."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipStream:
+    """
+    Потоковый ZIP: add() и close() возвращают байты, готовые к отправке.
+    PDF уже сжат, поэтому файлы пишутся без компрессии.
+    """
+
+    def __init__(self):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, "w", compression=zipfile.ZIP_STORED)
+
+    def add(self, name: str, data: bytes) -> bytes:
+        self._zip.writestr(name, data)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._zip.close()
+        return self._sink.drain()
+
+
+def manifest_bytes(entries: list[dict]) -> bytes:
+    """manifest.json: результат по каждому деку (успех или ошибка)."""
+    ok = sum(1 for entry in entries if entry["status"] == "ok")
+    manifest = {"total": len(entries), "ok": ok, "failed": len(entries) - ok, "decks": entries}
+    return json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+_UNSAFE_CHARS = re.compile(r"[^\w.\- ]+", re.UNICODE)
+
+
+def pdf_name(filename: str, index: int, used: set[str]) -> str:
+    """Безопасное уникальное имя PDF в архиве по имени исходного файла."""
+    stem = PurePath(filename or "").stem
+    stem = _UNSAFE_CHARS.sub("_", stem).strip(" ._") or f"deck-{index + 1}"
+    name = f"{stem}.pdf"
+    suffix = 2
+    while name in used:
+        name = f"{stem}-{suffix}.pdf"
+        suffix += 1
+    used.add(name)
+    return name
@@ -0,0 +1,60 @@
+"""
+Бенчмарк: рендер большого дека одним процессом vs режим chunked
+(части дека раскладываются на разных ядрах и склеиваются в один PDF).
+
+    python benchmarks/bench_chunked_render.py [воркеров] [мин_слайдов_в_части]
+"""
+
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from common import TOKENS, make_markdown, timed
+
+from content_parser import parse_markdown
+from pdf_generator import chunk_count, generate_pdf, merge_pdfs, split_chunks, warm_up
+from render_pool import available_cpus
+
+SLIDE_COUNTS = (10, 50, 150, 500)
+
+
+def render_chunked(executor: ProcessPoolExecutor, slides, workers: int, min_chunk: int) -> bytes:
+    parts = chunk_count(len(slides), min_chunk, workers)
+    if parts <= 1:
+        return executor.submit(generate_pdf, slides, TOKENS).result()
+    futures = [executor.submit(generate_pdf, chunk, TOKENS) for chunk in split_chunks(slides, parts)]
+    return executor.submit(merge_pdfs, [future.result() for future in futures]).result()
+
+
+def page_count(pdf: bytes) -> int:
+    from pypdf import PdfReader
+
+    return len(PdfReader(BytesIO(pdf)).pages)
+
+
+def main(workers: int, min_chunk: int):
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=warm_up) as executor:
+        # Прогрев: все воркеры подняли рендерер до замеров
+        list(executor.map(generate_pdf, [parse_markdown(make_markdown(1))] * workers, [TOKENS] * workers))
+
+        print(f"Воркеров: {workers}, минимум слайдов в части: {min_chunk}")
+        print(f"{'слайдов':>8} {'один процесс':>13} {'chunked':>9} {'ускорение':>10} {'частей':>7}")
+        for count in SLIDE_COUNTS:
+            slides = parse_markdown(make_markdown(count, seed=count))
+            single, single_time = timed(lambda: executor.submit(generate_pdf, slides, TOKENS).result())
+            chunked, chunked_time = timed(render_chunked, executor, slides, workers, min_chunk)
+            assert page_count(chunked) == page_count(single)
+            parts = chunk_count(count, min_chunk, workers)
+            print(
+                f"{count:>8} {single_time:>11.2f} с {chunked_time:>7.2f} с "
+                f"{single_time / chunked_time:>9.1f}x {parts:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else available_cpus(),
+        int(sys.argv[2]) if len(sys.argv) > 2 else 20,
+    )
@@ -0,0 +1,72 @@
+"""
+Бенчмарк: полное vs точечное (targeted) извлечение токенов из Figma.
+Сравнивает трафик, время, пиковую память и проверяет совпадение токенов.
+Работает офлайн против локальной замены API.
+
+    python benchmarks/bench_figma_extraction.py [число_фреймов]
+"""
+
+import asyncio
+import multiprocessing
+import resource
+import sys
+import time
+import tracemalloc
+
+import common  # noqa: F401  (путь к модулям проекта)
+
+from figma_standin import StandInFigma, make_document
+from figma_tokens import EXTRACTION_FULL, EXTRACTION_TARGETED, FigmaClient, ijson
+
+FILE_KEY = "bench"
+
+
+def _run(base_url: str, extraction: str) -> dict:
+    async def fetch():
+        client = FigmaClient("token", base_url=base_url, extraction=extraction)
+        try:
+            return await client.fetch_tokens(FILE_KEY), client.bytes_downloaded
+        finally:
+            await client.aclose()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    tokens, downloaded = asyncio.run(fetch())
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "tokens": tokens,
+        "bytes": downloaded,
+        "seconds": seconds,
+        "peak_alloc_mb": peak / 1024 / 1024,
+        # ru_maxrss в Linux — КБ
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main(frames: int = 20000):
+    standin = StandInFigma()
+    standin.files[FILE_KEY] = make_document(extra_frames=frames)
+
+    # Каждый режим — в отдельном процессе, чтобы пиковый RSS не смешивался
+    ctx = multiprocessing.get_context("spawn")
+    with standin:
+        results = {}
+        for extraction in (EXTRACTION_FULL, EXTRACTION_TARGETED):
+            with ctx.Pool(1) as pool:
+                results[extraction] = pool.apply(_run, (standin.base_url, extraction))
+
+    print(f"Фреймов в файле: {frames}; ijson: {'да' if ijson else 'нет'}")
+    for extraction, result in results.items():
+        print(
+            f"  {extraction:9s} {result['bytes'] / 1024:10.0f} КБ  {result['seconds']:6.2f} с  "
+            f"alloc {result['peak_alloc_mb']:7.1f} МБ  RSS {result['peak_rss_mb']:7.1f} МБ"
+        )
+    same = results[EXTRACTION_FULL]["tokens"] == results[EXTRACTION_TARGETED]["tokens"]
+    print(f"  токены совпадают: {'да' if same else 'НЕТ'}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,56 @@
+"""
+Бенчмарк: монолитный рендер vs per-slide рендер с кешем страниц,
+когда в деке меняется один слайд.
+
+    python benchmarks/bench_slide_cache.py [число_слайдов]
+"""
+
+import sys
+from io import BytesIO
+
+from common import TOKENS, make_markdown, timed
+
+from pypdf import PdfReader
+
+from content_parser import parse_markdown
+from pdf_generator import SlidePageCache, generate_pdf, generate_pdf_per_slide
+
+
+def page_texts(pdf_bytes: bytes) -> list[tuple]:
+    """Размер и текст каждой страницы — для сравнения двух путей рендера."""
+    return [
+        (float(page.mediabox.width), float(page.mediabox.height), page.extract_text())
+        for page in PdfReader(BytesIO(pdf_bytes)).pages
+    ]
+
+
+def main(slide_count: int = 40):
+    slides = parse_markdown(make_markdown(slide_count))
+    edited = parse_markdown(make_markdown(slide_count))
+    edited[slide_count // 2].body.append("One more sentence after an edit.")
+
+    cache = SlidePageCache(max_slides=slide_count * 2)
+
+    monolithic_pdf, monolithic = timed(generate_pdf, edited, TOKENS)
+    _, cold = timed(generate_pdf_per_slide, slides, TOKENS, cache)
+    hits, misses = cache.hits, cache.misses
+    per_slide_pdf, warm = timed(generate_pdf_per_slide, edited, TOKENS, cache)
+
+    print(f"Слайдов: {slide_count}")
+    print(f"  монолитный рендер:          {monolithic:.2f} с")
+    print(f"  per-slide, холодный кеш:    {cold:.2f} с")
+    print(f"  per-slide, изменён 1 слайд: {warm:.2f} с  (x{monolithic / warm:.1f})")
+    print(f"  кеш на правке: hits={cache.hits - hits}, misses={cache.misses - misses}")
+
+    # Постраничное совпадение с монолитным путём
+    expected = page_texts(monolithic_pdf)
+    actual = page_texts(per_slide_pdf)
+    print(f"  страниц: монолит={len(expected)}, per-slide={len(actual)}")
+    assert len(actual) == len(expected), "per-slide дал другое число страниц"
+    for index, (want, got) in enumerate(zip(expected, actual)):
+        assert got == want, f"страница {index + 1} per-slide отличается от монолитной"
+    print("  постранично совпадает с монолитным рендером")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 40)
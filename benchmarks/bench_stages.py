@@ -0,0 +1,170 @@
+"""
+Бенчмарк по стадиям конвейера: разбор Markdown, шаблон Jinja2,
+раскладка WeasyPrint и запись PDF — на синтетических деках разного
+размера, плотности факт-карточек и длины текста.
+
+Результат пишется в JSON (время стадий — медиана повторов, пиковая
+память, размер PDF). С --baseline сравнивает с сохранённым прогоном
+и завершается с кодом 1, если какая-то стадия стала медленнее порога.
+
+    python benchmarks/bench_stages.py --output bench.json
+    python benchmarks/bench_stages.py --baseline bench.json --threshold 0.2
+"""
+
+import argparse
+import json
+import platform
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+
+from common import TOKENS, make_markdown
+
+from content_parser import parse_markdown
+from pdf_generator import get_renderer
+
+STAGES = ("parse", "template", "layout", "write")
+
+# (слайдов, доля слайдов с факт-карточками, слов текста на слайд)
+FULL_MATRIX = [
+    (slides, density, words)
+    for slides in (10, 50, 150)
+    for density in (0.0, 0.5)
+    for words in (30, 150)
+]
+QUICK_MATRIX = [(10, 0.3, 60), (50, 0.3, 60)]
+
+# Разница меньше этой не считается регрессией: шум таймера на быстрых стадиях
+NOISE_FLOOR_SECONDS = 0.005
+
+
+def case_name(slides: int, density: float, words: int) -> str:
+    return f"slides={slides},factoids={density},words={words}"
+
+
+def run_pipeline(markdown: str) -> tuple[dict, bytes, int]:
+    """Один прогон: секунды по стадиям, PDF и число страниц."""
+    renderer = get_renderer()
+    timings = {}
+
+    start = time.perf_counter()
+    slides = parse_markdown(markdown)
+    timings["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    html_content = renderer.render_html(slides, TOKENS)
+    timings["template"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    document = renderer.layout(html_content, renderer.stylesheet(TOKENS))
+    timings["layout"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pdf_bytes = renderer.write_document(document)
+    timings["write"] = time.perf_counter() - start
+
+    return timings, pdf_bytes, len(document.pages)
+
+
+def measure_case(slides: int, density: float, words: int, repeat: int) -> dict:
+    markdown = make_markdown(slides, factoid_density=density, body_words=words, seed=slides)
+    runs = [run_pipeline(markdown)[0] for _ in range(repeat)]
+
+    # Память — отдельным прогоном: tracemalloc замедляет стадии
+    tracemalloc.start()
+    _, pdf_bytes, pages = run_pipeline(markdown)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "slides": slides,
+        "factoid_density": density,
+        "body_words": words,
+        "markdown_bytes": len(markdown.encode("utf-8")),
+        "stages": {stage: statistics.median(run[stage] for run in runs) for stage in STAGES},
+        "peak_traced_bytes": peak,
+        "pdf_bytes": len(pdf_bytes),
+        "pages": pages,
+    }
+
+
+def run_suite(matrix: list, repeat: int) -> dict:
+    # Прогрев: шрифты и шаблоны загружены до первого замера
+    run_pipeline(make_markdown(1))
+
+    cases = {}
+    for slides, density, words in matrix:
+        name = case_name(slides, density, words)
+        cases[name] = measure_case(slides, density, words, repeat)
+        stages = cases[name]["stages"]
+        print(
+            f"{name:<40} "
+            + " ".join(f"{stage}={stages[stage] * 1000:8.1f} мс" for stage in STAGES)
+            + f"  peak={cases[name]['peak_traced_bytes'] / 1e6:6.1f} МБ"
+            + f"  pdf={cases[name]['pdf_bytes'] / 1024:7.0f} КБ",
+            file=sys.stderr,
+        )
+
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": repeat,
+        # ru_maxrss в Linux — КБ
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "cases": cases,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """Регрессии: стадия медленнее базовой более чем на threshold (доля)."""
+    regressions = []
+    for name, case in current["cases"].items():
+        base = baseline.get("cases", {}).get(name)
+        if base is None:
+            continue
+        for stage in STAGES:
+            now, before = case["stages"][stage], base["stages"].get(stage)
+            if before is None:
+                continue
+            if now > before * (1 + threshold) and now - before > NOISE_FLOOR_SECONDS:
+                regressions.append(
+                    f"{name} {stage}: {before * 1000:.1f} → {now * 1000:.1f} мс "
+                    f"(+{(now / before - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", help="куда записать JSON (по умолчанию stdout)")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое замедление стадии, доля")
+    parser.add_argument("--repeat", type=int, default=3, help="повторов на каждый дек")
+    parser.add_argument("--quick", action="store_true", help="только два небольших дека")
+    args = parser.parse_args(argv)
+
+    results = run_suite(QUICK_MATRIX if args.quick else FULL_MATRIX, max(1, args.repeat))
+
+    payload = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload)
+    else:
+        print(payload)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"РЕГРЕССИЯ {line}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("Регрессий нет", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
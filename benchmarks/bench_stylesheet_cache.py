@@ -0,0 +1,69 @@
+"""
+Бенчмарк: стили слайдов внутри HTML каждого запроса (как было раньше)
+vs разобранный CSS из кеша рендерера по отпечатку токенов.
+
+Сравнивается раскладка одного и того же дека: в первом случае
+<style> с токенами рендерится и разбирается WeasyPrint на каждом
+запросе, во втором — берётся готовый CSS. Выигрыш особенно заметен
+на маленьких деках и в живом предпросмотре, где рендерится один слайд.
+
+    python benchmarks/bench_stylesheet_cache.py [повторов]
+"""
+
+import statistics
+import sys
+
+from common import TOKENS, make_markdown, timed
+
+from weasyprint import CSS
+
+from content_parser import parse_markdown
+from pdf_generator import get_renderer
+
+DECKS = (1, 10, 40)
+
+
+def render_inline(renderer, slides, empty_css) -> float:
+    """Старый путь: CSS токенов рендерится в <head> и разбирается заново."""
+    def run():
+        css = renderer.stylesheet_css(TOKENS)
+        html_content = renderer.render_html(slides, TOKENS).replace(
+            "</head>", f"<style>\n{css}</style>\n</head>", 1
+        )
+        return renderer.layout(html_content, empty_css)
+    return timed(run)[1]
+
+
+def render_cached(renderer, slides) -> float:
+    """Новый путь: в HTML только разметка, CSS — из кеша рендерера."""
+    def run():
+        return renderer.layout(renderer.render_html(slides, TOKENS), renderer.stylesheet(TOKENS))
+    return timed(run)[1]
+
+
+def main(repeat: int = 5):
+    renderer = get_renderer()
+    empty_css = CSS(string="")
+
+    # Сборка CSS на новый отпечаток токенов — разовая стоимость
+    _, build = timed(lambda: CSS(string=renderer.stylesheet_css(TOKENS), font_config=renderer.font_config))
+    renderer.stylesheet(TOKENS)
+
+    print(f"Сборка и разбор CSS токенов (один раз на отпечаток): {build * 1000:.1f} мс")
+    for slide_count in DECKS:
+        slides = parse_markdown(make_markdown(slide_count))
+        # Прогрев: шрифты и картинки загружены до замеров
+        render_inline(renderer, slides, empty_css)
+        render_cached(renderer, slides)
+
+        inline = statistics.median(render_inline(renderer, slides, empty_css) for _ in range(repeat))
+        cached = statistics.median(render_cached(renderer, slides) for _ in range(repeat))
+        print(
+            f"  слайдов={slide_count:<3} inline={inline * 1000:8.1f} мс  "
+            f"кеш={cached * 1000:8.1f} мс  экономия={(inline - cached) * 1000:6.1f} мс на рендер"
+        )
+    print(f"  кеш стилей: {renderer.stylesheet_stats()}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,158 @@
+"""
+Бенчмарк обхода дерева Figma: прежний рекурсивный _walk_tree
+против итеративного с индексом имён стилей.
+Документы синтетические: от 10k до 1M узлов, в т.ч. с глубокой вложенностью.
+
+    python benchmarks/bench_walk_tree.py [макс_узлов]
+"""
+
+import random
+import sys
+import time
+
+import common  # noqa: F401  (путь к модулям проекта)
+
+from figma_tokens import _empty_tokens, _walk_tree
+
+STYLE_COUNT = 40
+
+
+def make_styles() -> dict:
+    styles = {}
+    for i in range(STYLE_COUNT):
+        kind = "FILL" if i % 2 == 0 else "TEXT"
+        styles[f"S:{i}"] = {"key": str(i), "name": f"Group {i % 5}/Token {i}", "styleType": kind}
+    return styles
+
+
+def make_node(rng: random.Random, node_id: int) -> dict:
+    """Случайный узел: часть узлов использует стили заливки/текста."""
+    roll = rng.random()
+    if roll < 0.2:
+        style = rng.randrange(0, STYLE_COUNT, 2)
+        value = (style % 7) / 7
+        return {
+            "id": str(node_id), "name": f"Rect {node_id}", "type": "RECTANGLE",
+            "fills": [{"type": "SOLID", "color": {"r": value, "g": 0.5, "b": 0.25}}],
+            "styles": {"fill": f"S:{style}"},
+        }
+    if roll < 0.35:
+        style = rng.randrange(1, STYLE_COUNT, 2)
+        return {
+            "id": str(node_id), "name": f"Text {node_id}", "type": "TEXT",
+            "style": {"fontFamily": "Inter", "fontWeight": 400, "fontSize": 10 + style},
+            "styles": {"text": f"S:{style}"},
+        }
+    if roll < 0.36:
+        return {
+            "id": str(node_id), "name": f"Zone/Area{node_id % 10}", "type": "FRAME",
+            "absoluteBoundingBox": {"x": node_id % 100, "y": 0, "width": 100, "height": 100},
+        }
+    return {"id": str(node_id), "name": f"Frame {node_id}", "type": "FRAME"}
+
+
+def make_document(nodes: int, depth: int, seed: int = 0) -> dict:
+    """
+    Дерево из nodes узлов. depth — длина «позвоночника»: цепочки вложенных
+    фреймов, к которой подвешены остальные узлы (глубокие дизайн-файлы).
+    """
+    rng = random.Random(seed)
+    root = {"id": "0:0", "name": "Document", "type": "DOCUMENT", "children": []}
+    spine = [root]
+    for i in range(1, depth):
+        frame = {"id": f"s{i}", "name": f"Group {i}", "type": "FRAME", "children": []}
+        spine[-1]["children"].append(frame)
+        spine.append(frame)
+
+    parents = list(spine)
+    for node_id in range(max(0, nodes - depth)):
+        node = make_node(rng, node_id)
+        parent = rng.choice(parents)
+        parent.setdefault("children", []).append(node)
+        if node["type"] == "FRAME" and len(parents) < 5000:
+            parents.append(node)
+    return root
+
+
+def walk_tree_recursive(node: dict, tokens: dict, styles_map: dict):
+    """Прежняя рекурсивная реализация — эталон для сравнения."""
+    node_name = node.get("name", "")
+    node_type = node.get("type", "")
+
+    if node_name.startswith("Zone/") and node_type == "FRAME":
+        zone_name = node_name.split("/")[1].lower()
+        bbox = node.get("absoluteBoundingBox", {})
+        tokens["zones"][zone_name] = {
+            "x": bbox.get("x", 0),
+            "y": bbox.get("y", 0),
+            "width": bbox.get("width", 0),
+            "height": bbox.get("height", 0),
+        }
+
+    if "fills" in node:
+        for fill in node.get("fills", []):
+            if fill.get("type") == "SOLID":
+                color_data = fill.get("color", {})
+                r = int(color_data.get("r", 0) * 255)
+                g = int(color_data.get("g", 0) * 255)
+                b = int(color_data.get("b", 0) * 255)
+                hex_color = f"#{r:02x}{g:02x}{b:02x}"
+                style_id = node.get("styles", {}).get("fill")
+                if style_id and style_id in styles_map:
+                    style_info = styles_map[style_id]
+                    style_name = style_info.get("name", "").lower().replace("/", "_").replace(" ", "_")
+                    if style_name:
+                        tokens["colors"][style_name] = hex_color
+
+    if "style" in node and node_type == "TEXT":
+        text_style = node["style"]
+        style_id = node.get("styles", {}).get("text")
+        style_name = None
+        if style_id and style_id in styles_map:
+            style_info = styles_map[style_id]
+            style_name = style_info.get("name", "").lower().replace("/", "_").replace(" ", "_")
+        if style_name:
+            tokens["typography"][style_name] = {
+                "family": text_style.get("fontFamily", "Inter"),
+                "weight": text_style.get("fontWeight", 400),
+                "size": text_style.get("fontSize", 16),
+                "line_height": text_style.get("lineHeightPercentFontSize", 140) / 100,
+                "letter_spacing": text_style.get("letterSpacing", 0),
+            }
+
+    for child in node.get("children", []):
+        walk_tree_recursive(child, tokens, styles_map)
+
+
+def _time(fn, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    except RecursionError:
+        return None, None
+    return result, time.perf_counter() - start
+
+
+def main(max_nodes: int = 1_000_000):
+    styles = make_styles()
+    cases = [(10_000, 10), (100_000, 50), (1_000_000, 100), (100_000, 5_000), (1_000_000, 50_000)]
+
+    print(f"{'узлов':>10} {'глубина':>8} {'рекурсивный':>12} {'итеративный':>12} {'ранний стоп':>12}  совпадение")
+    for nodes, depth in cases:
+        if nodes > max_nodes:
+            continue
+        document = make_document(nodes, depth)
+
+        old_tokens = _empty_tokens()
+        _, old = _time(walk_tree_recursive, document, old_tokens, styles)
+        new_tokens = _empty_tokens()
+        _, new = _time(_walk_tree, document, new_tokens, styles)
+        _, early = _time(_walk_tree, document, _empty_tokens(), styles, stop_when_complete=True)
+
+        old_text = f"{old:10.3f} с" if old is not None else "RecursionError"
+        same = "—" if old is None else ("да" if old_tokens == new_tokens else "НЕТ")
+        print(f"{nodes:>10} {depth:>8} {old_text:>12} {new:10.3f} с {early:10.3f} с  {same}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,53 @@
+"""Общие помощники бенчмарков: синтетические деки и дефолтные токены."""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from pdf_generator import DEFAULT_TOKENS
+
+WORDS = (
+    "liquidity stablecoin settlement corridor remittance treasury reserves "
+    "trade finance banking infrastructure africa dollar payments network "
+    "partners growth market capital exchange rails compliance"
+).split()
+
+# Те же токены, что у сервиса без Figma
+TOKENS = DEFAULT_TOKENS
+
+
+def make_markdown(
+    slides: int,
+    factoid_density: float = 0.3,
+    body_words: int = 60,
+    seed: int = 0,
+) -> str:
+    """
+    Синтетический дек: slides слайдов, доля factoid_density слайдов с факт-карточками,
+    body_words слов текста на слайд.
+    """
+    rng = random.Random(seed)
+    lines = []
+    for i in range(slides):
+        lines.append(f"# Slide {i + 1}: {rng.choice(WORDS).title()} {{accent}}{rng.choice(WORDS)}{{/accent}}")
+        lines.append(f"## {' '.join(rng.choices(WORDS, k=6))}")
+        lines.append("")
+        words = rng.choices(WORDS, k=body_words)
+        for start in range(0, len(words), 30):
+            lines.append(" ".join(words[start:start + 30]).capitalize() + ".")
+            lines.append("")
+        if rng.random() < factoid_density:
+            for _ in range(rng.randint(2, 4)):
+                lines.append(f"**${rng.randint(1, 999)}B** — {rng.choice(WORDS).title()} — {rng.choice(WORDS)}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def timed(fn, *args, **kwargs):
+    """Возвращает (результат, секунды)."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
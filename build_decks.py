@@ -0,0 +1,230 @@
+"""
+Инкрементальная сборка деков из каталога Markdown-файлов (для CI).
+
+    python -m build_decks decks/ build/pdf/
+    python -m build_decks decks/ build/pdf/ --tokens tokens_snapshot.json --jobs 4
+
+Каждый <имя>.md превращается в <имя>.pdf с той же структурой каталогов.
+В выходном каталоге лежит манифест с хешами исходника, токенов и версии
+шаблонов: неизменённые деки пропускаются без импорта WeasyPrint и без
+запуска воркеров, поэтому повторная сборка без изменений почти мгновенна.
+Рендер идёт параллельно в процессах; по каждому файлу печатается время.
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Optional
+
+from content_parser import parse_markdown
+from pdf_generator import DEFAULT_TOKENS, generate_pdf_with_pages, template_version, warm_up
+from render_pool import available_cpus
+from result_cache import stable_hash
+
+MANIFEST_NAME = ".pdfgen-manifest.json"
+MANIFEST_FORMAT = 1
+
+
+def load_tokens(path: Optional[str]) -> dict:
+    """Токены из JSON: снапшот figma_tokens ({"tokens": ...}) или сам словарь токенов."""
+    if not path:
+        return DEFAULT_TOKENS
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict) and isinstance(data.get("tokens"), dict) and "format" in data:
+        return data["tokens"]
+    return data
+
+
+def discover(input_dir: Path) -> list[Path]:
+    return sorted(path for path in input_dir.rglob("*.md") if path.is_file())
+
+
+def file_hash(path: Path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def load_manifest(output_dir: Path) -> dict:
+    try:
+        with open(output_dir / MANIFEST_NAME, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(manifest, dict) or manifest.get("format") != MANIFEST_FORMAT:
+        return {}
+    return manifest.get("decks", {})
+
+
+def save_manifest(output_dir: Path, decks: dict):
+    """Атомарно: прерванная сборка не оставляет битый манифест."""
+    payload = {"format": MANIFEST_FORMAT, "decks": decks}
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, output_dir / MANIFEST_NAME)
+    except OSError:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
+def up_to_date(entry: Optional[dict], inputs: dict, target: Path) -> bool:
+    if entry is None or any(entry.get(name) != value for name, value in inputs.items()):
+        return False
+    try:
+        return target.stat().st_size == entry.get("size")
+    except OSError:
+        return False
+
+
+def build_deck(source: str, target: str, tokens: dict) -> dict:
+    """Один дек (в воркере): разбор, рендер и атомарная запись PDF."""
+    timings = {}
+    start = time.perf_counter()
+    slides = parse_markdown(Path(source).read_text(encoding="utf-8-sig"))
+    timings["parse"] = time.perf_counter() - start
+    if not slides:
+        raise ValueError("Нет слайдов для генерации")
+
+    start = time.perf_counter()
+    pdf_bytes, pages = generate_pdf_with_pages(slides, tokens)
+    timings["render"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    Path(target).parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=Path(target).parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_bytes)
+        os.replace(tmp_path, target)
+    except OSError:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+    timings["write"] = time.perf_counter() - start
+
+    return {"slides": len(slides), "pages": pages, "size": len(pdf_bytes), "timings": timings}
+
+
+def build(input_dir: Path, output_dir: Path, tokens: dict, jobs: int, force: bool = False, log=print) -> dict:
+    """Собирает изменённые деки; возвращает отчёт с исходом и временем по каждому файлу."""
+    started = time.perf_counter()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(output_dir)
+    version = template_version()
+    tokens_hash = stable_hash(tokens)
+
+    files = []
+    todo = []
+    decks = {}
+    present = set()
+    for source in discover(input_dir):
+        name = source.relative_to(input_dir).as_posix()
+        present.add(name)
+        target = output_dir / Path(name).with_suffix(".pdf")
+        inputs = {"source": file_hash(source), "tokens": tokens_hash, "template": version}
+        entry = manifest.get(name)
+        if not force and up_to_date(entry, inputs, target):
+            decks[name] = entry
+            files.append({"file": name, "status": "skipped", "seconds": 0.0})
+        else:
+            todo.append((name, source, target, inputs))
+
+    # Исходник удалён — удаляем и его PDF
+    removed = sorted(set(manifest) - present)
+    for name in removed:
+        output = manifest[name].get("output")
+        if output:
+            (output_dir / output).unlink(missing_ok=True)
+
+    def finish(name: str, target: Path, inputs: dict, result: dict):
+        # Время самого дека в воркере, без ожидания свободного процесса
+        seconds = sum(result["timings"].values())
+        decks[name] = {
+            **inputs,
+            "output": target.relative_to(output_dir).as_posix(),
+            "size": result["size"],
+            "pages": result["pages"],
+        }
+        files.append({"file": name, "status": "built", "seconds": seconds, **result})
+        log(f"  {name}: {seconds:.2f} с, {result['pages']} стр., {result['size'] / 1024:.0f} КБ")
+
+    def fail(name: str, exc: Exception):
+        files.append({"file": name, "status": "failed", "error": f"{type(exc).__name__}: {exc}"})
+        log(f"  {name}: ОШИБКА {type(exc).__name__}: {exc}")
+
+    if len(todo) == 1 or (todo and jobs <= 1):
+        # Один процесс: без запуска пула
+        for name, source, target, inputs in todo:
+            try:
+                result = build_deck(str(source), str(target), tokens)
+            except Exception as exc:
+                fail(name, exc)
+                continue
+            finish(name, target, inputs, result)
+    elif todo:
+        # spawn, как у пула сервиса: воркер прогревает свой рендерер один раз
+        with ProcessPoolExecutor(
+            max_workers=min(jobs, len(todo)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=warm_up,
+        ) as executor:
+            submitted = {
+                executor.submit(build_deck, str(source), str(target), tokens): (name, target, inputs)
+                for name, source, target, inputs in todo
+            }
+            for future in as_completed(submitted):
+                name, target, inputs = submitted[future]
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    fail(name, exc)
+                    continue
+                finish(name, target, inputs, result)
+
+    save_manifest(output_dir, decks)
+    files.sort(key=lambda file: file["file"])
+    return {
+        "built": sum(file["status"] == "built" for file in files),
+        "skipped": sum(file["status"] == "skipped" for file in files),
+        "failed": sum(file["status"] == "failed" for file in files),
+        "removed": removed,
+        "seconds": time.perf_counter() - started,
+        "files": files,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m build_decks", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("input_dir", help="каталог с .md (ищутся рекурсивно)")
+    parser.add_argument("output_dir", help="куда писать .pdf и манифест")
+    parser.add_argument("--tokens", help="JSON токенов или снапшот Figma (по умолчанию — дефолтные токены)")
+    parser.add_argument("--jobs", type=int, default=available_cpus(), help="процессов рендера (по умолчанию — число ядер)")
+    parser.add_argument("--force", action="store_true", help="пересобрать всё, не глядя в манифест")
+    parser.add_argument("--report", help="записать отчёт в JSON")
+    args = parser.parse_args(argv)
+
+    input_dir = Path(args.input_dir)
+    if not input_dir.is_dir():
+        parser.error(f"нет каталога {input_dir}")
+
+    report = build(input_dir, Path(args.output_dir), load_tokens(args.tokens), max(1, args.jobs), args.force)
+    print(
+        f"Собрано: {report['built']}, без изменений: {report['skipped']}, "
+        f"ошибок: {report['failed']}, удалено: {len(report['removed'])} — {report['seconds']:.2f} с"
+    )
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
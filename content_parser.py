@@ -11,7 +11,9 @@
 
 import re
 from dataclasses import dataclass, field
-from typing import Optional
+from typing import Iterable, Iterator, Optional
+
+from text_fit import choose_layout
 
 
 @dataclass
@@ -47,51 +49,93 @@ def parse_markdown(markdown: str) -> list[Slide]:
     """
     Принимает Markdown-строку, возвращает список слайдов.
     """
-    slides: list[Slide] = []
-    current_slide: Optional[Slide] = None
+    return list(iter_slides([markdown]))
+
+
+def iter_slides(chunks: Iterable[str]) -> Iterator[Slide]:
+    """
+    Генератор слайдов по кускам Markdown произвольной длины.
+    Слайд отдаётся, как только начинается следующий # заголовок.
+    """
+    stream = MarkdownStream()
+    for chunk in chunks:
+        yield from stream.feed(chunk)
+    yield from stream.close()
 
-    # Убираем глобальный layout override
-    lines = markdown.strip().split("\n")
 
-    for line in lines:
+class MarkdownStream:
+    """
+    Инкрементальный парсер: feed() принимает очередной кусок текста
+    и возвращает слайды, которые уже точно закончились.
+    В памяти только текущий слайд и недочитанная строка.
+    """
+
+    def __init__(self):
+        self._current: Optional[Slide] = None
+        self._tail = ""
+
+    def feed(self, text: str) -> list[Slide]:
+        lines = (self._tail + text).split("\n")
+        # Последняя строка может продолжиться в следующем куске
+        self._tail = lines.pop()
+        finished = []
+        for line in lines:
+            slide = self._feed_line(line)
+            if slide is not None:
+                finished.append(slide)
+        return finished
+
+    def close(self) -> list[Slide]:
+        """Конец текста: дочитывает хвост и отдаёт последний слайд."""
+        finished = []
+        slide = self._feed_line(self._tail)
+        self._tail = ""
+        if slide is not None:
+            finished.append(slide)
+        if self._current is not None:
+            finished.append(_finish_slide(self._current))
+            self._current = None
+        return finished
+
+    def _feed_line(self, line: str) -> Optional[Slide]:
+        """Разбирает строку; возвращает предыдущий слайд, если строка начала новый."""
         stripped = line.strip()
 
         # Пустая строка — пропускаем
         if not stripped:
-            continue
+            return None
 
         # Layout override
         if stripped.startswith("---"):
             layout_match = re.match(r"---\s*layout:\s*(\w+)\s*---", stripped)
-            if layout_match and current_slide:
-                current_slide.layout = layout_match.group(1)
-            continue
+            if layout_match and self._current:
+                self._current.layout = layout_match.group(1)
+            return None
 
         # H1 — новый слайд
         if stripped.startswith("# ") and not stripped.startswith("## "):
-            current_slide = Slide()
+            finished = _finish_slide(self._current) if self._current is not None else None
+            self._current = Slide()
             title_text = stripped[2:].strip()
 
             # Проверяем акцентную часть {accent}..{/accent}
             accent_match = ACCENT_PATTERN.search(title_text)
             if accent_match:
-                current_slide.title_accent = accent_match.group(1)
-                current_slide.title = ACCENT_PATTERN.sub("", title_text).strip()
+                self._current.title_accent = accent_match.group(1)
+                self._current.title = ACCENT_PATTERN.sub("", title_text).strip()
             else:
-                current_slide.title = title_text
-
-            slides.append(current_slide)
-            continue
+                self._current.title = title_text
+            return finished
 
         # Если слайда ещё нет — создаём дефолтный
-        if current_slide is None:
-            current_slide = Slide()
-            slides.append(current_slide)
+        if self._current is None:
+            self._current = Slide()
+        current_slide = self._current
 
         # H2 — subtitle
         if stripped.startswith("## "):
             current_slide.subtitle = stripped[3:].strip()
-            continue
+            return None
 
         # Factoid: **$120B** — описание — подробности
         factoid_match = FACTOID_PATTERN.match(stripped)
@@ -102,37 +146,29 @@ def parse_markdown(markdown: str) -> list[Slide]:
                 sublabel=factoid_match.group(3) or "",
             )
             current_slide.factoids.append(factoid)
-            continue
+            return None
 
         # Всё остальное — body text
         current_slide.body.append(stripped)
+        return None
 
-    # Авто-выбор лейаутов
-    for slide in slides:
-        if slide.layout == "auto":
-            slide.layout = _auto_layout(slide)
 
-        # Назначаем цвета факт-карточкам
-        for i, factoid in enumerate(slide.factoids):
-            if not factoid.color:
-                factoid.color = FACTOID_COLORS[i % len(FACTOID_COLORS)]
+def _finish_slide(slide: Slide) -> Slide:
+    """Слайд закончен: авто-выбор лейаута и цвета факт-карточек."""
+    if slide.layout == "auto":
+        slide.layout = _auto_layout(slide)
 
-    return slides
+    # Назначаем цвета факт-карточкам
+    for i, factoid in enumerate(slide.factoids):
+        if not factoid.color:
+            factoid.color = FACTOID_COLORS[i % len(FACTOID_COLORS)]
+    return slide
 
 
 def _auto_layout(slide: Slide) -> str:
     """
     Автоматически выбирает лейаут по содержимому слайда.
+    Токены на этапе разбора неизвестны — оценка по дефолтной типографике;
+    с реальными токенами слайд ещё раз проверяет fit_slides при рендере.
     """
-    has_factoids = len(slide.factoids) > 0
-    has_body = len(slide.body) > 0
-    body_length = sum(len(line) for line in slide.body)
-
-    if has_factoids:
-        return "factoid"
-    elif not has_body and not slide.subtitle:
-        return "title_hero"
-    elif body_length > 500:
-        return "default"  # text-heavy
-    else:
-        return "default"
+    return choose_layout(slide)
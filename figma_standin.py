@@ -0,0 +1,238 @@
+"""
+Локальная замена Figma REST API для тестов и бенчмарков.
+Отдаёт заранее заданные файлы, умеет искусственную задержку
+и считает запросы и отданные байты — всё офлайн.
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+
+def _rgb(hex_color: str) -> dict:
+    hex_color = hex_color.lstrip("#")
+    r, g, b = (int(hex_color[i:i + 2], 16) / 255 for i in (0, 2, 4))
+    return {"r": r, "g": g, "b": b, "a": 1}
+
+
+def make_document(version: str = "1", extra_frames: int = 0) -> dict:
+    """Небольшой файл дизайн-системы: стили цветов и текста, зоны."""
+    styles = {
+        "S:bg": {"key": "bg", "name": "Background", "styleType": "FILL"},
+        "S:text": {"key": "text", "name": "Text Primary", "styleType": "FILL"},
+        "S:accent": {"key": "accent", "name": "Accent/Primary", "styleType": "FILL"},
+        "S:red": {"key": "red", "name": "Factoid/Red", "styleType": "FILL"},
+        "S:title": {"key": "title", "name": "Title Hero", "styleType": "TEXT"},
+        "S:body": {"key": "body", "name": "Body", "styleType": "TEXT"},
+    }
+    colors = {"S:bg": "#2c2c2c", "S:text": "#f5f5f5", "S:accent": "#4f9ef8", "S:red": "#e85d5d"}
+
+    children = []
+    for i, (style_id, color) in enumerate(colors.items()):
+        children.append({
+            "id": f"2:{i}",
+            "name": f"Swatch {i}",
+            "type": "RECTANGLE",
+            "fills": [{"type": "SOLID", "color": _rgb(color)}],
+            "styles": {"fill": style_id},
+        })
+    children.append({
+        "id": "3:0",
+        "name": "Title",
+        "type": "TEXT",
+        "style": {"fontFamily": "Inter", "fontWeight": 800, "fontSize": 88,
+                  "lineHeightPercentFontSize": 110, "letterSpacing": -2.5},
+        "styles": {"text": "S:title"},
+    })
+    children.append({
+        "id": "3:1",
+        "name": "Body",
+        "type": "TEXT",
+        "style": {"fontFamily": "Inter", "fontWeight": 400, "fontSize": 16,
+                  "lineHeightPercentFontSize": 140, "letterSpacing": 0},
+        "styles": {"text": "S:body"},
+    })
+    children.append({
+        "id": "4:0",
+        "name": "Zone/Title",
+        "type": "FRAME",
+        "absoluteBoundingBox": {"x": 64, "y": 64, "width": 886, "height": 300},
+        "children": [],
+    })
+
+    # Балласт: обычные фреймы без стилей, чтобы полный файл был «тяжёлым»
+    rng = random.Random(extra_frames)
+    for i in range(extra_frames):
+        children.append({
+            "id": f"9:{i}",
+            "name": f"Slide {i}",
+            "type": "FRAME",
+            "fills": [{"type": "SOLID", "color": _rgb("#%06x" % rng.randrange(1 << 24))}],
+            "children": [
+                {"id": f"9:{i}:{j}", "name": "Text", "type": "TEXT", "characters": "lorem " * 20}
+                for j in range(5)
+            ],
+        })
+
+    return {
+        "name": "RemiDe Design System",
+        "version": version,
+        "lastModified": "2026-01-01T00:00:00Z",
+        "document": {
+            "id": "0:0",
+            "name": "Document",
+            "type": "DOCUMENT",
+            "children": [{"id": "1:0", "name": "Page 1", "type": "CANVAS", "children": children}],
+        },
+        "styles": styles,
+    }
+
+
+def _iter_nodes(node: dict):
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        yield current
+        stack.extend(reversed(current.get("children", [])))
+
+
+def _style_nodes(document: dict) -> dict:
+    """style_id → id первого узла, к которому применён стиль (узел-образец)."""
+    nodes = {}
+    for node in _iter_nodes(document):
+        for style_id in (node.get("styles") or {}).values():
+            nodes.setdefault(style_id, node.get("id"))
+    return nodes
+
+
+def _truncate(node: dict, depth: int) -> dict:
+    """Обрезает дерево как ?depth=N у Figma."""
+    node = dict(node)
+    if depth <= 0:
+        node.pop("children", None)
+    elif "children" in node:
+        node["children"] = [_truncate(child, depth - 1) for child in node["children"]]
+    return node
+
+
+class StandInFigma:
+    """
+    HTTP-сервер, повторяющий нужные эндпоинты Figma:
+    /v1/files/{key}, /v1/files/{key}?depth=N, /v1/files/{key}/styles,
+    /v1/files/{key}/nodes?ids=....
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.files: dict[str, dict] = {}
+        self.requests: list[str] = []
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests.clear()
+            self.bytes_sent = 0
+
+    def start(self) -> "StandInFigma":
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                standin._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handle(self, handler: BaseHTTPRequestHandler):
+        if self.latency:
+            time.sleep(self.latency)
+
+        url = urlparse(handler.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip("/").split("/")
+        status, payload = self._route(parts, query)
+
+        body = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+        with self._lock:
+            self.requests.append(handler.path)
+            self.bytes_sent += len(body)
+
+    def _route(self, parts: list[str], query: dict) -> tuple[int, dict]:
+        if len(parts) < 3 or parts[:2] != ["v1", "files"] or parts[2] not in self.files:
+            return 404, {"status": 404, "err": "Not found"}
+        file_data = self.files[parts[2]]
+
+        if len(parts) == 3:
+            if "depth" in query:
+                depth = int(query["depth"][0])
+                return 200, {**file_data, "document": _truncate(file_data["document"], depth)}
+            return 200, file_data
+
+        if parts[3] == "styles":
+            style_nodes = _style_nodes(file_data["document"])
+            styles = [
+                {
+                    "key": meta["key"],
+                    "node_id": style_nodes.get(style_id, ""),
+                    "style_type": meta["styleType"],
+                    "name": meta["name"],
+                }
+                for style_id, meta in file_data.get("styles", {}).items()
+            ]
+            return 200, {"status": 200, "error": False, "meta": {"styles": styles}}
+
+        if parts[3] == "nodes":
+            ids = query.get("ids", [""])[0].split(",")
+            by_id = {node.get("id"): node for node in _iter_nodes(file_data["document"])}
+            all_styles = file_data.get("styles", {})
+            nodes = {}
+            for node_id in ids:
+                node = by_id.get(node_id)
+                if node is None:
+                    nodes[node_id] = None
+                    continue
+                used = {
+                    style_id
+                    for child in _iter_nodes(node)
+                    for style_id in (child.get("styles") or {}).values()
+                }
+                nodes[node_id] = {
+                    "document": node,
+                    "styles": {style_id: all_styles[style_id] for style_id in used if style_id in all_styles},
+                }
+            return 200, {"name": file_data["name"], "version": file_data["version"], "nodes": nodes}
+
+        return 404, {"status": 404, "err": "Not found"}
@@ -3,12 +3,46 @@
 Опционально кеширует токены, чтобы не дёргать API каждый запрос.
 """
 
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import threading
 import time
 import httpx
+from pathlib import Path
 from typing import Optional
 
+try:
+    # Опционально: потоковый разбор ответа /nodes без загрузки всего JSON
+    import ijson
+except ImportError:
+    ijson = None
+
+logger = logging.getLogger(__name__)
+
+FIGMA_API_URL = "https://api.figma.com"
+
+# Режимы извлечения: full — весь документ; targeted — только нужные узлы
+EXTRACTION_FULL = "full"
+EXTRACTION_TARGETED = "targeted"
+
+# Сколько id узлов отправлять в одном запросе /nodes
+NODES_BATCH_SIZE = 50
+
+# До какого объёма ответ /nodes держится в памяти, дальше — во временном файле
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+# Версия формата снапшота; снапшоты другого формата игнорируются
+SNAPSHOT_FORMAT = 1
+
 # Кеш токенов: {file_key: {"tokens": {...}, "timestamp": float}}
 _cache: dict = {}
+_cache_lock = threading.Lock()
+
+# Асинхронные клиенты по токену доступа: пул соединений живёт между запросами
+_clients: dict = {}
 
 
 def fetch_design_tokens(file_key: str, figma_token: str, cache_ttl_seconds: int = 0) -> dict:
@@ -23,9 +57,9 @@ def fetch_design_tokens(file_key: str, figma_token: str, cache_ttl_seconds: int
     ttl = max(0, int(cache_ttl_seconds))
 
     # Проверяем кеш
-    if ttl > 0 and file_key in _cache:
-        cached = _cache[file_key]
-        if time.time() - cached["timestamp"] < ttl:
+    if ttl > 0:
+        cached = _cache_get(file_key)
+        if cached and time.time() - cached["timestamp"] < ttl:
             return cached["tokens"]
 
     headers = {"X-Figma-Token": figma_token}
@@ -46,18 +80,421 @@ def fetch_design_tokens(file_key: str, figma_token: str, cache_ttl_seconds: int
 
     # Кешируем только при включенном TTL
     if ttl > 0:
-        _cache[file_key] = {"tokens": tokens, "timestamp": time.time()}
+        _cache_set(file_key, tokens)
     else:
-        _cache.pop(file_key, None)
+        _cache_drop(file_key)
 
     return tokens
 
 
+class FigmaClient:
+    """
+    Асинхронный клиент Figma с постоянным пулом соединений.
+
+    Перед полной загрузкой файла делает дешёвую проверку версии
+    (?depth=1): если версия не изменилась, возвращает ранее разобранные
+    токены без скачивания документа и без _parse_tokens.
+
+    extraction=targeted вместо всего документа качает только узлы стилей
+    (из /styles) и фреймы Zone/ (из неглубокого листинга) через /nodes.
+    Результат совпадает с полным разбором, если стили применены к своим
+    узлам-образцам, а зоны лежат не глубже listing_depth.
+    """
+
+    def __init__(
+        self,
+        figma_token: str,
+        base_url: str = FIGMA_API_URL,
+        timeout: float = 30,
+        max_connections: int = 10,
+        extraction: str = EXTRACTION_FULL,
+        listing_depth: int = 2,
+    ):
+        self.extraction = extraction
+        self.listing_depth = max(1, listing_depth)
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"X-Figma-Token": figma_token},
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+        # {file_key: {"version": str, "tokens": {...}}}
+        self._versions: dict = {}
+        self.requests = 0
+        self.bytes_downloaded = 0
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def _get(self, path: str, **params) -> httpx.Response:
+        resp = await self._client.get(path, params=params or None)
+        self.requests += 1
+        self.bytes_downloaded += len(resp.content)
+        return resp
+
+    async def _probe(self, file_key: str, depth: int) -> tuple[str, dict]:
+        resp = await self._get(f"/v1/files/{file_key}", depth=depth)
+        resp.raise_for_status()
+        data = resp.json()
+        return str(data.get("version") or data.get("lastModified") or ""), data
+
+    async def fetch_tokens(self, file_key: str) -> dict:
+        # В targeted-режиме проба версии заодно служит листингом верхних узлов
+        depth = self.listing_depth if self.extraction == EXTRACTION_TARGETED else 1
+        version, listing = await self._probe(file_key, depth=depth)
+        known = self._versions.get(file_key)
+        if version and known and known["version"] == version:
+            return known["tokens"]
+
+        if self.extraction == EXTRACTION_TARGETED:
+            tokens = await self._fetch_targeted(file_key, listing)
+        else:
+            tokens = await self._fetch_full(file_key)
+        self._versions[file_key] = {"version": version, "tokens": tokens}
+        return tokens
+
+    async def _fetch_full(self, file_key: str) -> dict:
+        # Файл и опубликованные стили запрашиваем параллельно
+        resp, styles_resp = await asyncio.gather(
+            self._get(f"/v1/files/{file_key}"),
+            self._get(f"/v1/files/{file_key}/styles"),
+        )
+        resp.raise_for_status()
+        file_data = resp.json()
+        styles_data = styles_resp.json() if styles_resp.status_code == 200 else {}
+
+        return _parse_tokens(file_data, styles_data)
+
+    async def _fetch_targeted(self, file_key: str, listing: dict) -> dict:
+        """
+        Двухшаговое извлечение:
+        1) id узлов стилей из /styles и фреймов Zone/ из листинга;
+        2) только эти узлы через /nodes, разбор по одному узлу.
+        """
+        styles_resp = await self._get(f"/v1/files/{file_key}/styles")
+        styles_resp.raise_for_status()
+        style_meta = styles_resp.json().get("meta", {}).get("styles", [])
+
+        node_ids = [style["node_id"] for style in style_meta if style.get("node_id")]
+        node_ids += _find_zone_ids(listing.get("document", {}))
+        node_ids = list(dict.fromkeys(node_ids))
+
+        tokens = _empty_tokens()
+        styles_map = dict(listing.get("styles", {}))
+        for start in range(0, len(node_ids), NODES_BATCH_SIZE):
+            batch = node_ids[start:start + NODES_BATCH_SIZE]
+            async for node in self._iter_nodes(file_key, batch):
+                styles_map.update(node.get("styles") or {})
+                document = node.get("document")
+                if document:
+                    _walk_tree(document, tokens, styles_map)
+
+        return _apply_default_tokens(tokens)
+
+    async def _iter_nodes(self, file_key: str, ids: list[str]):
+        """
+        Узлы из /nodes в порядке запроса. Ответ скачивается потоком во
+        временный файл; при наличии ijson разбирается по одному узлу,
+        не загружая весь JSON в память.
+        """
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as buffer:
+            async with self._client.stream(
+                "GET", f"/v1/files/{file_key}/nodes", params={"ids": ",".join(ids)}
+            ) as resp:
+                self.requests += 1
+                resp.raise_for_status()
+                async for chunk in resp.aiter_bytes():
+                    self.bytes_downloaded += len(chunk)
+                    buffer.write(chunk)
+            buffer.seek(0)
+
+            if ijson is not None:
+                for _, node in ijson.kvitems(buffer, "nodes", use_float=True):
+                    if node:
+                        yield node
+            else:
+                for node in json.load(buffer).get("nodes", {}).values():
+                    if node:
+                        yield node
+
+    def known_version(self, file_key: str) -> str:
+        known = self._versions.get(file_key)
+        return known["version"] if known else ""
+
+    def remember(self, file_key: str, version: str, tokens: dict):
+        """Запоминает версию (например, из снапшота), чтобы не качать файл повторно."""
+        if version:
+            self._versions[file_key] = {"version": version, "tokens": tokens}
+
+    def forget(self, file_key: Optional[str] = None):
+        """Забывает запомненные версии: следующая загрузка будет полной."""
+        if file_key:
+            self._versions.pop(file_key, None)
+        else:
+            self._versions.clear()
+
+
+def get_client(
+    figma_token: str,
+    base_url: str = FIGMA_API_URL,
+    extraction: str = EXTRACTION_FULL,
+) -> FigmaClient:
+    """Общий клиент для токена доступа (создаётся в текущем event loop)."""
+    client = _clients.get((figma_token, base_url, extraction))
+    if client is None:
+        client = FigmaClient(figma_token, base_url=base_url, extraction=extraction)
+        _clients[(figma_token, base_url, extraction)] = client
+    return client
+
+
+async def close_clients():
+    """Закрывает пулы соединений (при остановке приложения)."""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+class TokenProvider:
+    """
+    Поставщик токенов со stale-while-revalidate и single-flight.
+
+    - моложе ttl_seconds — отдаются из кеша;
+    - старше, но моложе max_stale_seconds — отдаются сразу,
+      а в фоне запускается одно обновление;
+    - кеша нет — запрос ждёт загрузку, и все одновременные промахи
+      по одному file_key ждут одну и ту же загрузку.
+
+    shared — SharedCache, общий для воркеров хоста: токены, загруженные
+    одним процессом, берут остальные, а одновременную загрузку одного
+    file_key выполняет один воркер (аренда), пока другие ждут её результат.
+    """
+
+    def __init__(
+        self,
+        figma_token: str,
+        ttl_seconds: int = 0,
+        max_stale_seconds: int = 86400,
+        base_url: str = FIGMA_API_URL,
+        snapshot_path: Optional[str] = None,
+        extraction: str = EXTRACTION_FULL,
+        shared=None,
+        lease_seconds: float = 60.0,
+    ):
+        self.figma_token = figma_token
+        self.shared = shared
+        self.lease_seconds = lease_seconds
+        self.extraction = extraction
+        self.ttl = max(0, int(ttl_seconds))
+        self.max_stale = max(self.ttl, int(max_stale_seconds))
+        self.base_url = base_url
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else None
+        self._inflight: dict = {}
+        # Последние успешно загруженные токены — фолбэк при недоступной Figma
+        self._last_good: dict = {}
+        # file_key, чьи токены пока только из снапшота: отдаются и старше max_stale
+        self._from_snapshot: set = set()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    async def get(self, file_key: str) -> dict:
+        cached = _cache_get(file_key)
+        if cached is None and self.shared is not None:
+            # Новый воркер: токены, которые уже загрузил другой процесс
+            entry = await asyncio.to_thread(self.shared.get_tokens, file_key)
+            if entry is not None:
+                self._adopt(file_key, entry)
+                cached = _cache_get(file_key)
+        if cached is not None:
+            age = time.time() - cached["timestamp"]
+            if age < self.ttl:
+                self.hits += 1
+                return cached["tokens"]
+            # Снапшот на холодном старте лучше ожидания Figma, даже если он старый
+            if age < self.max_stale or file_key in self._from_snapshot:
+                self.stale_hits += 1
+                self.refresh_in_background(file_key)
+                return cached["tokens"]
+
+        self.misses += 1
+        return await self.refresh(file_key)
+
+    def refresh(self, file_key: str, revalidate: bool = False) -> asyncio.Future:
+        """
+        Запускает загрузку или присоединяется к уже идущей.
+        Отмена ожидающего запроса не прерывает общую загрузку.
+
+        revalidate — явное обновление: версия файла проверяется в Figma,
+        даже если другой воркер недавно положил токены в общий кеш.
+        Кеш при этом не сбрасывается: одновременные запросы получают
+        текущие токены, а неизменённая версия стоит одной лёгкой пробы.
+        """
+        return asyncio.shield(self._start(file_key, revalidate))
+
+    def _start(self, file_key: str, revalidate: bool = False) -> asyncio.Task:
+        task = self._inflight.get(file_key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(file_key, revalidate))
+            self._inflight[file_key] = task
+            task.add_done_callback(lambda done: self._forget(file_key, done))
+        return task
+
+    def _forget(self, file_key: str, task: asyncio.Future):
+        if self._inflight.get(file_key) is task:
+            del self._inflight[file_key]
+        if not task.cancelled() and task.exception() is not None:
+            self.refresh_errors += 1
+            logger.warning("Не удалось обновить токены %s: %r", file_key, task.exception())
+
+    def refresh_in_background(self, file_key: str):
+        # Ошибку фоновой загрузки разбирает _forget, stale-токены остаются в кеше
+        self._start(file_key)
+
+    async def _fetch(self, file_key: str, revalidate: bool = False) -> dict:
+        if self.shared is None:
+            return await self._fetch_figma(file_key)
+
+        started = time.time()
+        retry = False
+        while True:
+            # Другой воркер обновил токены, пока мы ждали, — берём их
+            entry = await asyncio.to_thread(self.shared.get_tokens, file_key)
+            fresh = entry is not None and (
+                entry["saved_at"] >= started
+                or (not revalidate and started - entry["saved_at"] < self.ttl)
+            )
+            if fresh:
+                self._adopt(file_key, entry)
+                return entry["tokens"]
+            owner = await asyncio.to_thread(
+                self.shared.acquire, f"tokens:{file_key}", self.lease_seconds, retry
+            )
+            retry = True
+            if owner is not None:
+                break
+            await asyncio.sleep(0.1)
+            if time.time() - started > self.lease_seconds:
+                # Держатель аренды завис — загружаем сами
+                owner = None
+                break
+
+        try:
+            tokens = await self._fetch_figma(file_key)
+            client = get_client(self.figma_token, self.base_url, self.extraction)
+            await asyncio.to_thread(
+                self.shared.put_tokens, file_key, tokens, client.known_version(file_key)
+            )
+            return tokens
+        finally:
+            if owner is not None:
+                await asyncio.to_thread(self.shared.release, f"tokens:{file_key}", owner)
+
+    def _adopt(self, file_key: str, entry: dict):
+        """Токены из общего кеша — как свои, с временем их загрузки."""
+        tokens = entry["tokens"]
+        with _cache_lock:
+            _cache[file_key] = {"tokens": tokens, "timestamp": entry["saved_at"]}
+        self._last_good[file_key] = tokens
+        self._from_snapshot.discard(file_key)
+        if entry["version"]:
+            client = get_client(self.figma_token, self.base_url, self.extraction)
+            client.remember(file_key, entry["version"], tokens)
+
+    async def _fetch_figma(self, file_key: str) -> dict:
+        self.refreshes += 1
+        client = get_client(self.figma_token, self.base_url, self.extraction)
+        tokens = await client.fetch_tokens(file_key)
+        _cache_set(file_key, tokens)
+        self._last_good[file_key] = tokens
+        self._from_snapshot.discard(file_key)
+
+        # Снапшот переписывается и при неизменной версии: его saved_at —
+        # время последней успешной проверки, иначе после перезапуска
+        # снапшот неделями не менявшихся токенов считался бы просроченным
+        if self.snapshot_path is not None:
+            try:
+                await asyncio.to_thread(
+                    save_snapshot,
+                    self.snapshot_path,
+                    file_key,
+                    tokens,
+                    client.known_version(file_key),
+                )
+            except OSError as exc:
+                logger.warning("Не удалось сохранить снапшот токенов: %r", exc)
+        return tokens
+
+    def last_known(self, file_key: str) -> Optional[dict]:
+        """Последние известные рабочие токены (из Figma или снапшота)."""
+        return self._last_good.get(file_key)
+
+    def load_snapshot(self, file_key: str) -> bool:
+        """
+        Подхватывает снапшот с диска до первого запроса.
+        Токены попадают в кеш с временем сохранения снапшота, поэтому
+        первый же запрос получает их сразу и запускает фоновое обновление —
+        даже если снапшот старше max_stale.
+        """
+        if self.snapshot_path is None:
+            return False
+        snapshot = load_snapshot(self.snapshot_path, file_key)
+        if snapshot is None:
+            return False
+
+        tokens = snapshot["tokens"]
+        with _cache_lock:
+            _cache[file_key] = {"tokens": tokens, "timestamp": snapshot["saved_at"]}
+        self._last_good[file_key] = tokens
+        self._from_snapshot.add(file_key)
+        client = get_client(self.figma_token, self.base_url, self.extraction)
+        client.remember(file_key, snapshot["version"], tokens)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "inflight": len(self._inflight),
+        }
+
+
 def _parse_tokens(file_data: dict, styles_data: dict) -> dict:
     """
     Парсит данные Figma и извлекает токены дизайн-системы.
     """
-    tokens = {
+    tokens = _empty_tokens()
+
+    # Обходим дерево документа
+    document = file_data.get("document", {})
+    _walk_tree(document, tokens, file_data.get("styles", {}))
+
+    return _apply_default_tokens(tokens)
+
+
+def _find_zone_ids(node: dict) -> list[str]:
+    """id фреймов Zone/ в (обрезанном) дереве."""
+    zone_ids = []
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if current.get("type") == "FRAME" and current.get("name", "").startswith("Zone/"):
+            zone_ids.append(current["id"])
+        stack.extend(reversed(current.get("children", [])))
+    return zone_ids
+
+
+def _empty_tokens() -> dict:
+    return {
         "colors": {},
         "typography": {},
         "layout": {
@@ -70,10 +507,8 @@ def _parse_tokens(file_data: dict, styles_data: dict) -> dict:
         "zones": {},
     }
 
-    # Обходим дерево документа
-    document = file_data.get("document", {})
-    _walk_tree(document, tokens, file_data.get("styles", {}))
 
+def _apply_default_tokens(tokens: dict) -> dict:
     # Дефолтные токены, если из Figma ничего не пришло
     if not tokens["colors"]:
         tokens["colors"] = {
@@ -129,70 +564,179 @@ def _parse_tokens(file_data: dict, styles_data: dict) -> dict:
     return tokens
 
 
-def _walk_tree(node: dict, tokens: dict, styles_map: dict):
+# Типы стилей Figma, из которых извлекаются токены
+TOKEN_STYLE_TYPES = ("FILL", "TEXT")
+
+
+def _style_index(styles_map: dict) -> dict:
+    """
+    style_id → нормализованное имя токена ("Accent/Primary" → "accent_primary").
+    Считается один раз на обход, а не на каждом узле. Пустые имена пропускаются.
+    """
+    index = {}
+    for style_id, style_info in styles_map.items():
+        style_name = style_info.get("name", "").lower().replace("/", "_").replace(" ", "_")
+        if style_name:
+            index[style_id] = style_name
+    return index
+
+
+def _walk_tree(
+    node: dict,
+    tokens: dict,
+    styles_map: dict,
+    style_index: Optional[dict] = None,
+    stop_when_complete: bool = False,
+) -> bool:
     """
-    Рекурсивно обходит дерево документа Figma,
-    извлекая цвета, типографику и зоны.
+    Обходит дерево документа Figma (в глубину, явным стеком — без рекурсии),
+    извлекая цвета, типографику и зоны. Порядок обхода тот же, что у
+    рекурсивного: при повторах стиля побеждает последний узел.
+
+    stop_when_complete: закончить обход, как только каждый стиль заливки
+    и текста (FILL, TEXT) из styles_map получил значение; стили эффектов
+    и сеток токенов не дают и остановку не держат. Зоны после этой точки
+    не собираются, а значение повторяющегося стиля — от последнего узла
+    до остановки, а не во всём файле: режим для файлов, где все применения
+    стиля одинаковы. Возвращает True, если обход остановлен досрочно.
     """
-    node_name = node.get("name", "")
-    node_type = node.get("type", "")
-
-    # Извлекаем зоны (Frame с именем Zone/...)
-    if node_name.startswith("Zone/") and node_type == "FRAME":
-        zone_name = node_name.split("/")[1].lower()
-        bbox = node.get("absoluteBoundingBox", {})
-        tokens["zones"][zone_name] = {
-            "x": bbox.get("x", 0),
-            "y": bbox.get("y", 0),
-            "width": bbox.get("width", 0),
-            "height": bbox.get("height", 0),
+    if style_index is None:
+        style_index = _style_index(styles_map)
+    colors = tokens["colors"]
+    typography = tokens["typography"]
+    zones = tokens["zones"]
+
+    # Стили, которые ещё не получили значение (для досрочной остановки)
+    pending = None
+    if stop_when_complete:
+        pending = {
+            style_id for style_id in style_index
+            if styles_map[style_id].get("styleType") in TOKEN_STYLE_TYPES
         }
+        if not pending:
+            pending = None
+
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        node_name = node.get("name", "")
+        node_type = node.get("type", "")
+        node_styles = node.get("styles") or {}
+
+        # Извлекаем зоны (Frame с именем Zone/...)
+        if node_type == "FRAME" and node_name.startswith("Zone/"):
+            zone_name = node_name.split("/")[1].lower()
+            bbox = node.get("absoluteBoundingBox", {})
+            zones[zone_name] = {
+                "x": bbox.get("x", 0),
+                "y": bbox.get("y", 0),
+                "width": bbox.get("width", 0),
+                "height": bbox.get("height", 0),
+            }
 
-    # Извлекаем цвета из стилей
-    if "fills" in node:
-        for fill in node.get("fills", []):
-            if fill.get("type") == "SOLID":
-                color_data = fill.get("color", {})
+        # Извлекаем цвета из стилей: значение даёт последняя SOLID-заливка
+        fill_style = node_styles.get("fill")
+        if fill_style in style_index:
+            solid = None
+            for fill in node.get("fills") or []:
+                if fill.get("type") == "SOLID":
+                    solid = fill
+            if solid is not None:
+                color_data = solid.get("color", {})
                 r = int(color_data.get("r", 0) * 255)
                 g = int(color_data.get("g", 0) * 255)
                 b = int(color_data.get("b", 0) * 255)
-                hex_color = f"#{r:02x}{g:02x}{b:02x}"
-
-                # Проверяем, есть ли стиль для этого элемента
-                style_id = node.get("styles", {}).get("fill")
-                if style_id and style_id in styles_map:
-                    style_info = styles_map[style_id]
-                    style_name = style_info.get("name", "").lower().replace("/", "_").replace(" ", "_")
-                    if style_name:
-                        tokens["colors"][style_name] = hex_color
-
-    # Извлекаем типографику
-    if "style" in node and node_type == "TEXT":
-        text_style = node["style"]
-        style_id = node.get("styles", {}).get("text")
-        style_name = None
-
-        if style_id and style_id in styles_map:
-            style_info = styles_map[style_id]
-            style_name = style_info.get("name", "").lower().replace("/", "_").replace(" ", "_")
+                colors[style_index[fill_style]] = f"#{r:02x}{g:02x}{b:02x}"
+                if pending is not None:
+                    pending.discard(fill_style)
+
+        # Извлекаем типографику
+        if node_type == "TEXT" and "style" in node:
+            text_style_id = node_styles.get("text")
+            if text_style_id in style_index:
+                text_style = node["style"]
+                typography[style_index[text_style_id]] = {
+                    "family": text_style.get("fontFamily", "Inter"),
+                    "weight": text_style.get("fontWeight", 400),
+                    "size": text_style.get("fontSize", 16),
+                    "line_height": text_style.get("lineHeightPercentFontSize", 140) / 100,
+                    "letter_spacing": text_style.get("letterSpacing", 0),
+                }
+                if pending is not None:
+                    pending.discard(text_style_id)
+
+        if pending is not None and not pending:
+            return True
+
+        # Дочерние элементы — в стек в обратном порядке, чтобы обход шёл слева направо
+        children = node.get("children")
+        if children:
+            stack.extend(reversed(children))
+
+    return False
 
-        if style_name:
-            tokens["typography"][style_name] = {
-                "family": text_style.get("fontFamily", "Inter"),
-                "weight": text_style.get("fontWeight", 400),
-                "size": text_style.get("fontSize", 16),
-                "line_height": text_style.get("lineHeightPercentFontSize", 140) / 100,
-                "letter_spacing": text_style.get("letterSpacing", 0),
-            }
 
-    # Рекурсия по дочерним элементам
-    for child in node.get("children", []):
-        _walk_tree(child, tokens, styles_map)
+def save_snapshot(path, file_key: str, tokens: dict, version: str = ""):
+    """Атомарно сохраняет разобранные токены в JSON-снапшот."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    snapshot = {
+        "format": SNAPSHOT_FORMAT,
+        "file_key": file_key,
+        "version": version,
+        "saved_at": time.time(),
+        "tokens": tokens,
+    }
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except OSError:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
+def load_snapshot(path, file_key: str) -> Optional[dict]:
+    """Читает снапшот; None, если его нет, он битый или от другого файла/формата."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(snapshot, dict):
+        return None
+    if snapshot.get("format") != SNAPSHOT_FORMAT or snapshot.get("file_key") != file_key:
+        return None
+    if not isinstance(snapshot.get("tokens"), dict):
+        return None
+    snapshot.setdefault("version", "")
+    snapshot.setdefault("saved_at", 0.0)
+    return snapshot
+
+
+def _cache_get(file_key: str) -> Optional[dict]:
+    with _cache_lock:
+        return _cache.get(file_key)
+
+
+def _cache_set(file_key: str, tokens: dict):
+    with _cache_lock:
+        _cache[file_key] = {"tokens": tokens, "timestamp": time.time()}
+
+
+def _cache_drop(file_key: str):
+    with _cache_lock:
+        _cache.pop(file_key, None)
 
 
 def invalidate_cache(file_key: Optional[str] = None):
     """Очищает кеш токенов."""
-    if file_key:
-        _cache.pop(file_key, None)
-    else:
-        _cache.clear()
+    with _cache_lock:
+        if file_key:
+            _cache.pop(file_key, None)
+        else:
+            _cache.clear()
+    for client in list(_clients.values()):
+        client.forget(file_key)
@@ -0,0 +1,128 @@
+"""
+Шрифты из репозитория: начертания Inter из static/fonts регистрируются
+через @font-face один раз на процесс, в общем FontConfiguration рендерера.
+Так PDF не зависит от шрифтов системы, а локальная сборка и контейнер
+дают одинаковый результат. Если файлов нет — как раньше, Inter ищет fontconfig.
+
+    python -m fonts    # код 1, если нет начертаний, нужных шаблонам (проверка сборки)
+"""
+
+import logging
+import os
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+FONT_FAMILY = "Inter"
+FONTS_DIR = Path(os.getenv("FONTS_DIR") or Path(__file__).parent / "static" / "fonts")
+
+# Имя начертания в файле (Inter-SemiBold.ttf) → вес
+WEIGHTS = {
+    "thin": 100,
+    "extralight": 200,
+    "light": 300,
+    "regular": 400,
+    "medium": 500,
+    "semibold": 600,
+    "bold": 700,
+    "extrabold": 800,
+    "black": 900,
+}
+
+# Веса, которые используют шаблоны и дефолтные токены
+REQUIRED_WEIGHTS = (400, 500, 600, 800)
+
+# Формат для src: format(...) в @font-face
+FORMATS = {".otf": "opentype", ".ttf": "truetype", ".woff2": "woff2", ".woff": "woff"}
+# PDF: несжатые форматы, без распаковки при каждой загрузке; браузер: самые лёгкие
+PDF_FORMATS = (".otf", ".ttf", ".woff", ".woff2")
+WEB_FORMATS = (".woff2", ".woff", ".ttf", ".otf")
+
+
+@dataclass(frozen=True)
+class FontFace:
+    path: Path
+    weight: int
+    style: str  # normal | italic
+
+    @property
+    def format(self) -> str:
+        return FORMATS[self.path.suffix.lower()]
+
+
+def discover_faces(fonts_dir: Path = FONTS_DIR, preference: tuple = PDF_FORMATS) -> list[FontFace]:
+    """
+    Начертания Inter в каталоге: по одному файлу на (вес, стиль),
+    формат — первый доступный из preference.
+    """
+    best: dict[tuple, FontFace] = {}
+    for path in sorted(Path(fonts_dir).glob(f"{FONT_FAMILY}-*")):
+        suffix = path.suffix.lower()
+        if suffix not in preference:
+            continue
+        name = path.stem.split("-", 1)[1].lower()
+        style = "italic" if name.endswith("italic") else "normal"
+        weight = WEIGHTS.get(name.removesuffix("italic") or "regular")
+        if weight is None:
+            # Вариативные шрифты (InterVariable.ttf) WeasyPrint по весам не различает
+            continue
+        face = FontFace(path, weight, style)
+        current = best.get((weight, style))
+        if current is None or preference.index(suffix) < preference.index(current.path.suffix.lower()):
+            best[(weight, style)] = face
+    return [best[key] for key in sorted(best)]
+
+
+def font_face_css(faces: list[FontFace], url_for) -> str:
+    """@font-face для каждого начертания; url_for(face) → URL файла."""
+    rules = []
+    for face in faces:
+        rules.append(
+            "@font-face {\n"
+            f"  font-family: '{FONT_FAMILY}';\n"
+            f"  src: url('{url_for(face)}') format('{face.format}');\n"
+            f"  font-weight: {face.weight};\n"
+            f"  font-style: {face.style};\n"
+            "}"
+        )
+    return "\n".join(rules)
+
+
+def pdf_font_css(fonts_dir: Path = FONTS_DIR) -> str:
+    """CSS для рендерера: файлы подключаются по file:// URI."""
+    faces = discover_faces(fonts_dir, PDF_FORMATS)
+    if not faces:
+        logger.warning("В %s нет файлов %s-*: шрифт ищет fontconfig системы", fonts_dir, FONT_FAMILY)
+    return font_face_css(faces, lambda face: face.path.resolve().as_uri())
+
+
+def web_font_css(fonts_dir: Path = FONTS_DIR, url_prefix: str = "/static/fonts") -> str:
+    """CSS для веб-интерфейса: те же файлы через /static."""
+    faces = discover_faces(fonts_dir, WEB_FORMATS)
+    return font_face_css(faces, lambda face: f"{url_prefix}/{face.path.name}")
+
+
+def missing_weights(fonts_dir: Path = FONTS_DIR, required: tuple = REQUIRED_WEIGHTS) -> list[int]:
+    """Веса из required, для которых в каталоге нет прямого начертания."""
+    present = {face.weight for face in discover_faces(fonts_dir, PDF_FORMATS) if face.style == "normal"}
+    return [weight for weight in required if weight not in present]
+
+
+def fonts_fingerprint(fonts_dir: Path = FONTS_DIR) -> list:
+    """Имена и размеры файлов шрифтов — входят в версию шаблонов для кеша PDF."""
+    return [(face.path.name, face.path.stat().st_size) for face in discover_faces(fonts_dir)]
+
+
+if __name__ == "__main__":
+    missing = missing_weights()
+    if missing:
+        print(
+            f"В {FONTS_DIR} нет начертаний {FONT_FAMILY} с весами {', '.join(map(str, missing))}: "
+            "PDF будет собран шрифтами системы",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+    for face in discover_faces():
+        print(f"{face.weight} {face.style}: {face.path.name}")
@@ -0,0 +1,105 @@
+"""
+Локальное хранилище фоновых задач рендера.
+Задача создаётся сразу, рендер идёт в фоне, клиент опрашивает статус
+и забирает PDF отдельным запросом. Готовые результаты живут result_ttl секунд.
+"""
+
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Optional
+
+# Статусы задачи
+QUEUED = "queued"
+PARSING = "parsing"
+RENDERING = "rendering"
+DONE = "done"
+FAILED = "failed"
+
+FINISHED = (DONE, FAILED)
+
+
+@dataclass
+class Job:
+    id: str
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    slides: int = 0  # сколько слайдов разобрано
+    pages: int = 0  # сколько страниц разложено
+    pages_total: int = 0  # сколько страниц ожидается (оценка до рендера)
+    error: str = ""
+    result: Optional[bytes] = None
+    task: Optional[asyncio.Task] = None
+
+    def update(self, **changes):
+        for name, value in changes.items():
+            setattr(self, name, value)
+        self.updated_at = time.time()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "slides": self.slides,
+            "pages": self.pages,
+            "pages_total": self.pages_total,
+            "error": self.error,
+            "size": len(self.result) if self.result is not None else 0,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class JobLimitReached(Exception):
+    """Слишком много задач одновременно хранится в памяти."""
+
+
+class JobStore:
+    """
+    Задачи в памяти процесса.
+
+    result_ttl — сколько секунд хранится завершённая задача с результатом.
+    max_jobs — сколько задач (любых статусов) может храниться одновременно.
+    """
+
+    def __init__(self, result_ttl: int = 600, max_jobs: int = 100):
+        self.result_ttl = max(1, result_ttl)
+        self.max_jobs = max(1, max_jobs)
+        self._jobs: dict[str, Job] = {}
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def create(self) -> Job:
+        self.cleanup()
+        if len(self._jobs) >= self.max_jobs:
+            raise JobLimitReached()
+        job = Job(id=uuid.uuid4().hex)
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def cleanup(self) -> int:
+        """Удаляет завершённые задачи старше result_ttl. Возвращает число удалённых."""
+        deadline = time.time() - self.result_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and job.updated_at < deadline
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        return len(expired)
+
+    async def cleanup_loop(self, interval: float = 30):
+        """Периодическая очистка; запускается задачей на время жизни приложения."""
+        while True:
+            await asyncio.sleep(interval)
+            self.cleanup()
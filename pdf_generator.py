@@ -2,69 +2,598 @@
 Генератор PDF: рендерит Jinja2-шаблоны и конвертирует в PDF через WeasyPrint.
 """
 
+import hashlib
 import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from io import BytesIO
 from pathlib import Path
-from jinja2 import Environment, FileSystemLoader
-from weasyprint import HTML, CSS
-from weasyprint.text.fonts import FontConfiguration
+from typing import TYPE_CHECKING, Optional
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 
+from assets import EXTERNAL_DENY, AssetFetcher
 from content_parser import Slide
+from fonts import FONTS_DIR, fonts_fingerprint, pdf_font_css
+from result_cache import stable_hash
+from text_fit import fit_slides
+
+if TYPE_CHECKING:
+    # WeasyPrint импортируется при создании рендерера: сборка без рендера
+    # (проверка манифеста build_decks) не тратит время на Pango и cairo
+    from weasyprint import CSS
+    from weasyprint.document import Document
 
 TEMPLATES_DIR = Path(__file__).parent / "templates"
 STATIC_DIR = Path(__file__).parent / "static"
 
+# Поднимать при изменениях генератора, которые не видны в файлах шаблонов
+RENDERER_REVISION = "3"
+
+
+@lru_cache(maxsize=1)
+def template_version() -> str:
+    """
+    Версия шаблонов: хеш содержимого templates/, набора шрифтов и ревизии генератора.
+    Входит в ключ кеша результатов — правка шаблона инвалидирует старые PDF.
+    """
+    digest = hashlib.sha256(RENDERER_REVISION.encode())
+    digest.update(repr(fonts_fingerprint()).encode())
+    for path in sorted(TEMPLATES_DIR.rglob("*")):
+        if path.is_file():
+            digest.update(path.relative_to(TEMPLATES_DIR).as_posix().encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+# Дефолтные токены: если Figma недоступна и снапшота нет
+DEFAULT_TOKENS = {
+    "colors": {
+        "background": "#2c2c2c",
+        "text_primary": "#f5f5f5",
+        "text_muted": "rgba(255,255,255,0.6)",
+        "border": "#383838",
+        "accent_primary": "#4F9EF8",
+        "factoid_red": "#E85D5D",
+        "factoid_yellow": "#F0A500",
+        "factoid_cyan": "#4DD0E1",
+        "factoid_green": "#14ae5c",
+        "factoid_purple": "#A78BFA",
+    },
+    "typography": {
+        "title_hero": {"family": "Inter", "weight": 800, "size": 88, "line_height": 1.1, "letter_spacing": -2.5},
+        "subtitle": {"family": "Inter", "weight": 400, "size": 26, "line_height": 1.55, "letter_spacing": 0},
+        "body": {"family": "Inter", "weight": 400, "size": 16, "line_height": 1.4, "letter_spacing": 0},
+        "factoid_number": {"family": "Inter", "weight": 800, "size": 72, "line_height": 1.0, "letter_spacing": -2},
+        "factoid_label": {"family": "Inter", "weight": 500, "size": 18, "line_height": 1.4, "letter_spacing": 0},
+    },
+    "layout": {"slide_width": 1920, "slide_height": 1080, "margin": 64},
+}
+
+
+PAGE_CSS = """
+@page {
+    size: 1920px 1080px;
+    margin: 0;
+}
+html, body {
+    margin: 0;
+    padding: 0;
+}
+"""
+
+
+class Renderer:
+    """
+    Долгоживущий рендерер: создаётся один раз на процесс.
+
+    Держит скомпилированные шаблоны (с кешем байткода Jinja2),
+    таблицу лейаутов, общий FontConfiguration, разобранный @page CSS,
+    LRU разобранных стилей слайдов по отпечатку токенов
+    и ресурсы static/ в памяти (AssetFetcher) с кешем разобранных картинок.
+    WeasyPrint и Pango не потокобезопасны, поэтому рендер под локом;
+    параллелизм — через процессы пула, у каждого свой Renderer.
+    """
+
+    def __init__(
+        self,
+        templates_dir: Path = TEMPLATES_DIR,
+        static_dir: Path = STATIC_DIR,
+        bytecode_cache_dir: Optional[str] = None,
+        asset_cache_bytes: int = 16 * 1024 * 1024,
+        external_fetch: str = EXTERNAL_DENY,
+        external_timeout: float = 3.0,
+        stylesheet_cache_size: int = 8,
+    ):
+        self.templates_dir = Path(templates_dir)
+
+        # Настройка Jinja2: шаблоны не меняются на лету, auto_reload не нужен
+        self.env = Environment(
+            loader=FileSystemLoader(str(self.templates_dir)),
+            autoescape=False,
+            auto_reload=False,
+            bytecode_cache=FileSystemBytecodeCache(bytecode_cache_dir),
+        )
+        self.template = self.env.get_template("base_slide.html")
+        self.stylesheet_template = self.env.get_template("slide.css")
+
+        # Таблица лейаутов: имя → скомпилированный шаблон
+        self.layouts = {
+            path.stem: self.env.get_template(f"layouts/{path.name}")
+            for path in sorted((self.templates_dir / "layouts").glob("*.html"))
+        }
+
+        # Ресурсы static/ (логотип, шрифты) читаются с диска один раз;
+        # file:// вне этих каталогов и внешние URL отклоняются политикой
+        self.fetcher = AssetFetcher(
+            [Path(static_dir), self.templates_dir, FONTS_DIR],
+            max_bytes=asset_cache_bytes,
+            external=external_fetch,
+            external_timeout=external_timeout,
+        )
+        self.fetcher.preload(Path(static_dir))
+        # Разобранные картинки (SVG логотипа) переиспользуются между рендерами
+        self.image_cache: dict = {}
+
+        # Путь к логотипу
+        logo_path = Path(static_dir).resolve() / "logo.svg"
+        self.logo_uri = logo_path.as_uri() if logo_path.exists() else ""
+
+        # Шрифты из static/fonts грузятся в FontConfiguration один раз
+        # и переиспользуются всеми рендерами процесса
+        from weasyprint import CSS
+        from weasyprint.text.fonts import FontConfiguration
+
+        self.font_config = FontConfiguration()
+        self.page_css = CSS(
+            string=PAGE_CSS + pdf_font_css(),
+            font_config=self.font_config,
+            url_fetcher=self.fetcher,
+        )
+
+        # Стили слайдов из токенов: отпечаток токенов → разобранный CSS.
+        # Токены меняются редко, поэтому CSS не разбирается в каждом рендере
+        self.stylesheet_cache_size = max(1, stylesheet_cache_size)
+        self._stylesheets: OrderedDict[str, "CSS"] = OrderedDict()
+        self.stylesheet_hits = 0
+        self.stylesheet_misses = 0
+
+        self._lock = threading.Lock()
+
+    def stylesheet(self, tokens: dict) -> "CSS":
+        """Разобранный CSS слайдов для токенов; собирается один раз на отпечаток."""
+        key = tokens_fingerprint(tokens)
+        with self._lock:
+            css = self._stylesheets.get(key)
+            if css is not None:
+                self._stylesheets.move_to_end(key)
+                self.stylesheet_hits += 1
+                return css
+            self.stylesheet_misses += 1
+            from weasyprint import CSS
+
+            css = CSS(
+                string=self.stylesheet_css(tokens),
+                font_config=self.font_config,
+                url_fetcher=self.fetcher,
+            )
+            self._stylesheets[key] = css
+            while len(self._stylesheets) > self.stylesheet_cache_size:
+                self._stylesheets.popitem(last=False)
+            return css
+
+    def stylesheet_css(self, tokens: dict) -> str:
+        """Текст CSS слайдов из tokens["colors"] и tokens["typography"]."""
+        return self.stylesheet_template.render(
+            colors=tokens.get("colors") or {},
+            typography=tokens.get("typography") or {},
+        )
+
+    def stylesheet_stats(self) -> dict:
+        return {
+            "hits": self.stylesheet_hits,
+            "misses": self.stylesheet_misses,
+            "items": len(self._stylesheets),
+        }
+
+    def render_html(self, slides: list[Slide], tokens: dict) -> str:
+        # Текст, который не помещается в лейаут, уходит на слайды-продолжения
+        return self.template.render(
+            slides=fit_slides(slides, tokens.get("typography")),
+            tokens=tokens,
+            layouts=self.layouts,
+            logo_path=self.logo_uri,
+        )
+
+    def render_document(self, slides: list[Slide], tokens: dict) -> "Document":
+        """Рендерит слайды через base_slide.html и раскладывает страницы (без записи PDF)."""
+        return self.layout(self.render_html(slides, tokens), self.stylesheet(tokens))
+
+    def layout(self, html_content: str, stylesheet: "CSS") -> "Document":
+        """Раскладка готового HTML в страницы WeasyPrint со стилями из stylesheet()."""
+        from weasyprint import HTML
+
+        with self._lock:
+            return HTML(
+                string=html_content,
+                base_url=str(self.templates_dir),
+                url_fetcher=self.fetcher,
+            ).render(
+                stylesheets=[self.page_css, stylesheet],
+                font_config=self.font_config,
+                presentational_hints=True,
+                cache=self.image_cache,
+            )
+
+    def write_document(self, document: "Document", target=None) -> Optional[bytes]:
+        """Байты PDF, либо запись в target (путь или файловый объект) без буфера в памяти."""
+        with self._lock:
+            # WeasyPrint 62 и так встраивает только использованные глифы (full_fonts=False)
+            return document.write_pdf(target)
+
+    def write_pdf(self, slides: list[Slide], tokens: dict) -> bytes:
+        return self.write_document(self.render_document(slides, tokens))
+
+
+_renderer: Optional[Renderer] = None
+_renderer_pid: Optional[int] = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer() -> Renderer:
+    """
+    Рендерер текущего процесса. Создаётся лениво;
+    после fork пересоздаётся, чтобы не делить состояние Pango с родителем.
+    """
+    global _renderer, _renderer_pid
+    pid = os.getpid()
+    if _renderer is None or _renderer_pid != pid:
+        with _renderer_lock:
+            if _renderer is None or _renderer_pid != pid:
+                _renderer = Renderer(
+                    bytecode_cache_dir=os.getenv("JINJA_BYTECODE_CACHE_DIR") or None,
+                    asset_cache_bytes=_env_int("ASSET_CACHE_MB", 16) * 1024 * 1024,
+                    external_fetch=os.getenv("EXTERNAL_FETCH", EXTERNAL_DENY).strip().lower(),
+                    external_timeout=_env_int("EXTERNAL_FETCH_TIMEOUT", 3),
+                    stylesheet_cache_size=_env_int("STYLESHEET_CACHE_SIZE", 8),
+                )
+                _renderer_pid = pid
+    return _renderer
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(0, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def tokens_fingerprint(tokens: dict) -> str:
+    """Отпечаток токенов, от которых зависят стили слайдов."""
+    return stable_hash({"colors": tokens.get("colors") or {}, "typography": tokens.get("typography") or {}})
+
+
+def warm_up():
+    """Инициализатор воркеров пула: рендерер готов до первого запроса."""
+    get_renderer()
+
+
+def render_document(slides: list[Slide], tokens: dict) -> "Document":
+    """Раскладывает страницы рендерером текущего процесса."""
+    return get_renderer().render_document(slides, tokens)
+
 
 def generate_pdf(slides: list[Slide], tokens: dict) -> bytes:
     """
     Принимает список слайдов и дизайн-токены.
     Возвращает байты PDF-файла.
     """
-    # Настройка Jinja2
-    env = Environment(
-        loader=FileSystemLoader(str(TEMPLATES_DIR)),
-        autoescape=False,
-    )
+    return get_renderer().write_pdf(slides, tokens)
 
-    template = env.get_template("base_slide.html")
 
-    # Путь к логотипу
-    logo_path = STATIC_DIR / "logo.svg"
-    logo_uri = logo_path.as_uri() if logo_path.exists() else ""
+class SlidePageCache:
+    """
+    LRU разложенных страниц по хешу слайда.
+    Хранит Document целиком: страницы ссылаются на его шрифты.
+    """
 
-    # Рендерим HTML
-    html_content = template.render(
-        slides=slides,
-        tokens=tokens,
-        logo_path=logo_uri,
-    )
+    def __init__(self, max_slides: int):
+        self.max_slides = max(0, max_slides)
+        self._documents: OrderedDict[str, "Document"] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
 
-    # Конвертируем в PDF
-    font_config = FontConfiguration()
+    def get(self, key: str) -> Optional["Document"]:
+        with self._lock:
+            document = self._documents.get(key)
+            if document is None:
+                self.misses += 1
+                return None
+            self._documents.move_to_end(key)
+            self.hits += 1
+            return document
 
-    page_css = CSS(
-        string="""
-        @page {
-            size: 1920px 1080px;
-            margin: 0;
-        }
-        html, body {
-            margin: 0;
-            padding: 0;
+    def put(self, key: str, document: "Document"):
+        if self.max_slides == 0:
+            return
+        with self._lock:
+            self._documents[key] = document
+            self._documents.move_to_end(key)
+            while len(self._documents) > self.max_slides:
+                self._documents.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+
+# Кеш живёт в процессе: у каждого воркера пула свой
+slide_cache = SlidePageCache(max(0, int(os.getenv("SLIDE_CACHE_SIZE", "256") or 0)))
+
+
+def slide_key(slide: Slide, tokens_fingerprint: str) -> str:
+    """Ключ кеша страниц: содержимое слайда + отпечаток токенов и шаблонов."""
+    return stable_hash(
+        {
+            "slide": asdict(slide),
+            "tokens": tokens_fingerprint,
+            "template": template_version(),
         }
-        """,
-        font_config=font_config,
     )
 
-    pdf_bytes = HTML(
-        string=html_content,
-        base_url=str(TEMPLATES_DIR),
-    ).write_pdf(
-        stylesheets=[page_css],
-        font_config=font_config,
-        presentational_hints=True,
+
+def render_document_per_slide(
+    slides: list[Slide],
+    tokens: dict,
+    cache: Optional[SlidePageCache] = None,
+) -> "Document":
+    """
+    Раскладывает каждый слайд отдельным документом и собирает из страниц один.
+    Неизменённые слайды берутся из кеша без повторной раскладки.
+    """
+    if not slides:
+        return render_document(slides, tokens)
+    if cache is None:
+        cache = slide_cache
+    fingerprint = stable_hash(tokens)
+
+    documents = []
+    for slide in slides:
+        key = slide_key(slide, fingerprint)
+        document = cache.get(key)
+        if document is None:
+            document = render_document([slide], tokens)
+            cache.put(key, document)
+        documents.append(document)
+
+    pages = [page for document in documents for page in document.pages]
+    return documents[0].copy(pages)
+
+
+def generate_pdf_per_slide(
+    slides: list[Slide],
+    tokens: dict,
+    cache: Optional[SlidePageCache] = None,
+) -> bytes:
+    """
+    Рендерит каждый слайд отдельным документом и собирает PDF из страниц.
+    Итоговый файл пишется одним проходом (pydyf внутри WeasyPrint),
+    поэтому шрифты и метаданные общие, а страницы совпадают с generate_pdf.
+    """
+    document = render_document_per_slide(slides, tokens, cache)
+    return get_renderer().write_document(document)
+
+
+def generate_pdf_with_pages(
+    slides: list[Slide],
+    tokens: dict,
+    per_slide: bool = False,
+) -> tuple[bytes, int]:
+    """PDF и число разложенных страниц (для отчёта о прогрессе задач)."""
+    if per_slide:
+        document = render_document_per_slide(slides, tokens)
+    else:
+        document = render_document(slides, tokens)
+    return get_renderer().write_document(document), len(document.pages)
+
+
+class SpoolTarget:
+    """
+    Приёмник для write_pdf: держит PDF в памяти до max_memory байт,
+    а при превышении переливает его в именованный файл в spool_dir.
+    Файл переживает воркер, поэтому родитель отдаёт его клиенту с диска.
+    """
+
+    def __init__(self, max_memory: int, spool_dir: Optional[str] = None):
+        self.max_memory = max(0, max_memory)
+        self.spool_dir = spool_dir
+        self.size = 0
+        self.head = b""
+        self._chunks: list[bytes] = []
+        self._file = None
+
+    @property
+    def path(self) -> Optional[str]:
+        return self._file.name if self._file is not None else None
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        if len(self.head) < 8:
+            self.head = (self.head + data)[:8]
+        self.size += len(data)
+        if self._file is None and self.size > self.max_memory:
+            self._file = tempfile.NamedTemporaryFile(
+                dir=self.spool_dir, prefix="pdf-", suffix=".pdf", delete=False
+            )
+            self._file.writelines(self._chunks)
+            self._chunks.clear()
+        if self._file is not None:
+            self._file.write(data)
+        else:
+            self._chunks.append(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.size
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+    def discard(self):
+        """Удаляет файл, если рендер не удался."""
+        self.close()
+        if self.path is not None:
+            Path(self.path).unlink(missing_ok=True)
+
+    def getvalue(self) -> Optional[bytes]:
+        return b"".join(self._chunks) if self._file is None else None
+
+
+@dataclass
+class SpooledPdf:
+    """
+    Результат рендера из воркера: небольшой PDF — байтами (data),
+    большой — файлом на диске (path), который удаляет получатель.
+    """
+
+    size: int
+    pages: int
+    head: bytes
+    data: Optional[bytes] = None
+    path: Optional[str] = None
+    # Секунды по стадиям внутри воркера: template, stylesheet, layout, write
+    timings: dict = field(default_factory=dict)
+    # Обращения к ресурсам за этот рендер: hits, misses, refused, external_fetches
+    assets: dict = field(default_factory=dict)
+
+
+def generate_pdf_spooled(
+    slides: list[Slide],
+    tokens: dict,
+    max_memory: int,
+    spool_dir: Optional[str] = None,
+    per_slide: bool = False,
+) -> SpooledPdf:
+    """
+    Пишет PDF прямо в SpoolTarget: ни воркер, ни родитель не держат
+    в памяти документ больше max_memory байт.
+    """
+    timings = {}
+    assets_before = get_renderer().fetcher.stats()
+    start = time.perf_counter()
+    if per_slide:
+        # Шаблон и раскладка идут по слайду вперемешку — одной стадией
+        document = render_document_per_slide(slides, tokens)
+    else:
+        renderer = get_renderer()
+        html_content = renderer.render_html(slides, tokens)
+        timings["template"] = time.perf_counter() - start
+        start = time.perf_counter()
+        stylesheet = renderer.stylesheet(tokens)
+        timings["stylesheet"] = time.perf_counter() - start
+        start = time.perf_counter()
+        document = renderer.layout(html_content, stylesheet)
+    timings["layout"] = time.perf_counter() - start
+
+    def write(target) -> int:
+        get_renderer().write_document(document, target)
+        return len(document.pages)
+
+    start = time.perf_counter()
+    result = _spool(write, max_memory, spool_dir)
+    timings["write"] = time.perf_counter() - start
+    result.timings = timings
+    assets_after = get_renderer().fetcher.stats()
+    result.assets = {
+        name: assets_after[name] - assets_before[name]
+        for name in ("hits", "misses", "refused", "external_fetches")
+    }
+    return result
+
+
+def _spool(write, max_memory: int, spool_dir: Optional[str]) -> SpooledPdf:
+    """write(target) пишет PDF в SpoolTarget и возвращает число страниц."""
+    target = SpoolTarget(max_memory, spool_dir)
+    try:
+        pages = write(target)
+        target.close()
+    except BaseException:
+        target.discard()
+        raise
+    return SpooledPdf(
+        size=target.size,
+        pages=pages,
+        head=target.head,
+        data=target.getvalue(),
+        path=target.path,
     )
 
-    return pdf_bytes
+
+def split_chunks(slides: list[Slide], parts: int) -> list[list[Slide]]:
+    """Делит слайды на parts смежных частей почти равного размера, порядок сохраняется."""
+    parts = max(1, min(parts, len(slides)))
+    size, extra = divmod(len(slides), parts)
+    chunks, start = [], 0
+    for i in range(parts):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(slides[start:end])
+        start = end
+    return chunks
+
+
+def chunk_count(slide_count: int, min_chunk_slides: int, max_parts: int) -> int:
+    """На сколько частей делить дек: не мельче min_chunk_slides и не больше max_parts."""
+    if slide_count <= 0:
+        return 1
+    # Вниз: при делении вверх остаток давал части меньше минимума (5 слайдов по 3 → 3 + 2)
+    return max(1, min(max_parts, slide_count // max(1, min_chunk_slides)))
+
+
+def _merge_into(parts: list, target) -> int:
+    # pypdf нужен только режиму chunked: pydyf умеет писать PDF, но не читать
+    from pypdf import PdfReader, PdfWriter
+
+    writer = PdfWriter()
+    metadata = None
+    for part in parts:
+        # Часть — байты PDF или путь к файлу частей из SpoolTarget
+        reader = PdfReader(BytesIO(part) if isinstance(part, bytes) else part)
+        if metadata is None:
+            metadata = reader.metadata
+        writer.append(reader)
+    # Все части собраны одним рендерером с одинаковыми шрифтами;
+    # метаданные документа берутся из первой части
+    if metadata:
+        writer.add_metadata(dict(metadata))
+    writer.write(target)
+    return len(writer.pages)
+
+
+def merge_pdfs(parts: list[bytes]) -> bytes:
+    """Склеивает PDF частей дека в один документ в заданном порядке."""
+    buffer = BytesIO()
+    _merge_into(parts, buffer)
+    return buffer.getvalue()
+
+
+def merge_pdfs_spooled(
+    parts: list,
+    max_memory: int,
+    spool_dir: Optional[str] = None,
+) -> SpooledPdf:
+    """merge_pdfs с выводом в SpoolTarget, как generate_pdf_spooled."""
+    start = time.perf_counter()
+    result = _spool(lambda target: _merge_into(parts, target), max_memory, spool_dir)
+    result.timings = {"merge": time.perf_counter() - start}
+    return result
 
 
 def generate_pdf_to_file(slides: list[Slide], tokens: dict, output_path: str):
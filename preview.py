@@ -0,0 +1,83 @@
+"""
+Живой предпросмотр: состояние одной WebSocket-сессии.
+Клиент присылает Markdown целиком, сессия сравнивает новый список слайдов
+с тем, что клиент уже получил, и отдаёт на рендер только изменённые слайды.
+Пока идёт рендер, новые правки не копятся: обрабатывается только последняя.
+"""
+
+import asyncio
+from typing import Optional
+
+from content_parser import Slide
+from pdf_generator import slide_key
+
+
+class PreviewLimitExceeded(Exception):
+    """Правка превышает лимиты сессии (размер Markdown или число слайдов)."""
+
+
+class PreviewSession:
+    """
+    Одна сессия предпросмотра.
+
+    max_markdown_bytes — максимальный размер присланного Markdown.
+    max_slides — максимальное число слайдов в деке.
+    В памяти хранятся только последний текст и хеши слайдов,
+    которые уже есть у клиента, — не больше max_slides штук.
+    """
+
+    def __init__(self, max_markdown_bytes: int, max_slides: int):
+        self.max_markdown_bytes = max(1, max_markdown_bytes)
+        self.max_slides = max(1, max_slides)
+        self.latest_seq = 0
+        self.rendered = 0
+        self.reused = 0
+        self._known: set[str] = set()
+        self._markdown: Optional[str] = None
+        self._changed = asyncio.Event()
+
+    def submit(self, seq: int, markdown: str):
+        """Новая правка от клиента; заменяет ещё не обработанную."""
+        if len(markdown.encode("utf-8")) > self.max_markdown_bytes:
+            raise PreviewLimitExceeded(
+                f"Markdown больше {self.max_markdown_bytes // 1024} КБ"
+            )
+        self.latest_seq = seq
+        self._markdown = markdown
+        self._changed.set()
+
+    async def next_edit(self) -> tuple[int, str]:
+        """Ждёт правку и возвращает (seq, markdown) последней из них."""
+        await self._changed.wait()
+        self._changed.clear()
+        return self.latest_seq, self._markdown
+
+    def superseded(self, seq: int) -> bool:
+        """Пришла более новая правка — результат для seq уже не нужен."""
+        return self._changed.is_set() and self.latest_seq != seq
+
+    def diff(self, slides: list[Slide], tokens_fingerprint: str) -> tuple[list[str], list[int]]:
+        """
+        Ключи слайдов нового дека и индексы слайдов, которых у клиента нет.
+        Одинаковые слайды рендерятся один раз.
+        """
+        if len(slides) > self.max_slides:
+            raise PreviewLimitExceeded(f"Больше {self.max_slides} слайдов")
+
+        keys = [slide_key(slide, tokens_fingerprint) for slide in slides]
+        # Клиент держит только слайды текущего дека, остальные он освобождает
+        self._known &= set(keys)
+
+        changed, seen = [], set()
+        for index, key in enumerate(keys):
+            if key in self._known or key in seen:
+                continue
+            seen.add(key)
+            changed.append(index)
+
+        self.reused += len(keys) - len(changed)
+        return keys, changed
+
+    def mark_sent(self, key: str):
+        self._known.add(key)
+        self.rendered += 1
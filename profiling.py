@@ -0,0 +1,126 @@
+"""
+Профилирование одного рендера по запросу.
+Рендер выполняется под cProfile в воркере пула, результат — разбивка
+по фазам WeasyPrint, самые дорогие функции и время каждого слайда
+отдельно, чтобы найти патологический слайд на реальном входе.
+"""
+
+import cProfile
+import os
+import pstats
+import time
+import uuid
+from typing import Optional
+
+from content_parser import Slide
+from pdf_generator import get_renderer
+
+# Фазы WeasyPrint 62: фаза → (функция, фрагмент пути модуля).
+# Берётся накопленное время функции (cumulative) из статистики cProfile,
+# поэтому имя должно быть единственным в модуле: у html5lib и функция
+# модуля, и метод HTMLParser называются parse — берём HTMLParser._parse.
+WEASYPRINT_PHASES = (
+    ("html_parse", "_parse", "html5lib/html5parser"),
+    ("style_cascade", "get_all_computed_styles", "weasyprint/css/__init__"),
+    ("box_tree", "build_formatting_structure", "weasyprint/formatting_structure/build"),
+    ("layout", "layout_document", "weasyprint/layout/__init__"),
+    ("draw", "draw_page", "weasyprint/draw"),
+    ("pdf_write", "generate_pdf", "weasyprint/pdf/__init__"),
+)
+
+
+def weasyprint_phases(stats: pstats.Stats) -> dict:
+    """Секунды по фазам WeasyPrint из статистики cProfile."""
+    phases = {name: 0.0 for name, _, _ in WEASYPRINT_PHASES}
+    for (filename, _, funcname), (_, _, _, cumulative, _) in stats.stats.items():
+        path = filename.replace(os.sep, "/")
+        for name, function, module in WEASYPRINT_PHASES:
+            if funcname == function and module in path:
+                phases[name] += cumulative
+    # generate_pdf включает отрисовку страниц — оставляем только сериализацию
+    phases["pdf_write"] = max(0.0, phases["pdf_write"] - phases["draw"])
+    return phases
+
+
+def top_functions(stats: pstats.Stats, limit: int) -> list[dict]:
+    """Самые дорогие функции по накопленному времени."""
+    rows = []
+    for (filename, lineno, funcname), (_, calls, own, cumulative, _) in stats.stats.items():
+        rows.append({
+            "function": f"{funcname} ({os.path.basename(filename)}:{lineno})",
+            "calls": calls,
+            "own_seconds": own,
+            "cumulative_seconds": cumulative,
+        })
+    rows.sort(key=lambda row: row["cumulative_seconds"], reverse=True)
+    return rows[:limit]
+
+
+def profile_render(
+    slides: list[Slide],
+    tokens: dict,
+    profile_dir: Optional[str] = None,
+    top: int = 30,
+) -> dict:
+    """
+    Рендерит дек под cProfile и возвращает отчёт.
+    profile_dir — куда сохранить .prof для snakeviz/pstats (None — не сохранять).
+    Время под профайлером завышено, важны пропорции.
+    """
+    renderer = get_renderer()
+    stages = {}
+    profiler = cProfile.Profile()
+
+    profiler.enable()
+    try:
+        start = time.perf_counter()
+        html_content = renderer.render_html(slides, tokens)
+        stages["template"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        stylesheet = renderer.stylesheet(tokens)
+        stages["stylesheet"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        document = renderer.layout(html_content, stylesheet)
+        stages["layout"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pdf_bytes = renderer.write_document(document)
+        stages["write"] = time.perf_counter() - start
+    finally:
+        profiler.disable()
+
+    stats = pstats.Stats(profiler)
+
+    # Каждый слайд отдельно и без профайлера: виден самый дорогой
+    slide_timings = []
+    for index, slide in enumerate(slides):
+        start = time.perf_counter()
+        renderer.render_document([slide], tokens)
+        slide_timings.append({
+            "index": index,
+            "title": slide.title,
+            "layout": slide.layout,
+            "seconds": time.perf_counter() - start,
+        })
+    slowest = sorted(slide_timings, key=lambda item: item["seconds"], reverse=True)
+
+    profile_file = None
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+        profile_file = os.path.join(profile_dir, f"generate-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.prof")
+        stats.dump_stats(profile_file)
+
+    return {
+        "slides": len(slides),
+        "pages": len(document.pages),
+        "pdf_bytes": len(pdf_bytes),
+        "stages": stages,
+        "weasyprint_phases": weasyprint_phases(stats),
+        "slowest_slides": slowest[:10],
+        "top_functions": top_functions(stats, top),
+        "assets": renderer.fetcher.stats(),
+        "stylesheets": renderer.stylesheet_stats(),
+        "profile_file": profile_file,
+    }
@@ -0,0 +1,145 @@
+"""
+Пул процессов для рендеринга PDF.
+WeasyPrint нагружает CPU на секунды, поэтому рендер выносится из event loop
+в отдельные процессы. Очередь ожидания ограничена: при переполнении
+запрос сразу получает отказ, а не висит до таймаута прокси.
+Упавший воркер (segfault в Pango/cairo) ломает весь ProcessPoolExecutor —
+пул пересоздаётся, отказ получают только запросы, бывшие в работе.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RenderQueueFull(Exception):
+    """Все воркеры заняты и очередь ожидания заполнена."""
+
+
+class RenderWorkerCrashed(Exception):
+    """Процесс воркера упал во время рендера; пул уже пересоздан."""
+
+
+def available_cpus() -> int:
+    """Число ядер, доступных процессу (учитывает affinity контейнера)."""
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return max(1, os.cpu_count() or 1)
+
+
+class RenderPool:
+    """
+    Ограниченный пул процессов.
+
+    workers — сколько рендеров идёт параллельно.
+    queue_size — сколько запросов может ждать свободного воркера.
+    initializer — вызывается в каждом воркере при старте (прогрев).
+    Всё, что сверх workers + queue_size, отклоняется через RenderQueueFull.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        queue_size: int,
+        initializer: Optional[Callable] = None,
+    ):
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.initializer = initializer
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Счётчики меняются только из event loop, поэтому лок не нужен
+        self._pending = 0
+        self.restarts = 0
+
+    @property
+    def pending(self) -> int:
+        """Запросы в работе и в очереди."""
+        return self._pending
+
+    @property
+    def queued(self) -> int:
+        """Запросы, ожидающие свободного воркера."""
+        return max(0, self._pending - self.workers)
+
+    @property
+    def free_slots(self) -> int:
+        """Сколько ещё запросов примет пул до RenderQueueFull."""
+        return max(0, self.workers + self.queue_size - self._pending)
+
+    def start(self):
+        if self._executor is None:
+            # spawn: воркеры не наследуют потоки и состояние event loop родителя
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=self.initializer,
+            )
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        """Заменяет сломанный пул; остальные запросы с тем же пулом его уже не трогают."""
+        if self._executor is not broken:
+            return
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self.restarts += 1
+        self.start()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def run(
+        self,
+        fn: Callable,
+        *args,
+        check_limit: bool = True,
+        on_orphan: Optional[Callable] = None,
+    ):
+        """
+        Выполняет fn(*args) в воркере и ждёт результат.
+        Бросает RenderQueueFull, если очередь заполнена, и RenderWorkerCrashed,
+        если воркер упал (пул при этом пересоздаётся с прогревом).
+        check_limit=False — для продолжения уже принятого запроса
+        (например, склейки частей), которое нельзя отклонить на полпути.
+        on_orphan(result) — для результатов с побочным эффектом (временный
+        файл): если ожидание отменили, а воркер уже рендерит, результат
+        передаётся в on_orphan, когда воркер закончит, а не теряется.
+        """
+        if check_limit and self._pending >= self.workers + self.queue_size:
+            raise RenderQueueFull()
+
+        self.start()
+        executor = self._executor
+        self._pending += 1
+        try:
+            future = executor.submit(fn, *args)
+            try:
+                return await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                # Ещё в очереди — отменится; уже в работе — досчитается без нас
+                if on_orphan is not None and not future.cancel():
+                    future.add_done_callback(lambda done: _hand_over(done, on_orphan))
+                raise
+        except BrokenProcessPool as exc:
+            self._restart(executor)
+            raise RenderWorkerCrashed() from exc
+        finally:
+            self._pending -= 1
+
+
+def _hand_over(future, on_orphan: Callable):
+    """Результат отменённого ожидания — в on_orphan (из потока пула)."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    try:
+        on_orphan(future.result())
+    except Exception:
+        logger.exception("Не удалось убрать результат отменённого рендера")
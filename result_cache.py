@@ -0,0 +1,275 @@
+"""
+Кеш готовых PDF по содержимому.
+Ключ — хеш слайдов, токенов и версии шаблонов: одинаковый Markdown
+с теми же токенами отдаётся без повторного рендера.
+
+Уровни:
+- память: LRU с ограничением по байтам;
+- диск (опционально): каталог с файлами <ключ>.pdf и бюджетом по байтам;
+- общий кеш воркеров хоста (опционально): SharedCache в SQLite.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import asdict
+from pathlib import Path
+from typing import Optional
+
+from content_parser import Slide
+
+
+def stable_hash(value) -> str:
+    """sha256 канонического JSON: порядок ключей не влияет на результат."""
+    payload = json.dumps(
+        value,
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cache_key(slides: list[Slide], tokens: dict, template_version: str) -> str:
+    """Канонический хеш входа рендера."""
+    return stable_hash(
+        {
+            "slides": [asdict(slide) for slide in slides],
+            "tokens": tokens,
+            "template": template_version,
+        }
+    )
+
+
+class ResultCache:
+    """
+    Двухуровневый кеш PDF.
+
+    memory_max_bytes — бюджет LRU в памяти (0 — уровень выключен).
+    disk_dir / disk_max_bytes — каталог и бюджет дискового уровня
+    (disk_dir=None — уровень выключен).
+    shared — SharedCache, общий для воркеров: PDF, отрендеренный одним
+    процессом, достаётся остальным (None — уровень выключен).
+    """
+
+    def __init__(
+        self,
+        memory_max_bytes: int,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: int = 0,
+        shared=None,
+    ):
+        self.memory_max_bytes = max(0, memory_max_bytes)
+        self.disk_max_bytes = max(0, disk_max_bytes)
+        self.disk_dir = Path(disk_dir) if disk_dir and self.disk_max_bytes > 0 else None
+        self.shared = shared if shared is not None and shared.stores_results else None
+
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        # _lock — только словарь памяти и счётчики; файлы пишутся и сканируются без него
+        self._lock = threading.Lock()
+        # Один проход вытеснения с диска за раз
+        self._evict_lock = threading.Lock()
+
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._disk_bytes = sum(p.stat().st_size for p in self.disk_dir.glob("*.pdf"))
+
+    @property
+    def enabled(self) -> bool:
+        return self.memory_max_bytes > 0 or self.disk_dir is not None or self.shared is not None
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return data
+
+        # Диск и общий кеш читаются без блокировки: медленное чтение PDF
+        # не задерживает попадания в память у других потоков
+        from_disk = True
+        data = self._disk_get(key)
+        if data is None and self.shared is not None:
+            from_disk = False
+            data = self.shared.get_result(key)
+
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self._memory_put(key, data)
+            self.hits += 1
+            if from_disk:
+                self.disk_hits += 1
+            else:
+                self.shared_hits += 1
+        return data
+
+    def contains(self, key: str) -> bool:
+        """Есть ли PDF на любом уровне — без чтения и без счётчиков."""
+        with self._lock:
+            if key in self._memory:
+                return True
+        if self.disk_dir is not None and self._disk_path(key).exists():
+            return True
+        return self.shared is not None and self.shared.has_result(key)
+
+    def put(self, key: str, data: bytes):
+        with self._lock:
+            self._memory_put(key, data)
+        self._disk_put(key, data)
+        if self.shared is not None:
+            self.shared.put_result(key, data)
+
+    def put_file(self, key: str, path: str):
+        """
+        Кладёт готовый PDF-файл в дисковый и общий уровни: копия идёт
+        с диска на диск, файл не читается в память целиком.
+        """
+        if self.shared is not None:
+            self.shared.put_result_file(key, path)
+        if self.disk_dir is None:
+            return
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        self._disk_store(key, size, lambda f: _copy_into(path, f))
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self.disk_dir is not None:
+                for path in self.disk_dir.glob("*.pdf"):
+                    path.unlink(missing_ok=True)
+                self._disk_bytes = 0
+        if self.shared is not None:
+            self.shared.clear_results()
+
+    def stats(self) -> dict:
+        shared_bytes = self.shared.stats()["result_bytes"] if self.shared is not None else 0
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "memory_items": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk_bytes,
+                "shared_bytes": shared_bytes,
+            }
+
+    # ── Память ──
+
+    def _memory_put(self, key: str, data: bytes):
+        if len(data) > self.memory_max_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    # ── Диск ──
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / f"{key}.pdf"
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        # mtime служит меткой последнего использования для вытеснения
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def _disk_put(self, key: str, data: bytes):
+        if self.disk_dir is None:
+            return
+        self._disk_store(key, len(data), lambda f: f.write(data))
+
+    def _disk_store(self, key: str, size: int, write):
+        if size > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        if path.exists():
+            return
+
+        # Атомарная запись: читатель не увидит недописанный файл
+        fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except OSError:
+            Path(tmp_path).unlink(missing_ok=True)
+            return
+
+        with self._lock:
+            self._disk_bytes += size
+            over_budget = self._disk_bytes > self.disk_max_bytes
+        if over_budget:
+            self._disk_evict()
+
+    def _disk_evict(self):
+        """
+        Скан каталога и удаление давно не использованных файлов — без _lock:
+        попадания в память не ждут диска. Проходы идут по одному.
+        """
+        with self._evict_lock:
+            with self._lock:
+                if self._disk_bytes <= self.disk_max_bytes:
+                    # Пока ждали, другой проход уже уложился в бюджет
+                    return
+                counted = self._disk_bytes
+
+            entries = []
+            for path in self.disk_dir.glob("*.pdf"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            entries.sort()
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.disk_max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+            with self._lock:
+                # Файлы, записанные во время скана, могли в него не попасть — учитываем их
+                self._disk_bytes = total + max(0, self._disk_bytes - counted)
+
+def _copy_into(path: str, target):
+    with open(path, "rb") as source:
+        shutil.copyfileobj(source, target, 1024 * 1024)
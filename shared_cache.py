@@ -0,0 +1,300 @@
+"""
+Общий кеш воркеров одного хоста в SQLite (режим WAL).
+
+Несколько процессов uvicorn/gunicorn видят одни и те же:
+- снапшоты токенов Figma — обновил один воркер, остальные берут готовые;
+- готовые PDF — с бюджетом по байтам и вытеснением давно не использованных;
+- аренды (lease) — межпроцессный single-flight: загрузку токенов или рендер
+  одного дека выполняет один воркер, остальные ждут его результат.
+
+Каждая запись — одна транзакция SQLite: читатель не увидит недописанный PDF.
+Большие PDF из файлов пишутся кусками через blob I/O, без копии в памяти.
+
+Общий кеш — ускорение, а не источник истины: занятая дольше busy_timeout
+или повреждённая база даёт промах (и работу без аренды), а не ошибку запроса.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tokens (
+    file_key TEXT PRIMARY KEY,
+    tokens TEXT NOT NULL,
+    version TEXT NOT NULL DEFAULT '',
+    saved_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    used_at REAL NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_used_at ON results (used_at);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+# Кусок blob I/O при записи и чтении PDF
+BLOB_CHUNK = 1024 * 1024
+
+# Токен аренды при ошибке базы: вызывающий работает сам, как без общего кеша
+NO_LEASE = ""
+
+logger = logging.getLogger(__name__)
+
+
+class SharedCache:
+    """
+    path — файл базы, общий для всех воркеров; max_result_bytes — бюджет PDF
+    (0 — PDF не хранятся, остаются токены и аренды).
+    Соединение своё у каждого процесса и открывается заново после fork.
+    """
+
+    def __init__(self, path: str, max_result_bytes: int = 0, busy_timeout: float = 5.0):
+        self.path = Path(path)
+        self.max_result_bytes = max(0, max_result_bytes)
+        self.busy_timeout = busy_timeout
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.lease_waits = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self._db().executescript(SCHEMA)
+
+    def _db(self) -> sqlite3.Connection:
+        """Соединение процесса; вызывается под self._lock."""
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+    # ── Токены ──
+
+    def get_tokens(self, file_key: str) -> Optional[dict]:
+        """{"tokens", "version", "saved_at"} или None."""
+        try:
+            with self._lock:
+                row = self._db().execute(
+                    "SELECT tokens, version, saved_at FROM tokens WHERE file_key = ?", (file_key,)
+                ).fetchone()
+        except sqlite3.Error as exc:
+            _log_failure("чтение токенов", exc)
+            return None
+        if row is None:
+            return None
+        try:
+            tokens = json.loads(row[0])
+        except ValueError:
+            return None
+        return {"tokens": tokens, "version": row[1], "saved_at": row[2]}
+
+    def put_tokens(self, file_key: str, tokens: dict, version: str = "", saved_at: Optional[float] = None):
+        payload = json.dumps(tokens, ensure_ascii=False)
+        try:
+            with self._lock:
+                self._db().execute(
+                    "INSERT OR REPLACE INTO tokens (file_key, tokens, version, saved_at) VALUES (?, ?, ?, ?)",
+                    (file_key, payload, version, time.time() if saved_at is None else saved_at),
+                )
+        except sqlite3.Error as exc:
+            _log_failure("запись токенов", exc)
+
+    def drop_tokens(self, file_key: Optional[str] = None):
+        try:
+            with self._lock:
+                if file_key:
+                    self._db().execute("DELETE FROM tokens WHERE file_key = ?", (file_key,))
+                else:
+                    self._db().execute("DELETE FROM tokens")
+        except sqlite3.Error as exc:
+            _log_failure("сброс токенов", exc)
+
+    # ── Готовые PDF ──
+
+    @property
+    def stores_results(self) -> bool:
+        return self.max_result_bytes > 0
+
+    def has_result(self, key: str) -> bool:
+        if not self.stores_results:
+            return False
+        try:
+            with self._lock:
+                return self._db().execute("SELECT 1 FROM results WHERE key = ?", (key,)).fetchone() is not None
+        except sqlite3.Error as exc:
+            _log_failure("проверка PDF", exc)
+            return False
+
+    def get_result(self, key: str) -> Optional[bytes]:
+        if not self.stores_results:
+            return None
+        with self._lock:
+            try:
+                db = self._db()
+                row = db.execute("SELECT rowid, size FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    # used_at — метка последнего использования для вытеснения
+                    db.execute("UPDATE results SET used_at = ? WHERE rowid = ?", (time.time(), row[0]))
+                    with db.blobopen("results", "data", row[0], readonly=True) as blob:
+                        data = blob.read()
+                    self.hits += 1
+                    return data
+            except sqlite3.Error as exc:
+                _log_failure("чтение PDF", exc)
+            self.misses += 1
+            return None
+
+    def put_result(self, key: str, data: bytes):
+        self._store_result(key, len(data), lambda blob: blob.write(data))
+
+    def put_result_file(self, key: str, path: str):
+        """PDF из файла: копируется в базу кусками, не читается в память целиком."""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+
+        def write(blob):
+            copied = 0
+            with open(path, "rb") as source:
+                while chunk := source.read(BLOB_CHUNK):
+                    # Файл вырос — запись за пределы blob бросает ValueError
+                    blob.write(chunk)
+                    copied += len(chunk)
+            if copied != size:
+                # Файл уменьшился: хвост blob остался бы нулями
+                raise ValueError(f"скопировано {copied} байт из {size}")
+
+        self._store_result(key, size, write)
+
+    def _store_result(self, key: str, size: int, write):
+        if not self.stores_results or size > self.max_result_bytes:
+            return
+        with self._lock:
+            db = None
+            try:
+                db = self._db()
+                # Вставка и запись тела — одна транзакция: либо PDF целиком, либо ничего
+                db.execute("BEGIN IMMEDIATE")
+                if db.execute("SELECT 1 FROM results WHERE key = ?", (key,)).fetchone() is not None:
+                    db.execute("ROLLBACK")
+                    return
+                cursor = db.execute(
+                    "INSERT INTO results (key, size, used_at, data) VALUES (?, ?, ?, zeroblob(?))",
+                    (key, size, time.time(), size),
+                )
+                with db.blobopen("results", "data", cursor.lastrowid) as blob:
+                    write(blob)
+                self._evict(db)
+                db.execute("COMMIT")
+            except (OSError, ValueError, sqlite3.Error) as exc:
+                # ValueError — файл изменил размер во время копирования
+                _log_failure("запись PDF", exc)
+                try:
+                    if db is not None and db.in_transaction:
+                        db.execute("ROLLBACK")
+                except sqlite3.Error:
+                    pass
+
+    def _evict(self, db: sqlite3.Connection):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_result_bytes:
+            return
+        for rowid, size in db.execute("SELECT rowid, size FROM results ORDER BY used_at").fetchall():
+            if total <= self.max_result_bytes:
+                break
+            db.execute("DELETE FROM results WHERE rowid = ?", (rowid,))
+            total -= size
+
+    def clear_results(self):
+        try:
+            with self._lock:
+                self._db().execute("DELETE FROM results")
+        except sqlite3.Error as exc:
+            _log_failure("очистка PDF", exc)
+
+    # ── Аренды (межпроцессный single-flight) ──
+
+    def acquire(self, name: str, ttl: float, retry: bool = False) -> Optional[str]:
+        """
+        Берёт аренду name на ttl секунд; возвращает токен владельца или None,
+        если аренду держит другой. Просроченная аренда (упавший воркер) перехватывается.
+        retry — повторная попытка того же ожидания: lease_waits считает ожидания, а не опросы.
+        Ошибка базы — NO_LEASE: вызывающий работает сам, без аренды.
+        """
+        owner = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            try:
+                cursor = self._db().execute(
+                    "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                    "WHERE leases.expires_at < ?",
+                    (name, owner, now + ttl, now),
+                )
+            except sqlite3.Error as exc:
+                _log_failure("аренда", exc)
+                return NO_LEASE
+            if cursor.rowcount == 1:
+                return owner
+            if not retry:
+                self.lease_waits += 1
+            return None
+
+    def release(self, name: str, owner: str):
+        if owner == NO_LEASE:
+            return
+        try:
+            with self._lock:
+                self._db().execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+        except sqlite3.Error as exc:
+            # Аренда истечёт сама через ttl
+            _log_failure("снятие аренды", exc)
+
+    def stats(self) -> dict:
+        try:
+            with self._lock:
+                count, size = self._db().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+                ).fetchone()
+        except sqlite3.Error as exc:
+            _log_failure("статистика", exc)
+            count, size = 0, 0
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "lease_waits": self.lease_waits,
+            "result_items": count,
+            "result_bytes": size,
+        }
+
+
+def _log_failure(operation: str, exc: Exception):
+    logger.warning("Общий кеш недоступен (%s): %r", operation, exc)
@@ -0,0 +1,161 @@
+"""Тест: допуск запросов — token bucket, построчные лимиты и ответы middleware."""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from admission import Admission, AdmissionMiddleware, AdmissionRejected, TokenBucket, TrustedProxies
+
+
+def test_token_bucket_refills_at_rate():
+    bucket = TokenBucket(rate=2.0, burst=3, now=0.0)
+    assert [bucket.take(0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take(0.0) == pytest.approx(0.5)
+    assert not bucket.full(0.5)
+    assert bucket.take(0.5) == 0.0
+    # Пополнение не выше burst
+    assert bucket.full(10.0)
+    assert [bucket.take(10.0) for _ in range(4)][-1] > 0
+
+
+def test_check_markdown_counts_slides_and_factoids():
+    admission = Admission(max_slides=2, max_factoids=2)
+    admission.check_markdown("Вступление\n\n# Первый\n---\n**10** — стран\n**20** — городов")
+
+    with pytest.raises(AdmissionRejected) as exc:
+        admission.check_markdown("Вступление\n# Первый\n# Второй")
+    assert exc.value.reason == "slides" and exc.value.status_code == 413
+
+    with pytest.raises(AdmissionRejected) as exc:
+        admission.check_markdown("# Слайд\n**1** — a\n**2** — b\n**3** — c")
+    assert exc.value.reason == "factoids"
+    # Счётчик факт-карточек сбрасывается на каждом слайде
+    admission.check_markdown("# A\n**1** — a\n**2** — b\n# B\n**3** — c\n**4** — d")
+    assert admission.rejected["slides"] == admission.rejected["factoids"] == 1
+
+
+def test_trusted_proxies_pick_client_address():
+    assert not TrustedProxies("")
+    assert TrustedProxies("").client("10.0.0.1", "1.2.3.4") == "10.0.0.1"
+
+    one_hop = TrustedProxies("*")
+    # Левее адреса, добавленного прокси, клиент может написать что угодно
+    assert one_hop.client("10.0.0.1", "6.6.6.6, 1.2.3.4") == "1.2.3.4"
+    assert one_hop.client("10.0.0.1", None) == "10.0.0.1"
+
+    listed = TrustedProxies("10.0.0.0/8, 192.168.1.5")
+    assert listed.client("10.0.0.1", "6.6.6.6, 1.2.3.4, 192.168.1.5") == "1.2.3.4"
+    assert listed.client("8.8.8.8", "1.2.3.4") == "8.8.8.8"
+
+
+class _App:
+    """ASGI-приложение: читает тело целиком и ждёт release перед ответом."""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.release.set()
+        self.started = 0
+
+    async def __call__(self, scope, receive, send):
+        self.started += 1
+        while True:
+            message = await receive()
+            if not message.get("more_body"):
+                break
+        await self.release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def _call(middleware, path="/generate", body=b"x", chunked=False, client="1.1.1.1", headers=()):
+    headers = list(headers)
+    if not chunked:
+        headers.append((b"content-length", str(len(body)).encode()))
+    scope = {"type": "http", "method": "POST", "path": path, "headers": headers,
+             "client": (client, 1234)}
+    chunks = [body[i:i + 4] for i in range(0, len(body), 4)] or [b""]
+    messages = [{"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    try:
+        await middleware(scope, receive, send)
+    except Exception as exc:
+        # Обрыв тела без Content-Length FastAPI превращает в ответ с кодом исключения
+        return exc.status_code, {}
+    start = sent[0]
+    return start["status"], dict(start["headers"])
+
+
+def test_middleware_rejects_large_body_with_413():
+    app = _App()
+    middleware = AdmissionMiddleware(app, Admission(max_body_bytes=8), {"/generate": None})
+
+    async def scenario():
+        return [
+            await _call(middleware, body=b"x" * 8),
+            await _call(middleware, body=b"x" * 9),
+            await _call(middleware, body=b"x" * 9, chunked=True),
+        ]
+
+    (ok, _), (declared, _), (streamed, _) = asyncio.run(scenario())
+    assert (ok, declared, streamed) == (200, 413, 413)
+    # С Content-Length приложение даже не вызывается
+    assert app.started == 2
+
+
+def test_middleware_rate_limit_and_concurrency_429():
+    app = _App()
+    admission = Admission(rate_per_minute=60, burst=2, max_concurrent=1)
+    middleware = AdmissionMiddleware(
+        app, admission, {"/generate": None, "/jobs": None}, retry_after=3,
+        own_slots=("/jobs",), trusted_proxies=TrustedProxies("*"),
+    )
+
+    async def scenario():
+        app.release.clear()
+        first = asyncio.create_task(_call(middleware, client="1.1.1.1"))
+        await asyncio.sleep(0.01)
+        busy = await _call(middleware, client="2.2.2.2")
+        # /jobs занимает место сам: middleware его не держит и не отказывает
+        jobs = asyncio.create_task(_call(middleware, path="/jobs", client="3.3.3.3"))
+        await asyncio.sleep(0.01)
+        app.release.set()
+        results = [await first, busy, await jobs]
+
+        # Ведро на клиента из X-Forwarded-For, а не на адрес прокси
+        forwarded = [(b"x-forwarded-for", b"5.5.5.5")]
+        for _ in range(3):
+            results.append(await _call(middleware, client="10.0.0.1", headers=forwarded))
+        results.append(await _call(middleware, client="10.0.0.1", headers=[(b"x-forwarded-for", b"6.6.6.6")]))
+        return results
+
+    first, busy, jobs, *_, limited, other = asyncio.run(scenario())
+    assert first[0] == 200 and jobs[0] == 200
+    assert busy[0] == 429 and busy[1][b"retry-after"] == b"3"
+    assert limited[0] == 429 and other[0] == 200
+    assert admission.rejected["concurrency"] == 1 and admission.rejected["rate_limit"] == 1
+    assert admission.in_flight == 0
+
+
+def test_try_acquire_and_release():
+    admission = Admission(max_concurrent=1)
+    assert admission.try_acquire()
+    assert not admission.try_acquire()
+    with pytest.raises(AdmissionRejected):
+        with admission.slot():
+            pass
+    admission.release()
+    with admission.slot():
+        assert admission.in_flight == 1
+    assert admission.in_flight == 0 and admission.admitted == 2
@@ -0,0 +1,40 @@
+"""Тест: потоковый ZIP пакетной генерации и имена PDF в архиве."""
+
+import io
+import json
+import os
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from batch import ZipStream, manifest_bytes, pdf_name
+
+
+def test_zip_stream_chunks_form_valid_archive():
+    archive = ZipStream()
+    chunks = [archive.add("a.pdf", b"%PDF-a"), archive.add("b.pdf", b"%PDF-b" * 1000)]
+    entries = [{"status": "ok", "file": "a.pdf"}, {"status": "error", "error": "boom"}]
+    chunks.append(archive.add("manifest.json", manifest_bytes(entries)))
+    chunks.append(archive.close())
+
+    # Каждый файл отдаётся сразу, а не копится до конца архива
+    assert all(chunks[:3])
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as result:
+        assert result.namelist() == ["a.pdf", "b.pdf", "manifest.json"]
+        assert result.read("b.pdf") == b"%PDF-b" * 1000
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in result.infolist())
+        manifest = json.loads(result.read("manifest.json"))
+    assert (manifest["total"], manifest["ok"], manifest["failed"]) == (2, 1, 1)
+
+
+def test_pdf_name_is_safe_and_unique():
+    used = set()
+    assert pdf_name("emea.md", 0, used) == "emea.pdf"
+    assert pdf_name("other/emea.md", 1, used) == "emea-2.pdf"
+    assert pdf_name("emea.markdown", 2, used) == "emea-3.pdf"
+    assert pdf_name("../../etc/passwd", 3, used) == "passwd.pdf"
+    assert pdf_name("отчёт: Q1?.md", 4, used) == "отчёт_ Q1.pdf"
+    assert pdf_name("", 5, used) == "deck-6.pdf"
+    assert pdf_name("...md", 6, used) == "deck-7.pdf"
+    assert len(used) == 7
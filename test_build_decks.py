@@ -0,0 +1,98 @@
+"""Тест: инкрементальная сборка каталога — пропуск по манифесту и удаление PDF."""
+
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import build_decks
+from build_decks import MANIFEST_NAME, build
+from pdf_generator import DEFAULT_TOKENS
+
+
+def _fake_render(calls: list):
+    """build_deck без WeasyPrint: записывает PDF с текстом исходника."""
+    def build_deck(source: str, target: str, tokens: dict) -> dict:
+        calls.append(Path(source).name)
+        text = Path(source).read_text(encoding="utf-8")
+        if "FAIL" in text:
+            raise ValueError("render failed")
+        data = b"%PDF-" + text.encode()
+        Path(target).parent.mkdir(parents=True, exist_ok=True)
+        Path(target).write_bytes(data)
+        return {"slides": 1, "pages": 1, "size": len(data), "timings": {"render": 0.0}}
+    return build_deck
+
+
+def _tree():
+    source, output = Path(tempfile.mkdtemp()), Path(tempfile.mkdtemp())
+    (source / "emea.md").write_text("# EMEA", encoding="utf-8")
+    (source / "regions").mkdir()
+    (source / "regions" / "apac.md").write_text("# APAC", encoding="utf-8")
+    return source, output
+
+
+def _build(source, output, tokens=DEFAULT_TOKENS, **kwargs):
+    return build(source, output, tokens, jobs=1, log=lambda message: None, **kwargs)
+
+
+def test_unchanged_decks_are_skipped(monkeypatch):
+    calls = []
+    monkeypatch.setattr(build_decks, "build_deck", _fake_render(calls))
+    source, output = _tree()
+
+    first = _build(source, output)
+    assert (first["built"], first["skipped"]) == (2, 0)
+    assert (output / "regions" / "apac.pdf").read_bytes() == b"%PDF-# APAC"
+    manifest = json.loads((output / MANIFEST_NAME).read_text(encoding="utf-8"))
+    assert sorted(manifest["decks"]) == ["emea.md", "regions/apac.md"]
+
+    calls.clear()
+    second = _build(source, output)
+    assert (second["built"], second["skipped"]) == (0, 2)
+    assert calls == []
+
+    # Другие токены или --force пересобирают всё
+    assert _build(source, output, tokens={**DEFAULT_TOKENS, "colors": {}})["built"] == 2
+    assert _build(source, output, force=True)["built"] == 2
+
+
+def test_changed_missing_and_removed_decks(monkeypatch):
+    calls = []
+    monkeypatch.setattr(build_decks, "build_deck", _fake_render(calls))
+    source, output = _tree()
+    _build(source, output)
+
+    (source / "emea.md").write_text("# EMEA v2", encoding="utf-8")
+    (source / "regions" / "apac.md").unlink()
+    calls.clear()
+    report = _build(source, output)
+    assert calls == ["emea.md"]
+    assert report["removed"] == ["regions/apac.md"]
+    assert not (output / "regions" / "apac.pdf").exists()
+    assert (output / "emea.pdf").read_bytes() == b"%PDF-# EMEA v2"
+
+    # PDF удалён или подменён вне сборки — дек пересобирается
+    (output / "emea.pdf").write_bytes(b"truncated")
+    calls.clear()
+    assert _build(source, output)["built"] == 1 and calls == ["emea.md"]
+
+
+def test_failed_deck_is_retried_next_time(monkeypatch):
+    calls = []
+    monkeypatch.setattr(build_decks, "build_deck", _fake_render(calls))
+    source, output = _tree()
+    (source / "broken.md").write_text("# FAIL", encoding="utf-8")
+
+    report = _build(source, output)
+    assert (report["built"], report["failed"]) == (2, 1)
+    assert build_decks.main([str(source), str(output)]) == 1
+
+    (source / "broken.md").write_text("# Fixed", encoding="utf-8")
+    calls.clear()
+    report = _build(source, output)
+    assert (report["built"], report["skipped"], report["failed"]) == (1, 2, 0)
+    assert calls == ["broken.md"]
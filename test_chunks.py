@@ -0,0 +1,41 @@
+"""Тест: деление дека на части для режима chunked."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from content_parser import Slide
+from pdf_generator import chunk_count, split_chunks
+
+MIN_CHUNK = 4
+MAX_PARTS = 3
+
+
+def _deck(count: int) -> list[Slide]:
+    return [Slide(title=f"Слайд {i}") for i in range(count)]
+
+
+def test_split_preserves_order_and_minimum_size():
+    for count in range(0, 40):
+        slides = _deck(count)
+        chunks = split_chunks(slides, chunk_count(count, MIN_CHUNK, MAX_PARTS))
+        assert [slide for chunk in chunks for slide in chunk] == slides
+        if count >= MIN_CHUNK:
+            assert min(len(chunk) for chunk in chunks) >= MIN_CHUNK, count
+        else:
+            # Дек меньше минимума — одна часть целиком
+            assert chunks == [slides]
+        # Части почти равны
+        assert max(map(len, chunks)) - min(map(len, chunks)) <= 1
+
+
+def test_chunk_count_matches_split_at_edges():
+    for count in (0, 1, MIN_CHUNK - 1, MIN_CHUNK, MIN_CHUNK + 1, 2 * MIN_CHUNK, 1000):
+        parts = chunk_count(count, MIN_CHUNK, MAX_PARTS)
+        assert 1 <= parts <= MAX_PARTS
+        assert len(split_chunks(_deck(count), parts)) == parts, count
+    assert [chunk_count(n, MIN_CHUNK, MAX_PARTS) for n in (1, 4, 5, 8, 12, 1000)] == [1, 1, 1, 2, 3, 3]
+    # Частей не больше, чем слайдов, даже при минимуме 1
+    assert len(split_chunks(_deck(2), 5)) == 2
+    assert chunk_count(7, 0, 10) == 7
@@ -0,0 +1,56 @@
+"""Тест: потоковый разбор Markdown совпадает с разбором целого текста."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from content_parser import MarkdownStream, iter_slides, parse_markdown
+
+DECK = (
+    "Вступление без заголовка\n"
+    "\n"
+    "# Рынок {accent}EMEA{/accent}\n"
+    "## Итоги года\n"
+    "--- layout: factoid ---\n"
+    "**$120B** — объём рынка — 2024\n"
+    "**35%** — рост\n"
+    "\r\n"
+    "# Выводы\n"
+    "Первый абзац\n"
+    "Последняя строка без перевода"
+)
+
+
+def _chunks(text: str, size: int) -> list[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_any_chunk_size_matches_parse_markdown():
+    expected = parse_markdown(DECK)
+    assert [slide.title for slide in expected] == ["", "Рынок", "Выводы"]
+    assert expected[1].title_accent == "EMEA" and expected[1].layout == "factoid"
+    assert [f.number for f in expected[1].factoids] == ["$120B", "35%"]
+    # Последняя строка без \n не теряется
+    assert expected[2].body == ["Первый абзац", "Последняя строка без перевода"]
+
+    for size in (1, 2, 3, 7, 16, 64, len(DECK)):
+        assert list(iter_slides(_chunks(DECK, size))) == expected, size
+
+
+def test_markers_split_across_chunks():
+    expected = parse_markdown(DECK)
+    for marker in ("# Выводы", "--- layout", "**35%**", "\r\n"):
+        cut = DECK.index(marker) + len(marker) // 2
+        # Кусок кончается посреди строки и посреди маркера
+        assert list(iter_slides([DECK[:cut], DECK[cut:]])) == expected, marker
+
+
+def test_feed_yields_slide_once_next_title_starts():
+    stream = MarkdownStream()
+    assert stream.feed("# Первый\nТекст\n# Вто") == []
+    finished = stream.feed("рой\n")
+    assert [slide.title for slide in finished] == ["Первый"]
+    assert stream.feed("Хвост без перевода") == []
+    assert [slide.body for slide in stream.close()] == [["Хвост без перевода"]]
+    assert stream.close() == []
@@ -0,0 +1,272 @@
+"""Тест: асинхронный клиент Figma против локальной замены API."""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from figma_standin import StandInFigma, make_document
+import figma_tokens
+from figma_tokens import EXTRACTION_TARGETED, FigmaClient, TokenProvider, _parse_tokens, _walk_tree
+
+FILE_KEY = "testfile"
+
+
+def _standin(latency: float = 0.0, extra_frames: int = 200) -> StandInFigma:
+    standin = StandInFigma(latency=latency)
+    standin.files[FILE_KEY] = make_document(version="1", extra_frames=extra_frames)
+    return standin
+
+
+async def _fetch_twice(standin: StandInFigma):
+    client = FigmaClient("token", base_url=standin.base_url)
+    try:
+        start = time.perf_counter()
+        first = await client.fetch_tokens(FILE_KEY)
+        cold = time.perf_counter() - start
+        cold_bytes = client.bytes_downloaded
+
+        start = time.perf_counter()
+        second = await client.fetch_tokens(FILE_KEY)
+        warm = time.perf_counter() - start
+        warm_bytes = client.bytes_downloaded - cold_bytes
+    finally:
+        await client.aclose()
+    return first, second, cold, warm, cold_bytes, warm_bytes
+
+
+def test_tokens_match_parse_tokens():
+    with _standin() as standin:
+        first, *_ = asyncio.run(_fetch_twice(standin))
+    expected = _parse_tokens(standin.files[FILE_KEY], {})
+    assert first == expected
+    assert first["colors"]["accent_primary"] == "#4f9ef8"
+    assert first["typography"]["title_hero"]["size"] == 88
+    assert first["zones"]["title"]["width"] == 886
+
+
+def test_unchanged_version_skips_full_download():
+    with _standin() as standin:
+        first, second, _, _, cold_bytes, warm_bytes = asyncio.run(_fetch_twice(standin))
+        requests = list(standin.requests)
+
+    assert second is first
+    # Холодный: проба + файл + стили; повторный — только проба
+    assert len(requests) == 4
+    assert all("depth=1" in path for path in requests[3:])
+    assert warm_bytes * 10 < cold_bytes
+
+
+def test_changed_version_refetches():
+    async def scenario(standin):
+        client = FigmaClient("token", base_url=standin.base_url)
+        try:
+            await client.fetch_tokens(FILE_KEY)
+            document = make_document(version="2")
+            document["styles"]["S:accent"]["name"] = "Accent/Brand"
+            standin.files[FILE_KEY] = document
+            return await client.fetch_tokens(FILE_KEY)
+        finally:
+            await client.aclose()
+
+    with _standin() as standin:
+        tokens = asyncio.run(scenario(standin))
+    assert "accent_brand" in tokens["colors"]
+
+
+def test_targeted_extraction_matches_full_parse():
+    async def scenario(standin):
+        client = FigmaClient("token", base_url=standin.base_url, extraction=EXTRACTION_TARGETED)
+        try:
+            return await client.fetch_tokens(FILE_KEY), client.bytes_downloaded
+        finally:
+            await client.aclose()
+
+    with _standin(extra_frames=2000) as standin:
+        tokens, downloaded = asyncio.run(scenario(standin))
+        full_size = len(json.dumps(standin.files[FILE_KEY]))
+
+    assert tokens == _parse_tokens(standin.files[FILE_KEY], {})
+    assert downloaded * 3 < full_size
+
+
+def test_walk_tree_handles_deep_nesting():
+    document = make_document()
+    leaf = document["document"]["children"][0]
+    # Цепочка вложенности глубже лимита рекурсии Python
+    for i in range(sys.getrecursionlimit() * 2):
+        frame = {"id": f"d:{i}", "name": f"Group {i}", "type": "FRAME", "children": []}
+        leaf["children"].append(frame)
+        leaf = frame
+    leaf["children"].append({"id": "z", "name": "Zone/Deep", "type": "FRAME",
+                             "absoluteBoundingBox": {"x": 1, "y": 2, "width": 3, "height": 4}})
+
+    tokens = _parse_tokens(document, {})
+    assert tokens["zones"]["deep"] == {"x": 1, "y": 2, "width": 3, "height": 4}
+    assert tokens["colors"]["accent_primary"] == "#4f9ef8"
+
+    # Стили эффектов и сеток значений не получают и не держат остановку
+    document["styles"]["S:shadow"] = {"key": "shadow", "name": "Shadow/Card", "styleType": "EFFECT"}
+    document["styles"]["S:grid"] = {"key": "grid", "name": "Grid/12", "styleType": "GRID"}
+    early = {"colors": {}, "typography": {}, "zones": {}}
+    assert _walk_tree(document["document"], early, document["styles"], stop_when_complete=True)
+    assert early["colors"] == tokens["colors"]
+    assert early["typography"] == tokens["typography"]
+
+
+def test_concurrent_misses_share_one_fetch():
+    async def scenario(standin):
+        provider = TokenProvider("token", base_url=standin.base_url)
+        try:
+            results = await asyncio.gather(*[provider.get(FILE_KEY) for _ in range(10)])
+        finally:
+            await figma_tokens.close_clients()
+        return provider, results
+
+    figma_tokens.invalidate_cache()
+    with _standin(latency=0.05) as standin:
+        provider, results = asyncio.run(scenario(standin))
+        requests = list(standin.requests)
+
+    assert provider.misses == 10 and provider.refreshes == 1
+    assert all(result is results[0] for result in results)
+    assert len(requests) == 3
+
+
+def test_stale_tokens_served_while_refreshing():
+    async def scenario(standin):
+        provider = TokenProvider("token", ttl_seconds=0, base_url=standin.base_url)
+        try:
+            first = await provider.get(FILE_KEY)
+            standin.files[FILE_KEY] = make_document(version="2")
+            standin.files[FILE_KEY]["styles"]["S:accent"]["name"] = "Accent/Brand"
+
+            start = time.perf_counter()
+            stale = await provider.get(FILE_KEY)
+            stale_latency = time.perf_counter() - start
+
+            await provider.refresh(FILE_KEY)
+            fresh = await provider.get(FILE_KEY)
+        finally:
+            await figma_tokens.close_clients()
+        return first, stale, stale_latency, fresh, provider
+
+    figma_tokens.invalidate_cache()
+    with _standin(latency=0.1) as standin:
+        first, stale, stale_latency, fresh, provider = asyncio.run(scenario(standin))
+
+    assert stale is first
+    assert stale_latency < 0.05
+    assert "accent_brand" in fresh["colors"]
+    assert provider.stale_hits == 2
+
+
+def test_revalidate_probes_version_without_dropping_cache():
+    async def scenario(standin):
+        provider = TokenProvider("token", ttl_seconds=3600, base_url=standin.base_url)
+        try:
+            first = await provider.get(FILE_KEY)
+            before = len(standin.requests)
+            same = await provider.refresh(FILE_KEY, revalidate=True)
+            unchanged_requests = standin.requests[before:]
+
+            standin.files[FILE_KEY] = make_document(version="2")
+            standin.files[FILE_KEY]["styles"]["S:accent"]["name"] = "Accent/Brand"
+            pending = provider.refresh(FILE_KEY, revalidate=True)
+            # Пока идёт обновление, запросы получают текущие токены из кеша
+            during = await provider.get(FILE_KEY)
+            fresh = await pending
+        finally:
+            await figma_tokens.close_clients()
+        return first, same, unchanged_requests, during, fresh
+
+    figma_tokens.invalidate_cache()
+    with _standin(latency=0.05) as standin:
+        first, same, unchanged_requests, during, fresh = asyncio.run(scenario(standin))
+
+    assert same is first
+    assert len(unchanged_requests) == 1 and "depth=1" in unchanged_requests[0]
+    assert during is first
+    assert "accent_brand" in fresh["colors"]
+
+
+def test_snapshot_serves_tokens_on_cold_start():
+    snapshot_path = os.path.join(tempfile.mkdtemp(), "tokens.json")
+
+    async def warm(standin):
+        provider = TokenProvider("token", base_url=standin.base_url, snapshot_path=snapshot_path)
+        try:
+            return await provider.get(FILE_KEY)
+        finally:
+            await figma_tokens.close_clients()
+
+    async def cold_start(base_url):
+        # Новый процесс: кеш пуст, Figma недоступна
+        figma_tokens.invalidate_cache()
+        provider = TokenProvider("token", base_url=base_url, snapshot_path=snapshot_path)
+        try:
+            assert provider.load_snapshot(FILE_KEY)
+            tokens = await provider.get(FILE_KEY)
+            await asyncio.sleep(0.2)
+            return tokens, provider
+        finally:
+            await figma_tokens.close_clients()
+
+    figma_tokens.invalidate_cache()
+    with _standin() as standin:
+        fetched = asyncio.run(warm(standin))
+        base_url = standin.base_url
+
+    tokens, provider = asyncio.run(cold_start(base_url))
+    assert tokens == fetched
+    assert provider.stale_hits == 1
+    assert provider.refresh_errors == 1
+    assert provider.last_known(FILE_KEY) == fetched
+
+
+
+def test_old_snapshot_served_stale_and_refreshed_on_probe():
+    snapshot_path = os.path.join(tempfile.mkdtemp(), "tokens.json")
+
+    async def run(standin):
+        figma_tokens.invalidate_cache()
+        provider = TokenProvider("token", ttl_seconds=60, max_stale_seconds=600,
+                                 base_url=standin.base_url, snapshot_path=snapshot_path)
+        try:
+            provider.load_snapshot(FILE_KEY)
+            tokens = await provider.get(FILE_KEY)
+            if provider._inflight:
+                await asyncio.gather(*provider._inflight.values())
+            return tokens, provider
+        finally:
+            await figma_tokens.close_clients()
+
+    with _standin(latency=0.05) as standin:
+        fetched, _ = asyncio.run(run(standin))
+        # Токены неделями не менялись: снапшот старше max_stale
+        snapshot = json.load(open(snapshot_path, encoding="utf-8"))
+        snapshot["saved_at"] = time.time() - 7 * 86400
+        with open(snapshot_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+
+        before = len(standin.requests)
+        tokens, provider = asyncio.run(run(standin))
+        requests = standin.requests[before:]
+
+    assert tokens == fetched
+    assert provider.misses == 0 and provider.stale_hits == 1
+    # Фоновая проба нашла ту же версию — и всё равно обновила снапшот
+    assert len(requests) == 1 and "depth=1" in requests[0]
+    saved_at = json.load(open(snapshot_path, encoding="utf-8"))["saved_at"]
+    assert time.time() - saved_at < 60
+
+
+if __name__ == "__main__":
+    with _standin(latency=0.05, extra_frames=2000) as standin:
+        _, _, cold, warm, cold_bytes, warm_bytes = asyncio.run(_fetch_twice(standin))
+    print(f"Холодная загрузка: {cold * 1000:.0f} мс, {cold_bytes} байт")
+    print(f"Версия не изменилась: {warm * 1000:.0f} мс, {warm_bytes} байт")
@@ -0,0 +1,79 @@
+"""Тест: сессия живого предпросмотра — дифф слайдов и замена устаревших правок."""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from content_parser import parse_markdown
+from preview import PreviewLimitExceeded, PreviewSession
+
+FINGERPRINT = "tokens-v1"
+
+
+def _send_all(session: PreviewSession, keys: list[str], changed: list[int]):
+    for index in changed:
+        session.mark_sent(keys[index])
+
+
+def test_sent_slides_are_reused_and_duplicates_rendered_once():
+    session = PreviewSession(max_markdown_bytes=10_000, max_slides=10)
+    slides = parse_markdown("# A\nтекст\n# B\nтекст\n# A\nтекст")
+    keys, changed = session.diff(slides, FINGERPRINT)
+    # Третий слайд совпадает с первым — рендерится один раз
+    assert keys[0] == keys[2] and changed == [0, 1]
+    _send_all(session, keys, changed)
+
+    edited = parse_markdown("# A\nтекст\n# B\nправка\n# A\nтекст")
+    keys, changed = session.diff(edited, FINGERPRINT)
+    assert changed == [1]
+    assert (session.rendered, session.reused) == (2, 1 + 2)
+
+    # Другие токены — другие ключи: у клиента ничего нет
+    _, changed = session.diff(edited, "tokens-v2")
+    assert changed == [0, 1]
+
+
+def test_known_keys_pruned_to_current_deck():
+    session = PreviewSession(max_markdown_bytes=10_000, max_slides=10)
+    first = parse_markdown("# A\n# B")
+    keys, changed = session.diff(first, FINGERPRINT)
+    _send_all(session, keys, changed)
+
+    session.diff(parse_markdown("# B"), FINGERPRINT)
+    assert session._known == {keys[1]}
+    # Клиент освободил A — при возврате слайд рендерится заново
+    _, changed = session.diff(first, FINGERPRINT)
+    assert changed == [0]
+
+
+def test_limits():
+    session = PreviewSession(max_markdown_bytes=16, max_slides=2)
+    with pytest.raises(PreviewLimitExceeded):
+        session.diff(parse_markdown("# A\n# B\n# C"), FINGERPRINT)
+    session.diff(parse_markdown("# A\n# B"), FINGERPRINT)
+    with pytest.raises(PreviewLimitExceeded):
+        # 9 кириллических символов — 18 байт UTF-8
+        session.submit(1, "# " + "Я" * 9)
+    assert session.latest_seq == 0
+
+
+def test_newer_edit_supersedes_older():
+    async def scenario():
+        session = PreviewSession(max_markdown_bytes=10_000, max_slides=10)
+        session.submit(1, "# A")
+        session.submit(2, "# AB")
+        # Правки не копятся: обрабатывается только последняя
+        assert await session.next_edit() == (2, "# AB")
+        assert not session.superseded(2)
+
+        session.submit(3, "# ABC")
+        assert session.superseded(2)
+        assert not session.superseded(3)
+        assert await session.next_edit() == (3, "# ABC")
+        assert not session.superseded(3)
+
+    asyncio.run(scenario())
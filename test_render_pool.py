@@ -0,0 +1,99 @@
+"""Тест: пул рендера — отказ при полной очереди и пересоздание после падения воркера."""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from render_pool import RenderPool, RenderQueueFull, RenderWorkerCrashed
+
+# Функции для воркеров — на уровне модуля: spawn импортирует их заново
+_warmed = False
+
+
+def _warm_up():
+    global _warmed
+    _warmed = True
+
+
+def _is_warm(value):
+    return value, _warmed
+
+
+def _slow(value, seconds=0.3):
+    time.sleep(seconds)
+    return value
+
+
+def _crash():
+    os._exit(1)
+
+
+def test_full_queue_rejects_without_waiting():
+    async def scenario(pool):
+        running = [asyncio.create_task(pool.run(_slow, n)) for n in range(2)]
+        await asyncio.sleep(0)
+        assert pool.pending == 2 and pool.queued == 1 and pool.free_slots == 0
+
+        start = time.perf_counter()
+        with pytest.raises(RenderQueueFull):
+            await pool.run(_slow, 9)
+        assert time.perf_counter() - start < 0.1
+
+        # Продолжение принятого запроса лимит не проверяет
+        continued = await pool.run(_slow, 3, 0, check_limit=False)
+        return await asyncio.gather(*running), continued
+
+    pool = RenderPool(workers=1, queue_size=1)
+    try:
+        results, continued = asyncio.run(scenario(pool))
+    finally:
+        pool.shutdown()
+    assert results == [0, 1] and continued == 3
+    assert pool.pending == 0
+
+
+def test_crashed_worker_restarts_pool_with_initializer():
+    async def scenario(pool):
+        assert await pool.run(_is_warm, 1) == (1, True)
+        with pytest.raises(RenderWorkerCrashed):
+            await pool.run(_crash)
+        # Новый пул прогрет так же, как первый
+        return await pool.run(_is_warm, 2)
+
+    pool = RenderPool(workers=1, queue_size=0, initializer=_warm_up)
+    try:
+        assert asyncio.run(scenario(pool)) == (2, True)
+    finally:
+        pool.shutdown()
+    assert pool.restarts == 1 and pool.pending == 0
+
+
+def test_cancelled_render_result_goes_to_on_orphan():
+    orphans = []
+    handed_over = threading.Event()
+
+    def on_orphan(result):
+        orphans.append(result)
+        handed_over.set()
+
+    async def scenario(pool):
+        task = asyncio.create_task(pool.run(_slow, "orphan", 0.3, on_orphan=on_orphan))
+        await asyncio.sleep(0.1)
+        # Задача уже передана воркеру: отменить её нельзя, только дождаться результата
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    pool = RenderPool(workers=1, queue_size=0)
+    try:
+        asyncio.run(scenario(pool))
+        assert handed_over.wait(5)
+    finally:
+        pool.shutdown()
+    assert orphans == ["orphan"]
@@ -0,0 +1,110 @@
+"""Тест: кеш готовых PDF — вытеснение по бюджету в памяти и на диске."""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import result_cache
+from content_parser import parse_markdown
+from result_cache import ResultCache, cache_key, stable_hash
+
+
+def _pdf(tag: str, size: int = 100) -> bytes:
+    return (b"%PDF-" + tag.encode()).ljust(size, b"0")
+
+
+def test_stable_hash_ignores_key_order():
+    assert stable_hash({"a": 1, "b": [1, 2]}) == stable_hash({"b": [1, 2], "a": 1})
+    slides = parse_markdown("# Title\n\nBody")
+    assert cache_key(slides, {"colors": {}}, "v1") != cache_key(slides, {"colors": {}}, "v2")
+
+
+def test_memory_evicts_least_recently_used():
+    cache = ResultCache(memory_max_bytes=250)
+    cache.put("a", _pdf("a"))
+    cache.put("b", _pdf("b"))
+    assert cache.get("a") == _pdf("a")  # a становится самым свежим
+    cache.put("c", _pdf("c"))
+
+    assert cache.get("b") is None
+    assert cache.get("a") == _pdf("a") and cache.get("c") == _pdf("c")
+    assert cache.stats()["memory_bytes"] == 200
+    # Больше бюджета целиком — не кешируется и ничего не вытесняет
+    cache.put("huge", _pdf("huge", 300))
+    assert cache.get("huge") is None and cache.contains("a")
+
+
+def test_disk_evicts_oldest_used_and_refills_memory():
+    disk_dir = tempfile.mkdtemp()
+    cache = ResultCache(memory_max_bytes=0, disk_dir=disk_dir, disk_max_bytes=250)
+    for tag in ("a", "b"):
+        cache.put(tag, _pdf(tag))
+    # mtime — метка использования: a прочитан позже b
+    past = time.time() - 60
+    os.utime(os.path.join(disk_dir, "b.pdf"), (past, past))
+    os.utime(os.path.join(disk_dir, "a.pdf"), (past - 60, past - 60))
+    assert cache.get("a") == _pdf("a")
+    cache.put("c", _pdf("c"))
+
+    assert sorted(os.listdir(disk_dir)) == ["a.pdf", "c.pdf"]
+    assert cache.stats()["disk_bytes"] == 200
+    assert cache.disk_hits == 1
+
+    # Дисковый уровень переживает процесс; попадание поднимается в память
+    reopened = ResultCache(memory_max_bytes=1000, disk_dir=disk_dir, disk_max_bytes=250)
+    assert reopened.stats()["disk_bytes"] == 200
+    assert reopened.get("c") == _pdf("c") and reopened.get("c") == _pdf("c")
+    assert reopened.disk_hits == 1 and reopened.memory_hits == 1
+
+
+def test_put_file_copies_into_disk_tier():
+    disk_dir = tempfile.mkdtemp()
+    source = os.path.join(tempfile.mkdtemp(), "rendered.pdf")
+    with open(source, "wb") as f:
+        f.write(_pdf("file", 120))
+
+    cache = ResultCache(memory_max_bytes=0, disk_dir=disk_dir, disk_max_bytes=1000)
+    cache.put_file("k", source)
+    assert cache.contains("k") and not cache.contains("other")
+    assert cache.get("k") == _pdf("file", 120)
+
+
+def test_slow_disk_write_does_not_block_memory_hits(monkeypatch):
+    source = os.path.join(tempfile.mkdtemp(), "rendered.pdf")
+    with open(source, "wb") as f:
+        f.write(_pdf("file", 120))
+    disk_dir = tempfile.mkdtemp()
+    cache = ResultCache(memory_max_bytes=1000, disk_dir=disk_dir, disk_max_bytes=150)
+    cache.put("hot", _pdf("hot"))
+    past = time.time() - 60
+    os.utime(os.path.join(disk_dir, "hot.pdf"), (past, past))
+
+    copying, release = threading.Event(), threading.Event()
+    copy_into = result_cache._copy_into
+
+    def slow_copy(path, target):
+        copying.set()
+        release.wait(5)
+        copy_into(path, target)
+
+    monkeypatch.setattr(result_cache, "_copy_into", slow_copy)
+    writer = threading.Thread(target=cache.put_file, args=("k", source))
+    writer.start()
+    assert copying.wait(5)
+
+    hits = []
+    reader = threading.Thread(target=lambda: hits.append(cache.get("hot")))
+    reader.start()
+    reader.join(1)
+    release.set()
+    writer.join(5)
+
+    assert hits == [_pdf("hot")]
+    # Запись и вытеснение после неё отработали вне блокировки
+    assert os.listdir(disk_dir) == ["k.pdf"]
+    assert cache.stats()["disk_bytes"] == 120
+
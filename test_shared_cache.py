@@ -0,0 +1,123 @@
+"""Тест: общий кеш воркеров в SQLite — PDF, вытеснение и аренды."""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import shared_cache as shared_cache_module
+from result_cache import ResultCache
+from shared_cache import NO_LEASE, SharedCache
+
+
+def _cache(max_result_bytes: int = 1000) -> SharedCache:
+    return SharedCache(os.path.join(tempfile.mkdtemp(), "shared.db"), max_result_bytes)
+
+
+def _pdf(tag: str, size: int = 100) -> bytes:
+    return (b"%PDF-" + tag.encode()).ljust(size, b"0")
+
+
+def test_tokens_roundtrip():
+    cache = _cache()
+    cache.put_tokens("file", {"colors": {"accent": "#fff"}}, version="7", saved_at=123.0)
+    assert cache.get_tokens("file") == {"tokens": {"colors": {"accent": "#fff"}}, "version": "7", "saved_at": 123.0}
+    cache.drop_tokens("file")
+    assert cache.get_tokens("file") is None
+
+
+def test_result_file_is_written_all_or_nothing(monkeypatch):
+    cache = _cache()
+    path = os.path.join(tempfile.mkdtemp(), "deck.pdf")
+    with open(path, "wb") as f:
+        f.write(_pdf("deck", 300))
+
+    # Файл вырос между stat и копированием: blob переполняется, транзакция откатывается
+    monkeypatch.setattr(shared_cache_module.os.path, "getsize", lambda _: 200)
+    cache.put_result_file("deck", path)
+    assert not cache.has_result("deck")
+    assert cache.stats()["result_items"] == 0
+
+    # Файл уменьшился: вместо PDF с нулями в хвосте не сохраняется ничего
+    monkeypatch.setattr(shared_cache_module.os.path, "getsize", lambda _: 400)
+    cache.put_result_file("deck", path)
+    assert not cache.has_result("deck")
+
+    monkeypatch.undo()
+    cache.put_result_file("deck", path)
+    assert cache.get_result("deck") == _pdf("deck", 300)
+    # Больше бюджета — не хранится
+    cache.put_result("huge", _pdf("huge", 2000))
+    assert not cache.has_result("huge")
+
+
+def test_results_evicted_by_last_use():
+    cache = _cache(max_result_bytes=250)
+    cache.put_result("a", _pdf("a"))
+    time.sleep(0.01)
+    cache.put_result("b", _pdf("b"))
+    time.sleep(0.01)
+    assert cache.get_result("a") == _pdf("a")  # a использован позже b
+    time.sleep(0.01)
+    cache.put_result("c", _pdf("c"))
+
+    assert not cache.has_result("b")
+    assert cache.has_result("a") and cache.has_result("c")
+    assert cache.stats()["result_bytes"] == 200
+
+
+def test_expired_lease_is_taken_over():
+    cache = _cache()
+    first = cache.acquire("render:x", ttl=0.05)
+    assert first is not None
+    assert cache.acquire("render:x", ttl=0.05) is None
+    # Опросы того же ожидания — одно ожидание
+    assert cache.acquire("render:x", ttl=0.05, retry=True) is None
+    assert cache.lease_waits == 1
+
+    time.sleep(0.1)
+    second = cache.acquire("render:x", ttl=60)
+    assert second is not None and second != first
+    # Упавший владелец не снимает чужую аренду
+    cache.release("render:x", first)
+    assert cache.acquire("render:x", ttl=60) is None
+    cache.release("render:x", second)
+    assert cache.acquire("render:x", ttl=60) is not None
+    assert cache.lease_waits == 2
+
+
+def test_broken_database_is_a_miss():
+    cache = _cache()
+    cache.put_result("k", _pdf("k"))
+    cache.close()
+    # Файл базы испорчен: каждая операция — промах, а не исключение
+    for path in (cache.path, cache.path.with_name(cache.path.name + "-wal")):
+        if path.exists():
+            path.write_bytes(b"not a database" * 100)
+
+    assert cache.get_result("k") is None and not cache.has_result("k")
+    assert cache.get_tokens("file") is None
+    cache.put_result("k2", _pdf("k2"))
+    cache.put_tokens("file", {})
+    owner = cache.acquire("render:x", ttl=60)
+    assert owner == NO_LEASE
+    cache.release("render:x", owner)
+    assert cache.stats()["result_items"] == 0
+    assert ResultCache(0, shared=cache).get("k") is None
+
+
+def test_result_cache_reads_shared_level_once():
+    shared = _cache()
+    ResultCache(0, shared=shared).put("k", _pdf("k"))
+
+    # Другой воркер: своего уровня в памяти нет, PDF приходит из общего кеша
+    other = ResultCache(memory_max_bytes=1000, shared=shared)
+    assert other.get("k") == _pdf("k")
+    assert other.get("k") == _pdf("k")
+    stats = other.stats()
+    assert (stats["shared_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 0)
+
+    # Без бюджета PDF общий кеш в ResultCache не подключается
+    assert ResultCache(0, shared=_cache(0)).shared is None
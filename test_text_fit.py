@@ -0,0 +1,79 @@
+"""Тест: выбор лейаута и перенос текста на слайды-продолжения без WeasyPrint."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from content_parser import Factoid, Slide, parse_markdown
+from text_fit import choose_layout, fit_slides, fits
+
+WORDS = "liquidity settlement corridor remittance treasury reserves banking infrastructure".split()
+
+
+def _text(words: int, offset: int = 0) -> str:
+    return " ".join(WORDS[(offset + i) % len(WORDS)] for i in range(words))
+
+
+def _words(slides) -> list[str]:
+    return [word for slide in slides for line in slide.body for word in line.split()]
+
+
+def test_choose_layout_by_content():
+    assert choose_layout(Slide(title="Short title")) == "title_hero"
+    assert choose_layout(Slide(title="Title", body=["Body"])) == "default"
+    assert choose_layout(Slide(title="Title", factoids=[Factoid("$1B", "Label")])) == "factoid"
+    # Заголовок, который не помещается в hero, получает default
+    assert choose_layout(Slide(title=_text(120))) == "default"
+
+
+def test_short_slides_returned_as_is():
+    slides = parse_markdown("# Title\n## Subtitle\n\nOne paragraph.\n\n# Hero")
+    fitted = fit_slides(slides)
+    assert len(fitted) == 2
+    assert all(after is before for after, before in zip(fitted, slides))
+
+
+def test_long_hero_title_becomes_default():
+    slide = Slide(title=_text(120), layout="title_hero")
+    assert not fits(slide, "title_hero", {})
+    [fitted] = fit_slides([slide])
+    assert fitted.layout == "default"
+
+
+def test_overflowing_body_moves_to_continuations():
+    body = [_text(40, offset=i) for i in range(60)]
+    slide = Slide(title="Market overview", subtitle="Where the money goes", body=body,
+                  factoids=[Factoid("$120B", "Trade finance")], layout="factoid")
+    fitted = fit_slides([slide])
+
+    assert len(fitted) > 1
+    assert fitted[0].subtitle and fitted[0].factoids and fitted[0].layout == "factoid"
+    for continuation in fitted[1:]:
+        assert continuation.title == slide.title
+        assert not continuation.subtitle and not continuation.factoids
+        assert continuation.layout == "default"
+    assert all(part.body and fits(part, part.layout, {}) for part in fitted)
+    assert _words(fitted) == _words([slide])
+
+
+def test_long_paragraph_split_by_lines():
+    slide = Slide(title="One paragraph", body=[_text(2500)], layout="default")
+    fitted = fit_slides([slide])
+    assert len(fitted) > 1
+    assert all(fits(part, part.layout, {}) for part in fitted)
+    assert _words(fitted) == _words([slide])
+
+
+def test_header_filling_first_slide_keeps_it_without_body():
+    # Субтайтл занимает весь первый слайд — body целиком уходит на продолжение
+    slide = Slide(title="Title", subtitle=_text(450), body=["Short body."], layout="default")
+    first, *rest = fit_slides([slide])
+    assert first.subtitle == slide.subtitle and first.body == []
+    assert rest and _words(rest) == ["Short", "body."]
+
+
+def test_title_alone_overflowing_is_not_split():
+    # Продолжения с тем же заголовком переполнились бы так же — пустой слайд не нужен
+    slide = Slide(title=_text(150), body=[_text(30), _text(30, offset=3)], layout="default")
+    assert fit_slides([slide]) == [slide]
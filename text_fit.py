@@ -0,0 +1,353 @@
+"""
+Оценка размеров текста без раскладки WeasyPrint.
+
+Ширина строки считается по таблицам ширин глифов Inter (hmtx шрифтов
+из static/fonts, по одной таблице на начертание на процесс), перенос —
+жадно по словам, как у браузера. Этого хватает, чтобы до рендера понять,
+помещается ли слайд в свой лейаут: выбрать лейаут и перенести лишние
+абзацы на слайд-продолжение, а не обрезать их .slide { overflow: hidden }.
+
+Геометрия ниже повторяет templates/layouts/*.html и templates/slide.css —
+при правке шаблонов её нужно держать в согласии.
+"""
+
+import logging
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
+
+from fonts import FONTS_DIR, PDF_FORMATS, discover_faces
+
+if TYPE_CHECKING:
+    from content_parser import Slide
+
+logger = logging.getLogger(__name__)
+
+SLIDE_HEIGHT = 1080
+CONTENT_TOP = 64
+# Верх футера: bottom 24px, линия 1px + отступ 10px + строка 24px
+FOOTER_TOP = SLIDE_HEIGHT - 24 - 35
+# Зазор между текстом и футером или факт-карточками
+GAP = 24
+
+TITLE_WIDTH = 886
+HERO_WIDTH = 1400
+HERO_TITLE_SCALE = 1.2
+HERO_SUBTITLE = {"size": 30, "width": 900, "margin": 40}
+
+# Лейаут → ширины и отступы субтайтла, блока body и абзацев
+TEXT_BOXES = {
+    "default": {"subtitle": 680, "subtitle_margin": 36, "body": 800, "body_margin": 32, "paragraph": 12},
+    "factoid": {"subtitle": 680, "subtitle_margin": 36, "body": 680, "body_margin": 24, "paragraph": 10},
+}
+
+# Факт-карточки: ряд шириной 1920 - 2 * 64, зазор 28, padding 28/32, рамка 3
+FACTOIDS_BOTTOM = SLIDE_HEIGHT - 100
+FACTOIDS_WIDTH = 1920 - 2 * 64
+FACTOIDS_GAP = 28
+FACTOID_PADDING = (28, 32)
+FACTOID_BORDER = 3
+FACTOID_LABEL_MARGIN = 14
+FACTOID_SUBLABEL = {"size": 15, "margin": 6}
+
+# line-height: normal у Inter
+NORMAL_LINE_HEIGHT = 1.21
+
+# Дефолты стилей — те же, что в templates/slide.css
+DEFAULT_TYPOGRAPHY = {
+    "title_hero": {"size": 88, "weight": 800, "line_height": 1.1, "letter_spacing": -2.5},
+    "subtitle": {"size": 26, "weight": 400, "line_height": 1.55, "letter_spacing": 0},
+    "body": {"size": 16, "weight": 400, "line_height": 1.4, "letter_spacing": 0},
+    "factoid_number": {"size": 72, "weight": 800, "line_height": 1.0, "letter_spacing": -2},
+    "factoid_label": {"size": 18, "weight": 500, "line_height": NORMAL_LINE_HEIGHT, "letter_spacing": 0},
+}
+
+# Приблизительные ширины Inter в долях em — если файлов шрифта нет
+_NARROW = set("il|!.,:;'`ƒ")
+_SEMI_NARROW = set("fjrtI()[]{}/\\\"-")
+_WIDE = set("mwMW@%")
+APPROX_ADVANCE = {"space": 0.28, "narrow": 0.26, "semi_narrow": 0.36, "wide": 0.86,
+                  "upper": 0.68, "digit": 0.62, "other": 0.56}
+
+
+@dataclass(frozen=True)
+class TextStyle:
+    size: float
+    weight: int = 400
+    line_height: float = NORMAL_LINE_HEIGHT
+    letter_spacing: float = 0.0
+
+    @property
+    def line_px(self) -> float:
+        return self.size * self.line_height
+
+
+def text_style(typography: dict, name: str, **overrides) -> TextStyle:
+    """Стиль из typography-токенов с дефолтами slide.css."""
+    values = {**DEFAULT_TYPOGRAPHY[name], **(typography or {}).get(name, {}), **overrides}
+    return TextStyle(
+        size=float(values.get("size") or DEFAULT_TYPOGRAPHY[name]["size"]),
+        weight=int(values.get("weight") or 400),
+        line_height=float(values.get("line_height") or NORMAL_LINE_HEIGHT),
+        letter_spacing=float(values.get("letter_spacing") or 0),
+    )
+
+
+@lru_cache(maxsize=16)
+def _advance_table(weight: int) -> Optional[tuple[dict, float]]:
+    """
+    Ширины глифов ближайшего по весу начертания: code point → доля em
+    и ширина по умолчанию. None — файлов шрифта нет или их не прочитать.
+    """
+    faces = [face for face in discover_faces(FONTS_DIR, PDF_FORMATS) if face.style == "normal"]
+    if not faces:
+        return None
+    face = min(faces, key=lambda face: abs(face.weight - weight))
+    try:
+        from fontTools.ttLib import TTFont
+
+        font = TTFont(str(face.path), lazy=True)
+        units = font["head"].unitsPerEm
+        metrics = font["hmtx"].metrics
+        advances = {
+            codepoint: metrics[glyph][0] / units
+            for codepoint, glyph in font.getBestCmap().items()
+            if glyph in metrics
+        }
+        default = metrics.get(".notdef", (units // 2, 0))[0] / units
+        font.close()
+    except Exception as exc:
+        logger.warning("Не удалось прочитать ширины глифов %s: %s", face.path.name, exc)
+        return None
+    return advances, default
+
+
+def _approx_advance(char: str) -> float:
+    if char.isspace():
+        return APPROX_ADVANCE["space"]
+    if char in _NARROW:
+        return APPROX_ADVANCE["narrow"]
+    if char in _SEMI_NARROW:
+        return APPROX_ADVANCE["semi_narrow"]
+    if char in _WIDE:
+        return APPROX_ADVANCE["wide"]
+    if char.isdigit():
+        return APPROX_ADVANCE["digit"]
+    if char.isupper():
+        return APPROX_ADVANCE["upper"]
+    return APPROX_ADVANCE["other"]
+
+
+@lru_cache(maxsize=65536)
+def _em_width(text: str, weight: int) -> float:
+    """Ширина текста в em без letter-spacing."""
+    table = _advance_table(weight)
+    if table is None:
+        # Жирные начертания Inter примерно на 5% шире обычного
+        scale = 1 + max(0, weight - 400) / 400 * 0.05
+        return sum(_approx_advance(char) for char in text) * scale
+    advances, default = table
+    return sum(advances.get(ord(char), default) for char in text)
+
+
+def text_width(text: str, style: TextStyle) -> float:
+    """Ширина строки в px."""
+    return _em_width(text, style.weight) * style.size + style.letter_spacing * len(text)
+
+
+def wrap(text: str, width: float, style: TextStyle) -> list[list[str]]:
+    """Жадный перенос по пробелам: строки как списки слов."""
+    space = text_width(" ", style)
+    lines: list[list[str]] = []
+    current: list[str] = []
+    current_width = 0.0
+    for word in text.split():
+        word_width = text_width(word, style)
+        if current and current_width + space + word_width > width:
+            lines.append(current)
+            current, current_width = [], 0.0
+        current_width += (space if current else 0.0) + word_width
+        current.append(word)
+    if current:
+        lines.append(current)
+    return lines
+
+
+def line_count(text: str, width: float, style: TextStyle) -> int:
+    return len(wrap(text, width, style))
+
+
+def block_height(text: str, width: float, style: TextStyle) -> float:
+    return line_count(text, width, style) * style.line_px
+
+
+def title_height(slide: "Slide", width: float, style: TextStyle) -> float:
+    """Заголовок; с акцентом шаблон делит его <br> на три части."""
+    if slide.title_accent and slide.title_accent in slide.title:
+        before, after = slide.title.split(slide.title_accent, 1)
+        parts = [before, slide.title_accent, after]
+    elif slide.title_accent:
+        parts = [slide.title, slide.title_accent]
+    else:
+        parts = [slide.title]
+    lines = sum(line_count(part, width, style) for part in parts if part.strip())
+    return max(1, lines) * style.line_px
+
+
+def factoids_height(slide: "Slide", typography: dict) -> float:
+    """Высота ряда факт-карточек: самая высокая карточка."""
+    if not slide.factoids:
+        return 0.0
+    count = len(slide.factoids)
+    inner = (FACTOIDS_WIDTH - FACTOIDS_GAP * (count - 1)) / count - 2 * FACTOID_PADDING[1]
+    number = text_style(typography, "factoid_number", line_height=1.0)
+    label = text_style(typography, "factoid_label", line_height=NORMAL_LINE_HEIGHT)
+    sublabel = TextStyle(size=FACTOID_SUBLABEL["size"])
+    tallest = 0.0
+    for factoid in slide.factoids:
+        height = block_height(factoid.number, inner, number)
+        height += FACTOID_LABEL_MARGIN + block_height(factoid.label, inner, label)
+        if factoid.sublabel:
+            height += FACTOID_SUBLABEL["margin"] + block_height(factoid.sublabel, inner, sublabel)
+        tallest = max(tallest, height)
+    return tallest + 2 * FACTOID_PADDING[0] + FACTOID_BORDER
+
+
+def available_height(slide: "Slide", layout: str, typography: dict) -> float:
+    """Высота под заголовок, субтайтл и body в лейауте."""
+    if layout == "factoid" and slide.factoids:
+        return FACTOIDS_BOTTOM - factoids_height(slide, typography) - GAP - CONTENT_TOP
+    return FOOTER_TOP - GAP - CONTENT_TOP
+
+
+def header_height(slide: "Slide", layout: str, typography: dict) -> float:
+    """Заголовок и субтайтл в лейауте default или factoid."""
+    box = TEXT_BOXES[layout]
+    height = title_height(slide, TITLE_WIDTH, text_style(typography, "title_hero"))
+    if slide.subtitle:
+        height += box["subtitle_margin"] + block_height(
+            slide.subtitle, box["subtitle"], text_style(typography, "subtitle")
+        )
+    return height
+
+
+def body_heights(body: list[str], layout: str, typography: dict) -> list[float]:
+    """Высота каждого абзаца body вместе с отступом снизу."""
+    box = TEXT_BOXES[layout]
+    style = text_style(typography, "body")
+    return [block_height(line, box["body"], style) + box["paragraph"] for line in body]
+
+
+def content_height(slide: "Slide", layout: str, typography: dict) -> float:
+    """Высота текстового блока слайда в лейауте."""
+    if layout == "title_hero":
+        height = title_height(
+            slide, HERO_WIDTH, text_style(typography, "title_hero", size=_hero_title_size(typography))
+        )
+        if slide.subtitle:
+            style = text_style(typography, "subtitle", size=HERO_SUBTITLE["size"])
+            height += HERO_SUBTITLE["margin"] + block_height(slide.subtitle, HERO_SUBTITLE["width"], style)
+        return height
+    height = header_height(slide, layout, typography)
+    if slide.body:
+        height += TEXT_BOXES[layout]["body_margin"] + sum(body_heights(slide.body, layout, typography))
+    return height
+
+
+def _hero_title_size(typography: dict) -> float:
+    return text_style(typography, "title_hero").size * HERO_TITLE_SCALE
+
+
+def fits(slide: "Slide", layout: str, typography: dict) -> bool:
+    """Помещается ли текст слайда в лейаут без обрезки."""
+    if layout == "title_hero":
+        # Блок центрируется по вертикали: половина высоты вверх и вниз от центра
+        limit = 2 * min(SLIDE_HEIGHT / 2 - CONTENT_TOP, FOOTER_TOP - GAP - SLIDE_HEIGHT / 2)
+        return content_height(slide, layout, typography) <= limit
+    if layout not in TEXT_BOXES:
+        return True
+    return content_height(slide, layout, typography) <= available_height(slide, layout, typography)
+
+
+def choose_layout(slide: "Slide", typography: Optional[dict] = None) -> str:
+    """Лейаут по содержимому и по тому, помещается ли текст."""
+    typography = typography or {}
+    if slide.factoids:
+        return "factoid"
+    if not slide.body and not slide.subtitle and fits(slide, "title_hero", typography):
+        return "title_hero"
+    # Длинный текст не помещается нигде целиком — его разносит fit_slides
+    return "default"
+
+
+def fit_slides(slides: list["Slide"], typography: Optional[dict] = None) -> list["Slide"]:
+    """
+    Слайды, которые поместятся в свои лейауты: hero с длинным заголовком
+    становится default, а body, вылезающий за слайд, переносится
+    на слайды-продолжения с тем же заголовком. Неизменённые слайды
+    возвращаются как есть.
+    """
+    typography = typography or {}
+    fitted = []
+    for slide in slides:
+        if slide.layout == "title_hero" and not fits(slide, "title_hero", typography):
+            slide = replace(slide, layout="default")
+        if slide.layout in TEXT_BOXES and slide.body and not fits(slide, slide.layout, typography):
+            fitted.extend(_split(slide, typography))
+        else:
+            fitted.append(slide)
+    return fitted
+
+
+def _split(slide: "Slide", typography: dict) -> list["Slide"]:
+    """
+    Делит body по абзацам (и по строкам длинного абзаца) на несколько слайдов.
+    Если даже один заголовок не оставляет места под строку body, слайд
+    остаётся как есть: продолжения с тем же заголовком переполнились бы так же.
+    """
+    continuation = replace(slide, subtitle="", factoids=[], layout="default", body=[])
+    if not _take_body(slide.body, "default", typography, _body_room(continuation, typography))[0]:
+        return [slide]
+
+    parts = []
+    body = list(slide.body)
+    current = slide
+    while True:
+        taken, rest = _take_body(body, current.layout, typography, _body_room(current, typography))
+        if not taken and parts:
+            # Страховка: продолжение всегда что-то берёт, иначе не делим дальше
+            taken, rest = body, []
+        # Первый слайд может остаться без body: субтайтл и карточки заняли всё место
+        parts.append(replace(current, body=taken))
+        if not rest:
+            return parts
+        body = rest
+        current = continuation
+
+
+def _body_room(slide: "Slide", typography: dict) -> float:
+    """Сколько px остаётся под body после заголовка и субтайтла."""
+    layout = slide.layout
+    room = available_height(slide, layout, typography) - header_height(slide, layout, typography)
+    return room - TEXT_BOXES[layout]["body_margin"]
+
+
+def _take_body(body: list[str], layout: str, typography: dict, room: float) -> tuple[list[str], list[str]]:
+    """Абзацы, которые помещаются в room px, и остаток."""
+    box = TEXT_BOXES[layout]
+    style = text_style(typography, "body")
+    taken = []
+    for index, (line, height) in enumerate(zip(body, body_heights(body, layout, typography))):
+        if height <= room:
+            taken.append(line)
+            room -= height
+            continue
+        # Абзац не помещается целиком: переносим его хвост по границе строки
+        lines = wrap(line, box["body"], style)
+        keep = int((room - box["paragraph"]) // style.line_px)
+        if keep > 0:
+            taken.append(" ".join(word for words in lines[:keep] for word in words))
+            tail = " ".join(word for words in lines[keep:] for word in words)
+            return taken, [tail] + body[index + 1:]
+        return taken, body[index:]
+    return taken, []